@@ -0,0 +1,404 @@
+"""Deterministic local stand-ins for OpenRouter, Upstash, MongoDB and Galaxy.
+
+Every fake can add a fixed latency per call, so benchmarks measure our
+own overhead plus a controlled, reproducible amount of "network" time.
+"""
+
+import asyncio
+import copy
+import itertools
+import random
+import threading
+import time
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from pymongo.errors import DuplicateKeyError
+
+from src.lib.vectorstore import VectorBackend
+
+WORDS = (
+    "align reads genome assembly variant calling quality control trim adapters "
+    "fastq bam vcf rna seq differential expression peak chip atac methylation "
+    "annotation gene protein blast phylogeny metagenomics taxonomy coverage "
+    "mapping deduplicate sort index merge filter convert count features "
+    "cluster visualize plot report statistics single cell spatial proteomics"
+).split()
+
+OWNERS = ("devteam", "iuc", "bgruening", "galaxyp", "nml", "lparsons")
+
+
+def synthetic_catalog(n: int, seed: int = 0, versions: int = 2) -> List[dict]:
+    """A reproducible Galaxy-like catalog of `n` tools, with several versions each."""
+    rng = random.Random(seed)
+    tools = []
+    for i in range(n):
+        owner = OWNERS[i % len(OWNERS)]
+        repo = f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{i // versions}"
+        version = f"{1 + (i % versions)}.{rng.randint(0, 9)}.0"
+        tools.append({
+            "id": f"toolshed.g2.bx.psu.edu/repos/{owner}/{repo}/{repo}/{version}",
+            "name": repo.replace("_", " ").title(),
+            "description": " ".join(rng.choice(WORDS) for _ in range(12)),
+            "version": version,
+            "owner": owner,
+            "panel_section_name": rng.choice(WORDS).title(),
+            "help": " ".join(rng.choice(WORDS) for _ in range(60)),
+            "edam_operations": [f"operation_{rng.randint(1000, 3999)}"],
+            "input_formats": [rng.choice(("fastq", "bam", "vcf", "fasta", "tabular"))],
+        })
+    return tools
+
+
+def iter_catalog(tools: List[dict], page_size: int = 100,
+                 page_latency: float = 0.0) -> Iterator[dict]:
+    """Yield `tools` the way the Galaxy client pages them, with a delay per page."""
+    for start in range(0, len(tools), page_size):
+        time.sleep(page_latency)
+        yield from tools[start:start + page_size]
+
+
+class ScriptedLLM:
+    """Chat model stand-in following a fixed script.
+
+    With tools bound it answers a user message with one `tool_search_tool`
+    call on that message, and a tool result with a final answer. Without
+    tools (summaries) it replies with a short text. `latency` is paid per
+    call, `token_latency` per streamed chunk.
+    """
+
+    def __init__(self, tools: bool = True, latency: float = 0.0,
+                 token_latency: float = 0.0, answer_words: int = 40):
+        self.tools = tools
+        self.latency = latency
+        self.token_latency = token_latency
+        self.answer_words = answer_words
+        self.calls = 0
+        self._ids = itertools.count()
+
+    def _reply(self, messages: List[Any]) -> AIMessage:
+        self.calls += 1
+        last = messages[-1]
+        if not self.tools:
+            return AIMessage(content="The user is looking for Galaxy tools.")
+        if isinstance(last, ToolMessage):
+            words = itertools.islice(itertools.cycle(WORDS), self.answer_words)
+            return AIMessage(content="I recommend: " + " ".join(words))
+        return AIMessage(content="", tool_calls=[{
+            "name": "tool_search_tool",
+            "args": {"query": str(last.content), "top_k": 5},
+            "id": f"call_{next(self._ids)}",
+        }])
+
+    def _chunks(self, reply: AIMessage) -> Iterator[AIMessageChunk]:
+        if reply.tool_calls:
+            call = reply.tool_calls[0]
+            yield AIMessageChunk(content="", tool_call_chunks=[{
+                "name": call["name"], "args": '{"query": ' + repr(call["args"]["query"]).replace("'", '"'),
+                "id": call["id"], "index": 0}])
+            yield AIMessageChunk(content="", tool_call_chunks=[{
+                "name": None, "args": ', "top_k": 5}', "id": None, "index": 0}])
+            return
+        for word in str(reply.content).split(" "):
+            yield AIMessageChunk(content=word + " ")
+
+    def invoke(self, messages, **kwargs) -> AIMessage:
+        time.sleep(self.latency)
+        return self._reply(messages)
+
+    async def ainvoke(self, messages, **kwargs) -> AIMessage:
+        await asyncio.sleep(self.latency)
+        return self._reply(messages)
+
+    def stream(self, messages, **kwargs):
+        time.sleep(self.latency)
+        for chunk in self._chunks(self._reply(messages)):
+            time.sleep(self.token_latency)
+            yield chunk
+
+    async def astream(self, messages, **kwargs):
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(self._reply(messages)):
+            await asyncio.sleep(self.token_latency)
+            yield chunk
+
+
+def scripted_llm_factory(latency: float = 0.0, token_latency: float = 0.0):
+    """A `set_llm_factory` factory handing out ScriptedLLMs."""
+    def factory(model, temperature, tools):
+        return ScriptedLLM(tools=bool(tools), latency=latency, token_latency=token_latency)
+    return factory
+
+
+class LatencyBackend(VectorBackend):
+    """Wraps a vector backend (normally a LocalBackend) and adds per-call latency."""
+
+    name = "latency"
+
+    def __init__(self, inner: VectorBackend, query_latency: float = 0.0,
+                 upsert_latency: float = 0.0):
+        self.inner = inner
+        self.query_latency = query_latency
+        self.upsert_latency = upsert_latency
+
+    def upsert(self, vectors):
+        time.sleep(self.upsert_latency)
+        self.inner.upsert(vectors)
+
+    def query(self, data, top_k=5):
+        time.sleep(self.query_latency)
+        return self.inner.query(data, top_k=top_k)
+
+    async def aquery(self, data, top_k=5):
+        await asyncio.sleep(self.query_latency)
+        return self.inner.query(data, top_k=top_k)
+
+    def query_many(self, queries, top_k=5):
+        time.sleep(self.query_latency)
+        return self.inner.query_many(queries, top_k=top_k)
+
+    def delete(self, ids):
+        time.sleep(self.upsert_latency)
+        self.inner.delete(ids)
+
+    def flush(self):
+        self.inner.flush()
+
+
+# --- In-memory MongoDB -----------------------------------------------------
+
+def _get_path(doc: dict, path: str):
+    value: Any = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None, False
+        value = value[part]
+    return value, True
+
+
+def _matches(doc: dict, query: dict) -> bool:
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(_matches(doc, q) for q in cond):
+                return False
+            continue
+        value, present = _get_path(doc, key)
+        if isinstance(cond, dict) and any(k.startswith("$") for k in cond):
+            for op, arg in cond.items():
+                if op == "$exists":
+                    ok = present == bool(arg)
+                elif not present or value is None:
+                    ok = False
+                elif op == "$lt":
+                    ok = value < arg
+                elif op == "$gt":
+                    ok = value > arg
+                elif op == "$gte":
+                    ok = value >= arg
+                else:
+                    raise NotImplementedError(f"query operator {op}")
+                if not ok:
+                    return False
+        elif value != cond or not present:
+            return False
+    return True
+
+
+def _apply_update(doc: dict, update: dict, inserted: bool):
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not inserted:
+            continue
+        for key, arg in fields.items():
+            if op in ("$set", "$setOnInsert"):
+                doc[key] = arg
+            elif op == "$inc":
+                doc[key] = doc.get(key, 0) + arg
+            elif op == "$push":
+                doc.setdefault(key, []).append(arg)
+            elif op == "$max":
+                doc[key] = arg if key not in doc or doc[key] is None else max(doc[key], arg)
+            else:
+                raise NotImplementedError(f"update operator {op}")
+
+
+def _project(doc: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    out: dict = {}
+    if projection.get("_id", 1) and "_id" in doc:
+        out["_id"] = doc["_id"]
+    for path, include in projection.items():
+        if path == "_id" or not include:
+            continue
+        head, _, rest = path.partition(".")
+        if head not in doc:
+            continue
+        value = doc[head]
+        if not rest:
+            out[head] = copy.deepcopy(value)
+        elif isinstance(value, list):
+            # `messages.id`: keep that field of every array element
+            target = out.setdefault(head, [{} for _ in value])
+            for item, projected in zip(value, target):
+                if isinstance(item, dict) and rest in item:
+                    projected[rest] = copy.deepcopy(item[rest])
+        elif isinstance(value, dict) and rest in value:
+            out.setdefault(head, {})[rest] = copy.deepcopy(value[rest])
+    return out
+
+
+class FakeCursor:
+    def __init__(self, docs: List[dict], projection: Optional[dict] = None):
+        # Sorted on the full documents and projected last, like MongoDB
+        self._docs = docs
+        self._projection = projection
+        self._limit = 0
+
+    def sort(self, key, direction=None):
+        keys = key if isinstance(key, list) else [(key, direction or 1)]
+        for field, order in reversed(keys):
+            self._docs.sort(key=lambda d: _get_path(d, field)[0], reverse=order < 0)
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def batch_size(self, n: int):
+        return self
+
+    def _items(self) -> List[dict]:
+        docs = self._docs[:self._limit] if self._limit else self._docs
+        return [_project(d, self._projection) for d in docs]
+
+    def __iter__(self):
+        return iter(self._items())
+
+    async def to_list(self, length=None):
+        return self._items()
+
+    async def __aiter__(self):
+        for item in self._items():
+            yield item
+
+
+class FakeCollection:
+    """The subset of pymongo's Collection API used by this repo, in memory."""
+
+    def __init__(self, name: str, latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self._docs: List[dict] = []
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def create_index(self, *args, **kwargs):
+        return "fake_index"
+
+    def count_documents(self, query: dict) -> int:
+        with self._lock:
+            return sum(1 for d in self._docs if _matches(d, query))
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None):
+        self._wait()
+        with self._lock:
+            return FakeCursor([d for d in self._docs if _matches(d, query or {})],
+                              projection)
+
+    def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None):
+        self._wait()
+        with self._lock:
+            for doc in self._docs:
+                if _matches(doc, query or {}):
+                    return _project(doc, projection)
+        return None
+
+    def _update_one(self, query: dict, update: dict, upsert: bool):
+        for doc in self._docs:
+            if _matches(doc, query):
+                _apply_update(doc, update, inserted=False)
+                return
+        if not upsert:
+            return
+        doc = {k: v for k, v in query.items()
+               if not k.startswith("$") and not isinstance(v, dict)}
+        if "_id" in doc and any(d.get("_id") == doc["_id"] for d in self._docs):
+            raise DuplicateKeyError(f"duplicate _id {doc['_id']!r}")
+        doc.setdefault("_id", f"{self.name}-{len(self._docs)}-{time.perf_counter_ns()}")
+        _apply_update(doc, update, inserted=True)
+        self._docs.append(doc)
+
+    def update_one(self, query: dict, update: dict, upsert: bool = False):
+        self._wait()
+        with self._lock:
+            self._update_one(query, update, upsert)
+
+    def replace_one(self, query: dict, replacement: dict, upsert: bool = False):
+        self._wait()
+        with self._lock:
+            self._docs = [d for d in self._docs if not _matches(d, query)]
+            doc = {"_id": query.get("_id"), **replacement}
+            self._docs.append(doc)
+
+    def bulk_write(self, requests: list, ordered: bool = True):
+        self._wait()
+        with self._lock:
+            for request in requests:
+                # pymongo's UpdateOne keeps its arguments in these attributes
+                self._update_one(request._filter, request._doc, request._upsert)
+
+    def insert_many(self, docs: List[dict], ordered: bool = True):
+        self._wait()
+        with self._lock:
+            self._docs.extend(copy.deepcopy(d) for d in docs)
+
+    def delete_many(self, query: dict):
+        with self._lock:
+            self._docs = [d for d in self._docs if not _matches(d, query)]
+
+    def rename(self, new_name: str):
+        self.name = new_name
+
+
+class FakeDatabase:
+    """Dict of FakeCollections, created on first access like a Mongo database."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._collections: dict = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = FakeCollection(name, latency=self.latency)
+            return self._collections[name]
+
+
+class FakeAsyncCollection:
+    """Async view over a FakeCollection, mirroring pymongo's AsyncCollection."""
+
+    def __init__(self, collection: FakeCollection):
+        self._collection = collection
+        self.name = collection.name
+
+    def find(self, query=None, projection=None):
+        # AsyncCollection.find is not a coroutine; its cursor's to_list is
+        return self._collection.find(query, projection)
+
+    async def find_one(self, query=None, projection=None):
+        return self._collection.find_one(query, projection)
+
+    async def update_one(self, query, update, upsert=False):
+        return self._collection.update_one(query, update, upsert=upsert)
+
+
+class FakeAsyncDatabase:
+    def __init__(self, database: FakeDatabase):
+        self._database = database
+
+    def __getitem__(self, name: str) -> FakeAsyncCollection:
+        return FakeAsyncCollection(self._database[name])
@@ -0,0 +1,332 @@
+"""Offline end-to-end benchmarks.
+
+Runs the real chat, search, ingest and history code against the local
+stand-ins in src/bench/fakes.py, so no API key or network is needed and
+runs are comparable across machines:
+
+    python -m src.bench.run --tools 2000 --turns 50 --output bench-results.json
+
+Scenarios: ingest throughput, chat turn latency (p50/p95/p99, time to
+first token), concurrent async turns, history load time as conversations
+grow, and peak memory per scenario. Results are written as JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import List, Sequence
+from uuid import uuid4
+
+
+def configure_environment(workdir: str, query_cache: str = "off"):
+    """Point every on-disk index and cache at `workdir`.
+
+    Must run before anything from src is imported, since src/config/env.py
+    reads the environment once at import time.
+    """
+    os.environ.update({
+        "VECTOR_BACKEND": "local",
+        "LOCAL_INDEX_DIR": os.path.join(workdir, "local_index"),
+        "LOCAL_EMBEDDER": "hashing",
+        "INGEST_MANIFEST_PATH": os.path.join(workdir, "manifest.json"),
+        "LEXICAL_INDEX_PATH": os.path.join(workdir, "lexical_index.json.gz"),
+        "INDEX_STATE_BACKEND": "file",
+        "INDEX_STATE_PATH": os.path.join(workdir, "index_state.json"),
+        "QUERY_CACHE": query_cache,
+        "RESPONSE_CACHE": "off",
+    })
+
+
+def percentiles(values: Sequence[float]) -> dict:
+    """p50/p95/p99, mean and max of `values` (seconds), in milliseconds."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def _at(q: float) -> float:
+        # Linear interpolation between closest ranks
+        pos = (len(ordered) - 1) * q
+        low = int(pos)
+        high = min(low + 1, len(ordered) - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+    return {
+        "count": len(ordered),
+        "p50_ms": round(_at(0.50) * 1000, 3),
+        "p95_ms": round(_at(0.95) * 1000, 3),
+        "p99_ms": round(_at(0.99) * 1000, 3),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def rss_peak_mib() -> float:
+    """Peak resident set size of this process so far (Linux reports KiB, macOS bytes)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 3)
+
+
+def measure_memory(trace: bool, fn, *args, **kwargs):
+    """Run `fn` and return (result, memory stats).
+
+    The process RSS high-water mark is always recorded. With `trace`, the
+    peak of Python allocations during `fn` is measured with tracemalloc
+    too; that slows allocation-heavy code several times, so timings of a
+    traced run are not comparable with untraced ones.
+    """
+    if trace:
+        tracemalloc.start()
+    try:
+        result = fn(*args, **kwargs)
+        stats = {"rss_peak_mib": rss_peak_mib()}
+        if trace:
+            _, peak = tracemalloc.get_traced_memory()
+            stats["python_peak_mib"] = round(peak / (1024 * 1024), 3)
+    finally:
+        if trace:
+            tracemalloc.stop()
+    return result, stats
+
+
+def user_queries(n: int, seed: int) -> List[str]:
+    from src.bench.fakes import WORDS
+
+    rng = random.Random(seed)
+    return [f"I need a tool to {' '.join(rng.sample(WORDS, 3))} for {rng.choice(WORDS)} data"
+            for _ in range(n)]
+
+
+def bench_ingest(tools: List[dict], page_latency: float) -> dict:
+    from src.bench.fakes import iter_catalog
+    from src.rag.ingest import sync_tools
+
+    started = time.perf_counter()
+    report = sync_tools(iter_catalog(tools, page_latency=page_latency), force=True)
+    elapsed = time.perf_counter() - started
+    return {
+        "tools": len(tools),
+        "upserted": report["upserted"],
+        "failed": report["failed"],
+        "seconds": round(elapsed, 3),
+        "tools_per_second": round(report["upserted"] / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+def bench_turns(queries: List[str], stream: bool, turns_per_session: int) -> dict:
+    from src.chatbot import run_chat
+    from src.utils.memory import flush_messages
+
+    latencies: List[float] = []
+    first_tokens: List[float] = []
+    session_id = None
+    for i, query in enumerate(queries):
+        if i % turns_per_session == 0:
+            session_id = f"bench-{uuid4().hex}"
+        started = time.perf_counter()
+        first: List[float] = []
+
+        def on_event(event):
+            if event.get("type") == "token" and not first:
+                first.append(time.perf_counter() - started)
+
+        run_chat(query, on_event=on_event, session_id=session_id,
+                 stream=stream, use_cache=False)
+        latencies.append(time.perf_counter() - started)
+        first_tokens.extend(first)
+    flush_messages()
+
+    result = {"stream": stream, "latency": percentiles(latencies)}
+    if first_tokens:
+        result["time_to_first_token"] = percentiles(first_tokens)
+    return result
+
+
+def bench_concurrency(queries: List[str], concurrency: int) -> dict:
+    from src.chatbot import arun_chat
+
+    async def _session(batch: List[str]) -> List[float]:
+        session_id = f"bench-async-{uuid4().hex}"
+        latencies = []
+        for query in batch:
+            started = time.perf_counter()
+            await arun_chat(query, session_id=session_id, use_cache=False)
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    async def _run():
+        batches = [queries[i::concurrency] for i in range(concurrency)]
+        return await asyncio.gather(*(_session(b) for b in batches if b))
+
+    started = time.perf_counter()
+    per_session = asyncio.run(_run())
+    elapsed = time.perf_counter() - started
+    latencies = [s for session in per_session for s in session]
+    return {
+        "concurrency": concurrency,
+        "turns": len(latencies),
+        "seconds": round(elapsed, 3),
+        "turns_per_second": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency": percentiles(latencies),
+    }
+
+
+def _history_docs(conversation_id: str, n: int) -> List[dict]:
+    start = datetime.now(timezone.utc) - timedelta(seconds=n)
+    return [{
+        "id": str(uuid4()),
+        "conversation_id": conversation_id,
+        "role": "user" if i % 2 == 0 else "assistant",
+        "content": f"message {i} about aligning reads and calling variants",
+        "created_at": start + timedelta(seconds=i),
+    } for i in range(n)]
+
+
+def bench_history(sizes: Sequence[int], repeats: int) -> List[dict]:
+    from src.utils.memory import _write_messages, get_messages
+
+    results = []
+    for size in sizes:
+        conversation_id = f"bench-history-{size}"
+        docs = _history_docs(conversation_id, size)
+        started = time.perf_counter()
+        for i in range(0, size, 1000):
+            _write_messages(docs[i:i + 1000])
+        write_seconds = time.perf_counter() - started
+
+        timings = []
+        loaded = 0
+        for _ in range(repeats):
+            started = time.perf_counter()
+            loaded = len(get_messages(conversation_id))
+            timings.append(time.perf_counter() - started)
+        results.append({
+            "messages": size,
+            "loaded": loaded,
+            "write_seconds": round(write_seconds, 3),
+            "load": percentiles(timings),
+        })
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(args: argparse.Namespace) -> dict:
+    from src.bench.fakes import (
+        FakeAsyncDatabase,
+        FakeDatabase,
+        LatencyBackend,
+        scripted_llm_factory,
+        synthetic_catalog,
+    )
+    from src.lib.db import set_database
+    from src.lib.llm import set_llm_factory
+    from src.lib.local_index import LocalBackend
+    from src.lib.vectorstore import set_backend
+
+    database = FakeDatabase(latency=args.db_latency)
+    set_database(database, FakeAsyncDatabase(database))
+    set_llm_factory(scripted_llm_factory(args.llm_latency, args.token_latency))
+    set_backend(LatencyBackend(LocalBackend(), query_latency=args.vector_latency,
+                               upsert_latency=args.vector_latency))
+
+    tools = synthetic_catalog(args.tools, seed=args.seed)
+    queries = user_queries(args.turns, seed=args.seed)
+    results: dict = {"memory": {}}
+
+    print(f"Ingesting {len(tools)} synthetic tools...")
+    results["ingest"], results["memory"]["ingest"] = measure_memory(
+        args.trace_memory, bench_ingest, tools, args.galaxy_latency)
+
+    print(f"Running {len(queries)} chat turns...")
+    results["turns"], results["memory"]["turns"] = measure_memory(
+        args.trace_memory, bench_turns, queries, not args.no_stream, args.turns_per_session)
+
+    if args.concurrency > 1:
+        print(f"Running {len(queries)} async turns, {args.concurrency} at a time...")
+        results["concurrency"], results["memory"]["concurrency"] = measure_memory(
+            args.trace_memory, bench_concurrency, queries, args.concurrency)
+
+    print(f"Loading history of {', '.join(map(str, args.history_sizes))} messages...")
+    results["history"], results["memory"]["history"] = measure_memory(
+        args.trace_memory, bench_history, args.history_sizes, args.history_repeats)
+
+    set_backend(None)
+    set_llm_factory(None)
+    set_database(None)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks with local stand-ins for every external service")
+    parser.add_argument("--output", default="bench-results.json",
+                        help="Where to write the JSON results")
+    parser.add_argument("--tools", type=int, default=2000, help="Synthetic catalog size")
+    parser.add_argument("--turns", type=int, default=50, help="Chat turns to time")
+    parser.add_argument("--turns-per-session", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Concurrent async sessions (1 skips that scenario)")
+    parser.add_argument("--history-sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--history-repeats", type=int, default=20)
+    parser.add_argument("--no-stream", action="store_true",
+                        help="Time turns without token streaming")
+    parser.add_argument("--query-cache", default="off", choices=("off", "local"),
+                        help="Search result cache during the run")
+    parser.add_argument("--llm-latency", type=float, default=0.0,
+                        help="Seconds per scripted LLM call")
+    parser.add_argument("--token-latency", type=float, default=0.0,
+                        help="Seconds per streamed chunk")
+    parser.add_argument("--vector-latency", type=float, default=0.0,
+                        help="Seconds per vector query or upsert batch")
+    parser.add_argument("--db-latency", type=float, default=0.0,
+                        help="Seconds per database call")
+    parser.add_argument("--galaxy-latency", type=float, default=0.0,
+                        help="Seconds per page of the Galaxy catalog")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Also record peak Python allocations per scenario (slows the run)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        configure_environment(workdir, query_cache=args.query_cache)
+        started = time.perf_counter()
+        results = run(args)
+        total = time.perf_counter() - started
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    report = {
+        "metadata": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seconds": round(total, 3),
+            "config": config,
+        },
+        **results,
+    }
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    print(json.dumps({k: report[k] for k in ("turns", "ingest")}, indent=2))
+    print(f"Results written to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
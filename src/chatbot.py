@@ -1,14 +1,39 @@
+import asyncio
+import itertools
 import json
+import logging
 import os
 from typing import Any, List, Sequence, Tuple, Callable, Optional
-from src.config.env import OPEN_ROUTER_API, OPEN_ROUTER_API_KEY
 
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage, message_chunk_to_message
 from langchain.tools import tool
-from langchain_openai import ChatOpenAI
 
+from src.config.env import PREFETCH
+from src.lib.llm import get_llm
+from src.rag.index_state import get_generation
+from src.rag.response_cache import get_response_cache
+from src.tools.toolSearch import (
+    atool_search_payload,
+    build_payload,
+    encode_payload,
+    tool_search_payload,
+)
 from src.tools.toolSearch import tool_search as py_tool_search
-from src.utils.memory import add_messages, get_messages, save_tool_response
+from src.tools.prefetch import Prefetch
+from src.utils.context import abuild_context, build_context, count_tokens
+from src.utils.memory import (
+    DEFAULT_CONVERSATION_ID,
+    aadd_messages,
+    add_messages,
+    ahas_history,
+    asave_tool_response,
+    has_history,
+    request_flush,
+    save_tool_response,
+)
+from src.utils.tracing import span, trace
+
+logger = logging.getLogger(__name__)
 
 SYSTEM_PROMPT = (
     "You are a helpful assistant. Use the `tool_search` function when you need "
@@ -23,24 +48,27 @@ def tool_search_tool(query: str, top_k: int = 5) -> str:
     return py_tool_search(query=query, top_k=top_k)
 
 
-def build_llm(model: str | None = None, temperature: float = 0) -> ChatOpenAI:
-    model_name = model or os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-    return ChatOpenAI(
-        model=model_name,
-        temperature=temperature,
-        api_key=OPEN_ROUTER_API_KEY,
-        base_url=OPEN_ROUTER_API,
-    ).bind_tools([tool_search_tool])
+def resolve_model(model: str | None = None) -> str:
+    return model or os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
 
-def docs_to_lc_messages(docs: Sequence[dict]) -> List[BaseMessage]:
+def build_llm(model: str | None = None, temperature: float = 0):
+    """Return the shared tool-bound client for this model (see src/lib/llm.py)."""
+    return get_llm(resolve_model(model), temperature, tools=[tool_search_tool])
+
+
+def docs_to_lc_messages(docs: Sequence[dict], summary: Optional[str] = None) -> List[BaseMessage]:
     """Simplify history: include only system/user/assistant content.
 
     Previously persisted tool metadata may not match the exact schema expected
     by the client, and is not needed for future turns. Skipping tool messages
     avoids invalid payloads (e.g., unexpected fields like 'index').
+    The rolling summary of older turns, if any, follows the system prompt.
     """
     messages: List[BaseMessage] = [SystemMessage(content=SYSTEM_PROMPT)]
+    if summary:
+        messages.append(SystemMessage(
+            content=f"Summary of the earlier conversation:\n{summary}"))
     for doc in docs:
         role = doc.get("role")
         if role == "user":
@@ -112,126 +140,478 @@ def parse_arguments(raw_args: Any) -> dict:
     return {}
 
 
-def dispatch_tool_call(tc: Any) -> Tuple[str, str]:
+SEARCH_TOOL_NAMES = {"tool_search", "search_tools", "tool_search_tool"}
+
+
+def tool_call_parts(tc: Any) -> Tuple[str, str, dict]:
+    """Return (id, tool name, parsed args) for a tool call in any supported shape."""
+    tc_id = getattr(tc, "id", None)
     name = getattr(tc, "name", None)
     args = getattr(tc, "args", None)
     function = getattr(tc, "function", None)
 
     if isinstance(tc, dict):
+        tc_id = tc_id or tc.get("id")
         function = function or tc.get("function")
         name = name or tc.get("name") or (function or {}).get("name")
         args = args or tc.get("args") or (function or {}).get("arguments")
 
-    parsed_args = parse_arguments(args)
-    tool_name = name or "tool_search"
+    return str(tc_id or ""), name or "tool_search", parse_arguments(args)
+
+
+def _search_args(parsed_args: dict) -> Tuple[str, int]:
+    query = parsed_args.get("query") or parsed_args.get("q") or ""
+    top_k = parsed_args.get("top_k") or parsed_args.get("k") or 5
+    try:
+        top_k = int(top_k)
+    except (TypeError, ValueError):
+        top_k = 5
+    return query, top_k
+
+
+def _dispatch(tc: Any, prefetch: Optional[Prefetch] = None) -> Tuple[str, str, Optional[dict]]:
+    """Run a tool call; returns (tool name, text for the model, structured data or None)."""
+    _, tool_name, parsed_args = tool_call_parts(tc)
+
+    if tool_name in SEARCH_TOOL_NAMES:
+        query, top_k = _search_args(parsed_args)
+        hits = prefetch.take(query, top_k) if prefetch is not None else None
+        if hits is not None:
+            payload = build_payload(hits)
+        else:
+            payload = tool_search_payload(query=query, top_k=top_k)
+        return tool_name, encode_payload(payload), payload
+
+    return tool_name, f"Unsupported tool: {tool_name}", None
+
+
+async def _adispatch(tc: Any, prefetch: Optional[Prefetch] = None) -> Tuple[str, str, Optional[dict]]:
+    """Async version of _dispatch."""
+    _, tool_name, parsed_args = tool_call_parts(tc)
+
+    if tool_name in SEARCH_TOOL_NAMES:
+        query, top_k = _search_args(parsed_args)
+        hits = await prefetch.atake(query, top_k) if prefetch is not None else None
+        if hits is not None:
+            payload = build_payload(hits)
+        else:
+            payload = await atool_search_payload(query=query, top_k=top_k)
+        return tool_name, encode_payload(payload), payload
+
+    return tool_name, f"Unsupported tool: {tool_name}", None
+
+
+def _tool_failure(tool_name: str, error: Exception) -> Tuple[str, str, None]:
+    # Like an unsupported tool, a failing one is reported to the model,
+    # which can retry or answer without it
+    logger.warning("Tool %s failed: %s", tool_name, error)
+    return tool_name, f"Tool {tool_name} failed: {error}", None
 
-    if tool_name in {"tool_search", "search_tools", "tool_search_tool"}:
-        query = parsed_args.get("query") or parsed_args.get("q") or ""
-        top_k = parsed_args.get("top_k") or parsed_args.get("k") or 5
+
+def _traced_dispatch(tc: Any, tool_name: str,
+                     prefetch: Optional[Prefetch] = None) -> Tuple[str, str, Optional[dict]]:
+    """_dispatch in a `tool` span; an Exception becomes a failure message for the model."""
+    with span("tool", tool=tool_name) as s:
+        try:
+            output = _dispatch(tc, prefetch)
+        except Exception as e:
+            s.error = type(e).__name__
+            output = _tool_failure(tool_name, e)
+        s.set(**_result_size(output[1], output[2]))
+    return output
+
+
+async def _atraced_dispatch(tc: Any, tool_name: str,
+                            prefetch: Optional[Prefetch] = None) -> Tuple[str, str, Optional[dict]]:
+    """Async _traced_dispatch; cancellation is not an Exception, so it still propagates."""
+    # One span per call, so concurrent calls are timed separately
+    with span("tool", tool=tool_name) as s:
         try:
-            top_k = int(top_k)
-        except (TypeError, ValueError):
-            top_k = 5
-        result = py_tool_search(query=query, top_k=top_k)
-        return tool_name, result
+            output = await _adispatch(tc, prefetch)
+        except Exception as e:
+            s.error = type(e).__name__
+            output = _tool_failure(tool_name, e)
+        s.set(**_result_size(output[1], output[2]))
+    return output
 
-    return tool_name, f"Unsupported tool: {tool_name}"
 
+def dispatch_tool_call(tc: Any, prefetch: Optional[Prefetch] = None) -> Tuple[str, str]:
+    tool_name, text, _ = _dispatch(tc, prefetch)
+    return tool_name, text
 
-def store_ai_message(ai_msg: AIMessage):
-    add_messages(
-        [
-            {
-                "role": "assistant",
-                "content": ai_msg.content or "",
-                "tool_calls": serialize_tool_calls(ai_msg.tool_calls),
-                "refusal": getattr(ai_msg, "refusal", None),
-                "reasoning": getattr(ai_msg, "reasoning", None),
-            }
-        ]
-    )
+
+async def adispatch_tool_call(tc: Any, prefetch: Optional[Prefetch] = None) -> Tuple[str, str]:
+    """Async version of dispatch_tool_call."""
+    tool_name, text, _ = await _adispatch(tc, prefetch)
+    return tool_name, text
+
+
+def _llm_usage(messages: Sequence[BaseMessage], ai_msg: AIMessage) -> dict:
+    """Token counts of one model step: reported by the provider, else estimated."""
+    usage = getattr(ai_msg, "usage_metadata", None) or {}
+    if usage.get("input_tokens") is not None:
+        input_tokens = usage["input_tokens"]
+        output_tokens = usage.get("output_tokens") or 0
+    else:
+        input_tokens = sum(count_tokens(str(m.content)) for m in messages)
+        output_tokens = count_tokens(str(ai_msg.content)) if ai_msg.content else 0
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+            "tool_calls": len(ai_msg.tool_calls or [])}
+
+
+def _result_size(tool_output: str, data: Optional[dict]) -> dict:
+    return {"result_chars": len(tool_output or ""),
+            "hits": len((data or {}).get("rows") or [])}
+
+
+def _ai_message_doc(ai_msg: AIMessage) -> dict:
+    return {
+        "role": "assistant",
+        "content": ai_msg.content or "",
+        "tool_calls": serialize_tool_calls(ai_msg.tool_calls),
+        "refusal": getattr(ai_msg, "refusal", None),
+        "reasoning": getattr(ai_msg, "reasoning", None),
+    }
+
+
+def store_ai_message(ai_msg: AIMessage, conversation_id: str = DEFAULT_CONVERSATION_ID):
+    add_messages([_ai_message_doc(ai_msg)], conversation_id=conversation_id)
+
+
+def _emit(on_event: Optional[Callable[[dict], None]], event: dict):
+    """Send an event to the UI; a failing callback must never break the turn."""
+    if on_event:
+        try:
+            on_event(event)
+        except Exception:
+            logger.exception("on_event callback failed on a %r event", event.get("type"))
+
+
+def _tool_call_event(tc_id: str, tool_name: str, parsed_args: dict) -> dict:
+    return {
+        "type": "tool_call",
+        "name": tool_name,
+        "args": parsed_args,
+        "id": tc_id,
+    }
+
+
+def _tool_result_event(tc_id: str, tool_name: str, tool_output: str,
+                       data: Optional[dict] = None) -> dict:
+    # `data` is the structured result, so the UI never has to parse `result`
+    return {
+        "type": "tool_result",
+        "name": tool_name,
+        "result": tool_output,
+        "data": data,
+        "id": tc_id,
+    }
+
+
+def _chunk_text(chunk: Any) -> str:
+    content = getattr(chunk, "content", "")
+    if isinstance(content, str):
+        return content
+    # Some providers send a list of content blocks
+    return "".join(part.get("text", "") for part in content
+                   if isinstance(part, dict))
+
+
+def _merge_chunk(ai_msg: Any, chunk: Any, on_event: Optional[Callable[[dict], None]]):
+    """Add a streamed chunk to the message so far and emit its text as a token event.
+
+    AIMessageChunk addition concatenates content and merges tool-call
+    fragments by index, so the merged message carries complete tool calls.
+    """
+    text = _chunk_text(chunk)
+    if text:
+        _emit(on_event, {"type": "token", "text": text})
+    return chunk if ai_msg is None else ai_msg + chunk
+
+
+def _finish_stream(ai_msg: Any) -> AIMessage:
+    if ai_msg is None:
+        return AIMessage(content="")
+    return message_chunk_to_message(ai_msg)
+
+
+def stream_step(llm: Any, messages: List[BaseMessage],
+                on_event: Optional[Callable[[dict], None]] = None) -> AIMessage:
+    """Run one model step with `llm.stream`, emitting `token` events as text arrives."""
+    ai_msg = None
+    for chunk in llm.stream(messages):
+        ai_msg = _merge_chunk(ai_msg, chunk, on_event)
+    return _finish_stream(ai_msg)
+
+
+async def astream_step(llm: Any, messages: List[BaseMessage],
+                       on_event: Optional[Callable[[dict], None]] = None) -> AIMessage:
+    """Async version of stream_step, using `llm.astream`."""
+    ai_msg = None
+    async for chunk in llm.astream(messages):
+        ai_msg = _merge_chunk(ai_msg, chunk, on_event)
+    return _finish_stream(ai_msg)
+
+
+def _cached_reply(cached: dict, on_event: Optional[Callable[[dict], None]],
+                  stream: bool) -> List[dict]:
+    """Replay a response-cache hit to the UI; returns the messages to persist."""
+    for result in cached["tool_results"]:
+        _emit(on_event, _tool_call_event(
+            result["id"], result["name"], result["args"]))
+        _emit(on_event, {**_tool_result_event(
+            result["id"], result["name"], result["result"], result.get("data")),
+            "cached": True})
+    if stream and cached["answer"]:
+        _emit(on_event, {"type": "token", "text": cached["answer"]})
+    return [{"role": "assistant", "content": cached["answer"]}]
+
+
+def _tool_result_record(tc_id: str, tool_name: str, parsed_args: dict, tool_output: str,
+                        data: Optional[dict]) -> dict:
+    return {"id": tc_id, "name": tool_name, "args": parsed_args,
+            "result": str(tool_output), "data": data}
 
 
 def run_chat(
     user_input: str,
     model: str | None = None,
     on_event: Optional[Callable[[dict], None]] = None,
+    session_id: str = DEFAULT_CONVERSATION_ID,
+    stream: bool = False,
+    prefetch: bool = PREFETCH,
+    use_cache: bool = True,
 ) -> str:
-    # Persist user message first so it becomes part of history
-    add_messages([
-        {
-            "role": "user",
-            "content": user_input,
-        }
-    ])
+    """Run one chat turn and return the final reply.
+
+    With `stream=True` the reply is generated with `llm.stream` and each
+    text fragment is sent to `on_event` as a `token` event while it is
+    generated. The complete message is persisted once the step finishes.
+
+    With `prefetch=True` a tool search on the user's message starts right
+    away, while the first model call runs. A similar enough `tool_search`
+    call by the model then reuses its result (see src/tools/prefetch.py).
 
-    history_docs = get_messages()
-    messages = docs_to_lc_messages(history_docs)
+    When RESPONSE_CACHE is on, the opening question of a conversation that
+    is close enough to one answered before by the same model is answered
+    from the semantic response cache without calling the model (see
+    src/rag/response_cache.py); `use_cache=False` bypasses it.
 
-    llm = build_llm(model=model)
+    Each stage is timed (see src/utils/tracing.py) and reported to
+    `on_event` as a `span` event when it ends.
+    """
+    with trace("turn", on_event, model=resolve_model(model), stream=stream) as turn:
+        cache = get_response_cache() if use_cache else None
+        cached = None
+        if cache is not None and cache.cacheable(user_input):
+            with span("cache_lookup"):
+                # A follow-up depends on earlier turns; only opening questions are cached
+                if has_history(session_id):
+                    cache = None
+                else:
+                    vector = cache.embed(user_input)
+                    generation = get_generation()
+                    cached = cache.lookup(vector, resolve_model(model), generation)
+            if cached is not None:
+                turn.set(cached=True)
+                with span("store"):
+                    add_messages([{"role": "user", "content": user_input}]
+                                 + _cached_reply(cached, on_event, stream),
+                                 conversation_id=session_id)
+                request_flush()
+                return cached["answer"]
+        else:
+            cache = None
 
-    while True:
-        ai_msg: AIMessage = llm.invoke(messages)
-        store_ai_message(ai_msg)
+        speculative = Prefetch(user_input) if prefetch else None
+        tool_results: List[dict] = []
+        try:
+            reply = _chat_turn(user_input, model, on_event, session_id, stream,
+                               speculative, tool_results)
+        finally:
+            if speculative is not None:
+                speculative.close()
+        if cache is not None and reply:
+            cache.store(user_input, vector, resolve_model(model), generation,
+                        reply, tool_results)
+        turn.set(tool_calls=len(tool_results), reply_chars=len(reply))
+        return reply
+
+
+def _chat_turn(user_input, model, on_event, session_id, stream, speculative,
+               tool_results) -> str:
+    # Persist user message first so it becomes part of history
+    with span("store"):
+        add_messages([
+            {
+                "role": "user",
+                "content": user_input,
+            }
+        ], conversation_id=session_id)
+
+    with span("context") as s:
+        summary, history_docs = build_context(session_id)
+        s.set(messages=len(history_docs))
+    messages = docs_to_lc_messages(history_docs, summary)
+
+    with span("build_llm"):
+        llm = build_llm(model=model)
+
+    for step in itertools.count():
+        with span("llm", step=step) as s:
+            if stream:
+                ai_msg = stream_step(llm, messages, on_event)
+            else:
+                ai_msg: AIMessage = llm.invoke(messages)
+            s.set(**_llm_usage(messages, ai_msg))
+        with span("store"):
+            store_ai_message(ai_msg, conversation_id=session_id)
         messages.append(ai_msg)
 
         if not ai_msg.tool_calls:
+            # Turn is over: let the write-behind buffer persist it
+            request_flush()
             return ai_msg.content or ""
 
         for tc in ai_msg.tool_calls:
-            tc_id = getattr(tc, "id", None)
-            if tc_id is None and isinstance(tc, dict):
-                tc_id = tc.get("id")
+            tc_id, tool_name, parsed_args = tool_call_parts(tc)
 
             # Preview tool call event to UI
-            name = getattr(tc, "name", None)
-            args = getattr(tc, "args", None)
-            function = getattr(tc, "function", None)
-            if isinstance(tc, dict):
-                function = function or tc.get("function")
-                name = name or tc.get("name") or (function or {}).get("name")
-                args = args or tc.get("args") or (
-                    function or {}).get("arguments")
-
-            parsed_args = parse_arguments(args)
-            tool_name = name or "tool_search"
-
-            if on_event:
-                try:
-                    on_event({
-                        "type": "tool_call",
-                        "name": tool_name,
-                        "args": parsed_args,
-                        "id": str(tc_id or ""),
-                    })
-                except Exception:
-                    pass
-
-            _, tool_output = dispatch_tool_call(tc)
+            _emit(on_event, _tool_call_event(tc_id, tool_name, parsed_args))
+
+            _, tool_output, data = _traced_dispatch(tc, tool_name, speculative)
 
             # Persist tool result
-            save_tool_response(tool_call_id=str(tc_id or ""),
-                               tool_response=str(tool_output))
+            with span("store"):
+                save_tool_response(tool_call_id=tc_id,
+                                   tool_response=str(tool_output),
+                                   conversation_id=session_id)
 
             # Feed back into the LLM
             messages.append(
                 ToolMessage(
                     content=str(tool_output),
-                    tool_call_id=str(tc_id or ""),
+                    tool_call_id=tc_id,
                 )
             )
 
             # Notify UI of tool result
-            if on_event:
-                try:
-                    on_event({
-                        "type": "tool_result",
-                        "name": tool_name,
-                        "result": tool_output,
-                        "id": str(tc_id or ""),
-                    })
-                except Exception:
-                    pass
+            _emit(on_event, _tool_result_event(
+                tc_id, tool_name, tool_output, data))
+            tool_results.append(_tool_result_record(
+                tc_id, tool_name, parsed_args, tool_output, data))
+
+
+async def arun_chat(
+    user_input: str,
+    model: str | None = None,
+    on_event: Optional[Callable[[dict], None]] = None,
+    session_id: str = DEFAULT_CONVERSATION_ID,
+    stream: bool = False,
+    prefetch: bool = PREFETCH,
+    use_cache: bool = True,
+) -> str:
+    """Async variant of run_chat.
+
+    All tool calls of one model step are dispatched concurrently. Their
+    results are still persisted, fed back and reported to `on_event` in the
+    order the model issued them.
+    """
+    with trace("turn", on_event, model=resolve_model(model), stream=stream) as turn:
+        cache = get_response_cache() if use_cache else None
+        cached = None
+        if cache is not None and cache.cacheable(user_input):
+            with span("cache_lookup"):
+                if await ahas_history(session_id):
+                    cache = None
+                else:
+                    # The embedder calls an API (LOCAL_EMBEDDER=openai)
+                    vector = await asyncio.to_thread(cache.embed, user_input)
+                    generation = get_generation()
+                    cached = cache.lookup(vector, resolve_model(model), generation)
+            if cached is not None:
+                turn.set(cached=True)
+                with span("store"):
+                    await aadd_messages([{"role": "user", "content": user_input}]
+                                        + _cached_reply(cached, on_event, stream),
+                                        conversation_id=session_id)
+                request_flush()
+                return cached["answer"]
+        else:
+            cache = None
+
+        speculative = Prefetch(user_input) if prefetch else None
+        tool_results: List[dict] = []
+        try:
+            reply = await _achat_turn(user_input, model, on_event, session_id, stream,
+                                      speculative, tool_results)
+        finally:
+            if speculative is not None:
+                speculative.close()
+        if cache is not None and reply:
+            cache.store(user_input, vector, resolve_model(model), generation,
+                        reply, tool_results)
+        turn.set(tool_calls=len(tool_results), reply_chars=len(reply))
+        return reply
+
+
+async def _achat_turn(user_input, model, on_event, session_id, stream, speculative,
+                      tool_results) -> str:
+    with span("store"):
+        await aadd_messages([
+            {
+                "role": "user",
+                "content": user_input,
+            }
+        ], conversation_id=session_id)
+
+    with span("context") as s:
+        summary, history_docs = await abuild_context(session_id)
+        s.set(messages=len(history_docs))
+    messages = docs_to_lc_messages(history_docs, summary)
+
+    with span("build_llm"):
+        llm = build_llm(model=model)
+
+    for step in itertools.count():
+        with span("llm", step=step) as s:
+            if stream:
+                ai_msg = await astream_step(llm, messages, on_event)
+            else:
+                ai_msg: AIMessage = await llm.ainvoke(messages)
+            s.set(**_llm_usage(messages, ai_msg))
+        with span("store"):
+            await aadd_messages([_ai_message_doc(ai_msg)], conversation_id=session_id)
+        messages.append(ai_msg)
+
+        if not ai_msg.tool_calls:
+            request_flush()
+            return ai_msg.content or ""
+
+        calls = [tool_call_parts(tc) for tc in ai_msg.tool_calls]
+        for tc_id, tool_name, parsed_args in calls:
+            _emit(on_event, _tool_call_event(tc_id, tool_name, parsed_args))
+
+        outputs = await asyncio.gather(
+            *(_atraced_dispatch(tc, tool_name, speculative)
+              for tc, (_, tool_name, _) in zip(ai_msg.tool_calls, calls)),
+        )
+
+        for (tc_id, tool_name, parsed_args), (_, tool_output, data) in zip(calls, outputs):
+            with span("store"):
+                await asave_tool_response(tool_call_id=tc_id,
+                                          tool_response=str(tool_output),
+                                          conversation_id=session_id)
+            messages.append(
+                ToolMessage(
+                    content=str(tool_output),
+                    tool_call_id=tc_id,
+                )
+            )
+            _emit(on_event, _tool_result_event(
+                tc_id, tool_name, tool_output, data))
+            tool_results.append(_tool_result_record(
+                tc_id, tool_name, parsed_args, tool_output, data))
 
 
 if __name__ == "__main__":
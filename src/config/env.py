@@ -14,3 +14,138 @@ UPSTASH_TOKEN = os.getenv("UPSTASH_VECTOR_REST_TOKEN")
 
 OPEN_ROUTER_API_KEY = os.getenv("OPEN_ROUTER_API_KEY")
 OPEN_ROUTER_API = os.getenv("OPEN_ROUTER_API")
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "100"))
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "4"))
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "3"))
+INGEST_BACKOFF_SECONDS = float(os.getenv("INGEST_BACKOFF_SECONDS", "1.0"))
+# Largest share of the indexed tools one sync may delete without force_delete
+INGEST_MAX_DELETE_RATIO = float(os.getenv("INGEST_MAX_DELETE_RATIO", "0.2"))
+
+# "upstash" (remote, default) or "local" (memory-mapped NumPy index)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "upstash")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", ".cache/local_index")
+# "hashing" (offline, no model download) or "openai"
+LOCAL_EMBEDDER = os.getenv("LOCAL_EMBEDDER", "hashing")
+LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", "256"))
+LOCAL_EMBEDDING_MODEL = os.getenv(
+    "LOCAL_EMBEDDING_MODEL", "text-embedding-3-small")
+
+# Each backend keeps its own manifest so switching backends re-indexes fully
+INGEST_MANIFEST_PATH = os.getenv(
+    "INGEST_MANIFEST_PATH",
+    os.path.join(LOCAL_INDEX_DIR, "manifest.json")
+    if VECTOR_BACKEND == "local" else ".cache/ingest_manifest.json",
+)
+
+ENRICH_MAX_WORKERS = int(os.getenv("ENRICH_MAX_WORKERS", "8"))
+TOOL_DETAILS_CACHE_DIR = os.getenv(
+    "TOOL_DETAILS_CACHE_DIR", ".cache/tool_details")
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", ".cache/galaxy_tools.snap")
+
+# "file" keeps the index generation next to the manifest; "mongo" shares it across hosts
+INDEX_STATE_BACKEND = os.getenv("INDEX_STATE_BACKEND", "file")
+INDEX_STATE_PATH = os.getenv("INDEX_STATE_PATH", ".cache/index_state.json")
+
+# "local" (per process), "mongo" (shared by all workers) or "off"
+QUERY_CACHE = os.getenv("QUERY_CACHE", "local")
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1024"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+
+LEXICAL_INDEX_PATH = os.getenv(
+    "LEXICAL_INDEX_PATH", ".cache/lexical_index.json.gz")
+# "hybrid" (BM25 + vector with rank fusion) or "vector"
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
+QUERY_BATCH_MAX_WORKERS = int(os.getenv("QUERY_BATCH_MAX_WORKERS", "8"))
+
+# Chat history window loaded per turn (0 disables the token budget)
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "40"))
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "0"))
+# Buffer chat writes and flush them in bulk off the request path
+MEMORY_WRITE_BEHIND = os.getenv("MEMORY_WRITE_BEHIND", "1") == "1"
+MEMORY_FLUSH_SIZE = int(os.getenv("MEMORY_FLUSH_SIZE", "50"))
+MEMORY_FLUSH_INTERVAL = float(os.getenv("MEMORY_FLUSH_INTERVAL", "1.0"))
+# Flushes MongoDB may reject a message in before it goes to the dead-letter file
+MEMORY_MAX_ATTEMPTS = int(os.getenv("MEMORY_MAX_ATTEMPTS", "5"))
+# While MongoDB is unreachable: longest wait between retries, and most messages held
+MEMORY_MAX_BACKOFF = float(os.getenv("MEMORY_MAX_BACKOFF", "60"))
+MEMORY_MAX_BUFFERED = int(os.getenv("MEMORY_MAX_BUFFERED", "10000"))
+MEMORY_DEAD_LETTER_PATH = os.getenv(
+    "MEMORY_DEAD_LETTER_PATH", ".cache/unsaved_messages.jsonl")
+HISTORY_BUCKET_SIZE = int(os.getenv("HISTORY_BUCKET_SIZE", "50"))
+# Archived tool payloads expire after this many seconds (0 keeps them forever)
+TOOL_PAYLOAD_TTL_SECONDS = int(
+    os.getenv("TOOL_PAYLOAD_TTL_SECONDS", str(30 * 24 * 3600)))
+
+# Shared HTTP connection pool for LLM clients
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(
+    os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(
+    os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "60"))
+
+# Prompt history budget; older turns are folded into a rolling summary (0 disables)
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "4000"))
+# After an overflow, recent history is trimmed to this share of the budget
+CONTEXT_TRIM_RATIO = float(os.getenv("CONTEXT_TRIM_RATIO", "0.5"))
+CONTEXT_SUMMARY_MAX_WORDS = int(os.getenv("CONTEXT_SUMMARY_MAX_WORDS", "250"))
+CONTEXT_SUMMARY_MODEL = os.getenv(
+    "CONTEXT_SUMMARY_MODEL", os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
+
+# Start a tool search on the user's message while the first LLM call runs
+PREFETCH = os.getenv("PREFETCH", "0") == "1"
+PREFETCH_TOP_K = int(os.getenv("PREFETCH_TOP_K", "10"))
+# Word-set (Jaccard) similarity a tool query needs to reuse the prefetch
+PREFETCH_MIN_SIMILARITY = float(os.getenv("PREFETCH_MIN_SIMILARITY", "0.6"))
+PREFETCH_MAX_WORKERS = int(os.getenv("PREFETCH_MAX_WORKERS", "4"))
+
+# Semantic cache of final answers in front of run_chat: "local" or "off".
+# Needs a semantic embedder (LOCAL_EMBEDDER=openai); it stays off with hashing
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "off")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+RESPONSE_CACHE_TTL_SECONDS = float(
+    os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_MIN_SIMILARITY = float(
+    os.getenv("RESPONSE_CACHE_MIN_SIMILARITY", "0.9"))
+# Shorter messages ("yes", "thanks") depend on the conversation and are never cached
+RESPONSE_CACHE_MIN_WORDS = int(os.getenv("RESPONSE_CACHE_MIN_WORDS", "3"))
+
+# Columns of the tool_search payload sent to the model, and description length
+TOOL_RESULT_FIELDS = tuple(f.strip() for f in os.getenv(
+    "TOOL_RESULT_FIELDS", "id,name,version,owner,description").split(",") if f.strip())
+TOOL_RESULT_DESCRIPTION_CHARS = int(
+    os.getenv("TOOL_RESULT_DESCRIPTION_CHARS", "160"))
+
+# HTTP service (python -m src.server)
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+# Chat turns running at once per worker; more wait up to SERVER_QUEUE_TIMEOUT_SECONDS
+SERVER_MAX_CONCURRENT_CHATS = int(os.getenv("SERVER_MAX_CONCURRENT_CHATS", "256"))
+SERVER_QUEUE_TIMEOUT_SECONDS = float(
+    os.getenv("SERVER_QUEUE_TIMEOUT_SECONDS", "5"))
+SERVER_CHAT_TIMEOUT_SECONDS = float(
+    os.getenv("SERVER_CHAT_TIMEOUT_SECONDS", "120"))
+SERVER_SEARCH_TIMEOUT_SECONDS = float(
+    os.getenv("SERVER_SEARCH_TIMEOUT_SECONDS", "10"))
+
+# Stage timing spans (src/utils/tracing.py): JSON-lines file (empty disables it),
+# spans kept per stage for /stats percentiles, and `span` events to on_event
+TRACE_PATH = os.getenv("TRACE_PATH", "")
+TRACE_WINDOW = int(os.getenv("TRACE_WINDOW", "1000"))
+TRACE_EVENTS = os.getenv("TRACE_EVENTS", "1") == "1"
+
+# Blue-green rebuilds (python -m src.rag.reindex): fewer upsert workers than
+# ingest so live queries keep their latency, and the checks before cutover
+REINDEX_MAX_WORKERS = int(os.getenv("REINDEX_MAX_WORKERS", "2"))
+REINDEX_VALIDATE_SAMPLE = int(os.getenv("REINDEX_VALIDATE_SAMPLE", "50"))
+REINDEX_VALIDATE_TOP_K = int(os.getenv("REINDEX_VALIDATE_TOP_K", "10"))
+# Share of the catalog the new namespace must hold
+REINDEX_MIN_COVERAGE = float(os.getenv("REINDEX_MIN_COVERAGE", "0.99"))
+# Largest allowed drop in probe recall compared with the live namespace
+REINDEX_MAX_RECALL_DROP = float(os.getenv("REINDEX_MAX_RECALL_DROP", "0.05"))
+# How long to wait for a remote index to count freshly upserted vectors
+REINDEX_SETTLE_SECONDS = float(os.getenv("REINDEX_SETTLE_SECONDS", "60"))
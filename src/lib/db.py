@@ -1,16 +1,64 @@
-from pymongo import MongoClient
 from src.config.env import MONGO_URI, DB_NAME
 
-# Create ONE global client (best practice)
-client = MongoClient(MONGO_URI)
+# ONE global client per process (best practice), created on first use so
+# importing this module never opens a connection
+_client = None
+_async_client = None
 
-# Access your database
-db = client[DB_NAME]
+
+# Stand-in databases installed with set_database (e.g. for offline benchmarks)
+_db_override = None
+_async_db_override = None
+
+
+def set_database(database, async_database=None):
+    """Use `database` (and `async_database`) instead of MongoDB; None resets."""
+    global _db_override, _async_db_override
+    _db_override = database
+    _async_db_override = async_database
+
+
+def get_client():
+    """Return the shared MongoClient, creating it on first use."""
+    global _client
+    if _client is None:
+        from pymongo import MongoClient
+
+        _client = MongoClient(MONGO_URI)
+    return _client
+
+
+def get_db():
+    """Return the application database on the shared client."""
+    if _db_override is not None:
+        return _db_override
+    return get_client()[DB_NAME]
 
 
 def get_collection(name: str):
     """Get any collection by name."""
-    return db[name]
+    return get_db()[name]
+
+
+def get_async_db():
+    """Database handle on a shared AsyncMongoClient, for asyncio code paths."""
+    global _async_client
+    if _async_db_override is not None:
+        return _async_db_override
+    if _async_client is None:
+        from pymongo import AsyncMongoClient
+
+        _async_client = AsyncMongoClient(MONGO_URI)
+    return _async_client[DB_NAME]
+
+
+def __getattr__(name):
+    # `client` and `db` stay importable but are only created when accessed
+    if name == "client":
+        return get_client()
+    if name == "db":
+        return get_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def main():
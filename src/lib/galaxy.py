@@ -1,19 +1,489 @@
-from bioblend.galaxy import GalaxyInstance
-from src.config.env import GALAXY_API_KEY, GALAXY_URL
+import codecs
+import hashlib
+import html
+import json
+import os
+import re
+import struct
+import uuid
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Optional
 
+from src.config.env import (
+    ENRICH_MAX_WORKERS,
+    GALAXY_API_KEY,
+    GALAXY_URL,
+    SNAPSHOT_PATH,
+    TOOL_DETAILS_CACHE_DIR,
+)
 
-gi = GalaxyInstance(url=GALAXY_URL, key=GALAXY_API_KEY)
+
+_gi = None
+
+
+def get_gi():
+    """Return the shared GalaxyInstance, created (and bioblend imported) on first use."""
+    global _gi
+    if _gi is None:
+        from bioblend.galaxy import GalaxyInstance
+
+        _gi = GalaxyInstance(url=GALAXY_URL, key=GALAXY_API_KEY)
+    return _gi
+
+
+def __getattr__(name):
+    # Keeps `from src.lib.galaxy import gi` working without connecting at import
+    if name == "gi":
+        return get_gi()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Characters that matter when scanning JSON text for the end of an element
+_STRUCTURE_RE = re.compile(r'[{}\[\]"]')
+_STRING_RE = re.compile(r'["\\]')
+_SCALAR_END_RE = re.compile(r'[\s,\]]')
+
+HELP_MAX_CHARS = 1000
+
+# Snapshot layout: header (magic, format version), one zlib-compressed JSON
+# record per tool, a compressed JSON index of record offsets, then a footer
+# pointing at the index.
+SNAPSHOT_MAGIC = b"GXTSNAP\0"
+SNAPSHOT_FORMAT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct("<8sI")
+_SNAPSHOT_FOOTER = struct.Struct("<QQ8s")
 
 
 def fetch_galaxy_tools():
     """Fetch all tools from Galaxy"""
     print("Fetching tools from Galaxy...")
-    tools = gi.tools.get_tools()
+    tools = get_gi().tools.get_tools()
     print(f"Found {len(tools)} tools")
-    print(f"Found: ", tools[:5])
 
     return tools
 
 
+def _element_end(text: str, pos: int, state: dict) -> int:
+    """Scan an array element from `pos`; return where it ends, or -1 if it runs past `text`.
+
+    `state` carries the nesting depth and string/escape flags from one
+    chunk to the next, so every character is scanned exactly once.
+    """
+    if state["scalar"]:
+        match = _SCALAR_END_RE.search(text, pos)
+        return match.start() if match else -1
+    depth, in_string, escaped = state["depth"], state["in_string"], state["escaped"]
+    end = len(text)
+    while pos < end:
+        if escaped:
+            escaped = False
+            pos += 1
+            continue
+        match = (_STRING_RE if in_string else _STRUCTURE_RE).search(text, pos)
+        if match is None:
+            pos = end
+            break
+        pos = match.end()
+        char = match.group()
+        if char == "\\":
+            escaped = True
+            continue
+        if char == '"':
+            in_string = not in_string
+        else:
+            depth += 1 if char in "{[" else -1
+        if depth == 0 and not in_string:
+            return pos
+    state.update(depth=depth, in_string=in_string, escaped=escaped)
+    return -1
+
+
+def _iter_json_array(chunks: Iterable[str]) -> Iterator:
+    """Yield the elements of a top-level JSON array as its text arrives.
+
+    Only the element currently being parsed is buffered, so a huge response
+    never has to be held in memory (or fully downloaded) before the first
+    element is available. The scan of an unfinished element resumes where
+    the previous chunk left off, and each element is decoded once, so the
+    cost stays linear in the element size however the text is split.
+    Raises ValueError if the text ends before the closing bracket.
+    """
+    started = False
+    closed = False
+    parts: list = []  # text of the element being read, across chunks
+    state: Optional[dict] = None  # scanner state of that element; None between elements
+    for text in chunks:
+        pos = 0
+        while pos < len(text):
+            if state is None:
+                char = text[pos]
+                if char in " \t\r\n,":
+                    pos += 1
+                    continue
+                if not started:
+                    if char != "[":
+                        raise ValueError("Expected a JSON array")
+                    started = True
+                    pos += 1
+                    continue
+                if char == "]":
+                    closed = True
+                    break
+                state = {"scalar": char not in '{["', "depth": 0,
+                         "in_string": False, "escaped": False}
+                parts = []
+            element_end = _element_end(text, pos, state)
+            if element_end < 0:
+                parts.append(text[pos:])
+                break
+            parts.append(text[pos:element_end])
+            yield json.loads("".join(parts))
+            state = None
+            pos = element_end
+        if closed:
+            return
+    # A response cut off between elements must not pass for a smaller catalog
+    raise ValueError("Truncated JSON array")
+
+
+def iter_galaxy_tools(chunk_size: int = 64 * 1024) -> Iterator[dict]:
+    """Stream tools from the Galaxy tool panel, one section at a time.
+
+    The panel listing is read incrementally from the HTTP response, so tools
+    are yielded while the rest of the catalog is still downloading. Labels
+    are skipped and tools listed in several sections are yielded once.
+    """
+    print("Streaming tools from Galaxy...")
+    gi = get_gi()
+    response = gi.make_get_request(
+        f"{gi.url}/tools", params={"in_panel": "true"}, stream=True)
+    response.raise_for_status()
+
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    chunks = (decoder.decode(raw)
+              for raw in response.iter_content(chunk_size=chunk_size))
+
+    seen = set()
+    try:
+        for element in _iter_json_array(chunks):
+            if element.get("model_class") == "ToolSection":
+                section_name = element.get("name")
+                elems = element.get("elems") or []
+            else:
+                section_name = None
+                elems = [element]
+            for tool in elems:
+                if tool.get("model_class") != "Tool":
+                    continue
+                if section_name:
+                    tool.setdefault("panel_section_name", section_name)
+                tool_id = tool.get("id")
+                if tool_id in seen:
+                    continue
+                seen.add(tool_id)
+                yield tool
+    finally:
+        response.close()
+
+    print(f"Found {len(seen)} tools")
+
+
+def _clean_help(raw: Optional[str]) -> str:
+    """Turn Galaxy's rendered HTML help into short plain text."""
+    text = re.sub(r"<[^>]+>", " ", raw or "")
+    text = re.sub(r"\s+", " ", html.unescape(text)).strip()
+    if len(text) > HELP_MAX_CHARS:
+        text = text[:HELP_MAX_CHARS].rsplit(" ", 1)[0] + "..."
+    return text
+
+
+def _input_formats(inputs: Optional[list], formats: set):
+    """Collect dataset extensions accepted by (possibly nested) tool inputs."""
+    for param in inputs or []:
+        if param.get("type") in {"data", "data_collection"}:
+            formats.update(ext for ext in param.get("extensions") or []
+                           if ext and ext != "input")
+        for case in param.get("cases") or []:
+            _input_formats(case.get("inputs"), formats)
+        _input_formats(param.get("inputs"), formats)
+    return formats
+
+
+def extract_tool_details(details: dict) -> dict:
+    """Keep only the parts of a show_tool response that help retrieval."""
+    outputs = details.get("outputs") or []
+    return {
+        "help": _clean_help(details.get("help")),
+        "edam_topics": details.get("edam_topics") or [],
+        "edam_operations": details.get("edam_operations") or [],
+        "input_formats": sorted(_input_formats(details.get("inputs"), set())),
+        "output_formats": sorted({o.get("format") for o in outputs
+                                  if o.get("format") and o.get("format") != "input"}),
+        "owner": (details.get("tool_shed_repository") or {}).get("owner"),
+    }
+
+
+def _details_cache_path(tool: dict, cache_dir: str) -> str:
+    key = f"{tool.get('id')}@{tool.get('version')}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, digest[:2], f"{digest}.json")
+
+
+def _read_cached_details(path: str) -> Optional[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _fetch_tool_details(tool: dict, cache_path: str) -> dict:
+    """Fetch one tool's details from Galaxy and store them in the cache."""
+    details = extract_tool_details(
+        get_gi().tools.show_tool(tool["id"], io_details=True))
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(details, fh)
+    os.replace(tmp_path, cache_path)
+    return details
+
+
+def _merge_details(tool: dict, details: dict) -> dict:
+    enriched = {**tool, **{k: v for k, v in details.items() if k != "owner"}}
+    if not enriched.get("owner") and details.get("owner"):
+        enriched["owner"] = details["owner"]
+    return enriched
+
+
+def enrich_tools(
+    tools: Iterable[dict],
+    max_workers: int = ENRICH_MAX_WORKERS,
+    cache_dir: str = TOOL_DETAILS_CACHE_DIR,
+) -> Iterator[dict]:
+    """Add help text, EDAM terms and input/output formats to each tool.
+
+    Details are cached on disk per (tool id, version), so Galaxy is only
+    asked again when a tool's version changes. Cache misses are fetched
+    through a bounded thread pool; tools are yielded lazily and in input
+    order. A tool whose details cannot be fetched is yielded unchanged.
+    """
+    window = max_workers * 4
+    pending: deque = deque()
+    fetched = failed = 0
+
+    def _resolve(tool, details, future):
+        nonlocal fetched, failed
+        if future is not None:
+            try:
+                details = future.result()
+                fetched += 1
+            except Exception as e:
+                failed += 1
+                print(f"Failed to fetch details for {tool.get('id')}: {e}")
+                return tool
+        return _merge_details(tool, details)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for tool in tools:
+            if not tool.get("id"):
+                pending.append((tool, {}, None))
+            else:
+                path = _details_cache_path(tool, cache_dir)
+                details = _read_cached_details(path)
+                if details is None:
+                    pending.append(
+                        (tool, None, pool.submit(_fetch_tool_details, tool, path)))
+                else:
+                    pending.append((tool, details, None))
+            while len(pending) > window or (pending and pending[0][2] is None):
+                yield _resolve(*pending.popleft())
+        while pending:
+            yield _resolve(*pending.popleft())
+
+    print(f"Fetched details for {fetched} tools ({failed} failed)")
+
+
+class SnapshotWriter:
+    """Write tools into a compact, versioned snapshot file.
+
+    Records are appended as they arrive, so a streamed catalog never has to
+    be held in memory. The file is written under a temporary name and moved
+    into place by `close()`, so readers never see a partial snapshot.
+    """
+
+    def __init__(self, path: str = SNAPSHOT_PATH, source: Optional[str] = GALAXY_URL):
+        self.path = path
+        self.source = source
+        self._tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fh = open(self._tmp_path, "wb")
+        self._fh.write(_SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION))
+        self._ids: list = []
+        self._offsets: list = []
+        self._lengths: list = []
+        self._seen: set = set()
+
+    @property
+    def count(self) -> int:
+        return len(self._ids)
+
+    def add(self, tool: dict):
+        tool_id = tool.get("id")
+        if not tool_id or tool_id in self._seen:
+            return
+        record = zlib.compress(json.dumps(
+            tool, separators=(",", ":")).encode("utf-8"))
+        self._seen.add(tool_id)
+        self._ids.append(tool_id)
+        self._offsets.append(self._fh.tell())
+        self._lengths.append(len(record))
+        self._fh.write(record)
+
+    def close(self):
+        index = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "source": self.source,
+            "count": len(self._ids),
+            "ids": self._ids,
+            "offsets": self._offsets,
+            "lengths": self._lengths,
+        }
+        blob = zlib.compress(json.dumps(index).encode("utf-8"))
+        index_offset = self._fh.tell()
+        self._fh.write(blob)
+        self._fh.write(_SNAPSHOT_FOOTER.pack(
+            index_offset, len(blob), SNAPSHOT_MAGIC))
+        self._fh.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._fh.close()
+        os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_snapshot(tools: Iterable[dict], path: str = SNAPSHOT_PATH) -> int:
+    """Write `tools` to a snapshot file and return the number stored."""
+    with SnapshotWriter(path) as writer:
+        for tool in tools:
+            writer.add(tool)
+    print(f"Wrote {writer.count} tools to {path}")
+    return writer.count
+
+
+def tee_snapshot(tools: Iterable[dict], path: str = SNAPSHOT_PATH) -> Iterator[dict]:
+    """Yield `tools` unchanged while recording them into a snapshot.
+
+    The snapshot is only committed if the stream is consumed completely.
+    """
+    writer = SnapshotWriter(path)
+    try:
+        for tool in tools:
+            writer.add(tool)
+            yield tool
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    print(f"Wrote {writer.count} tools to {path}")
+
+
+class ToolSnapshot:
+    """Read-only view of a snapshot file.
+
+    Only the id -> offset index is loaded up front; `get()` decompresses a
+    single record, and iteration streams records in catalog order.
+    """
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        self.path = path
+        self._fd = os.open(path, os.O_RDONLY)
+        size = os.fstat(self._fd).st_size
+        magic, version = _SNAPSHOT_HEADER.unpack(
+            os.pread(self._fd, _SNAPSHOT_HEADER.size, 0))
+        if magic != SNAPSHOT_MAGIC or size < _SNAPSHOT_HEADER.size + _SNAPSHOT_FOOTER.size:
+            os.close(self._fd)
+            raise ValueError(f"{path} is not a Galaxy tool snapshot")
+        if version != SNAPSHOT_FORMAT_VERSION:
+            os.close(self._fd)
+            raise ValueError(
+                f"Unsupported snapshot format version {version} in {path}")
+        index_offset, index_length, magic = _SNAPSHOT_FOOTER.unpack(
+            os.pread(self._fd, _SNAPSHOT_FOOTER.size, size - _SNAPSHOT_FOOTER.size))
+        if magic != SNAPSHOT_MAGIC:
+            os.close(self._fd)
+            raise ValueError(f"Truncated snapshot {path}")
+        index = json.loads(zlib.decompress(
+            os.pread(self._fd, index_length, index_offset)))
+        self.created_at = index.get("created_at")
+        self.source = index.get("source")
+        self._ids = index["ids"]
+        self._locations = dict(zip(
+            index["ids"], zip(index["offsets"], index["lengths"])))
+
+    def _read(self, offset: int, length: int) -> dict:
+        return json.loads(zlib.decompress(os.pread(self._fd, length, offset)))
+
+    def get(self, tool_id: str) -> Optional[dict]:
+        location = self._locations.get(tool_id)
+        return self._read(*location) if location else None
+
+    def ids(self) -> list:
+        return list(self._ids)
+
+    def __contains__(self, tool_id) -> bool:
+        return tool_id in self._locations
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[dict]:
+        for tool_id in self._ids:
+            yield self._read(*self._locations[tool_id])
+
+    def close(self):
+        os.close(self._fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_snapshot(path: str = SNAPSHOT_PATH) -> Iterator[dict]:
+    """Stream every tool stored in a snapshot, in catalog order."""
+    with ToolSnapshot(path) as snapshot:
+        print(f"Reading {len(snapshot)} tools from snapshot {path} "
+              f"(created {snapshot.created_at})")
+        yield from snapshot
+
+
 if __name__ == "__main__":
-    fetch_galaxy_tools()
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Fetch the Galaxy tool catalog")
+    parser.add_argument("--snapshot", metavar="PATH", nargs="?", const=SNAPSHOT_PATH,
+                        help="Write an enriched catalog snapshot instead of listing tools")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        write_snapshot(enrich_tools(iter_galaxy_tools()), args.snapshot)
+    else:
+        fetch_galaxy_tools()
@@ -0,0 +1,141 @@
+import asyncio
+import atexit
+import threading
+import weakref
+from typing import Callable, Optional, Sequence
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from src.config.env import (
+    LLM_CONNECT_TIMEOUT_SECONDS,
+    LLM_KEEPALIVE_EXPIRY_SECONDS,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_MAX_RETRIES,
+    LLM_TIMEOUT_SECONDS,
+    OPEN_ROUTER_API,
+    OPEN_ROUTER_API_KEY,
+)
+
+# Bound clients keyed by (model, temperature, tool names)
+_llms: dict = {}
+_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+# An httpx.AsyncClient only works on the loop it first ran on, so each
+# running loop gets its own, with its own bound clients: loop -> _LoopClients
+_loop_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+# Replaces client construction, e.g. with a scripted LLM for offline benchmarks
+_llm_factory: Optional[Callable] = None
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+def _shared_http_client() -> httpx.Client:
+    """Return the process-wide sync HTTP client; call with _lock held."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(timeout=_timeout(), limits=_limits())
+    return _http_client
+
+
+async def _close_with_loop(client: httpx.AsyncClient):
+    # An async generator left suspended is closed by the loop's
+    # shutdown_asyncgens() (asyncio.run, aiohttp's runner), on that loop
+    try:
+        yield
+    finally:
+        _loop_clients.pop(asyncio.get_running_loop(), None)
+        await client.aclose()
+
+
+class _LoopClients:
+    """The async HTTP client of one event loop and the chat clients using it."""
+
+    def __init__(self):
+        self.http_client = httpx.AsyncClient(timeout=_timeout(), limits=_limits())
+        self.llms: dict = {}
+        self._closer = _close_with_loop(self.http_client)
+        asyncio.ensure_future(self._closer.__anext__())
+
+
+def _clients_for_running_loop() -> Optional[_LoopClients]:
+    """The running loop's clients, created on first use; None outside a loop (hold _lock)."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    clients = _loop_clients.get(loop)
+    if clients is None:
+        clients = _loop_clients[loop] = _LoopClients()
+    return clients
+
+
+def _toolset_key(tools: Sequence) -> tuple:
+    return tuple(sorted(getattr(t, "name", None) or str(t) for t in tools))
+
+
+def get_llm(model: str, temperature: float = 0, tools: Sequence = ()):
+    """Return a shared chat client for this model, temperature and toolset.
+
+    Clients are created on first use and reused for the life of the
+    process. They share one keep-alive connection pool, so a turn
+    reuses open TLS connections instead of dialling the provider again.
+    LangChain runnables hold no per-call state, so one instance can
+    serve several threads or asyncio tasks at once. Called inside an
+    event loop, the client gets that loop's async pool, which is closed
+    when the loop shuts down.
+    """
+    if _llm_factory is not None:
+        return _llm_factory(model, temperature, tools)
+    key = (model, float(temperature), _toolset_key(tools))
+    with _lock:
+        loop_clients = _clients_for_running_loop()
+        llms = _llms if loop_clients is None else loop_clients.llms
+        llm = llms.get(key)
+        if llm is None:
+            llm = ChatOpenAI(
+                model=model,
+                temperature=temperature,
+                api_key=OPEN_ROUTER_API_KEY,
+                base_url=OPEN_ROUTER_API,
+                timeout=_timeout(),
+                max_retries=LLM_MAX_RETRIES,
+                http_client=_shared_http_client(),
+                http_async_client=loop_clients.http_client if loop_clients else None,
+            )
+            if tools:
+                llm = llm.bind_tools(list(tools))
+            llms[key] = llm
+        return llm
+
+
+def set_llm_factory(factory: Optional[Callable]):
+    """Build clients with `factory(model, temperature, tools)` instead; None resets."""
+    global _llm_factory
+    _llm_factory = factory
+
+
+def clear_llm_clients():
+    """Drop every cached client and close the shared connection pool."""
+    global _http_client
+    with _lock:
+        _llms.clear()
+        if _http_client is not None:
+            _http_client.close()
+        _http_client = None
+        # Each async pool is closed on its own loop, when that loop shuts down
+        _loop_clients.clear()
+
+
+atexit.register(clear_llm_clients)
@@ -0,0 +1,255 @@
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+import zlib
+from typing import List, Sequence
+
+import numpy as np
+
+from src.config.env import (
+    LOCAL_EMBEDDER,
+    LOCAL_EMBEDDING_DIM,
+    LOCAL_EMBEDDING_MODEL,
+    LOCAL_INDEX_DIR,
+)
+from src.lib.vectorstore import VectorBackend, VectorHit
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+class HashingEmbedder:
+    """Deterministic, dependency-free embedder based on feature hashing.
+
+    Words and character trigrams are hashed into `dim` signed buckets. It
+    captures lexical rather than semantic similarity, but needs no model
+    and no network, which makes it suitable for offline runs and tests.
+    """
+
+    # Word order and meaning are lost: "bam to sam" equals "sam to bam"
+    semantic = False
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str):
+        for word in _TOKEN_RE.findall((text or "").lower()):
+            yield word, 1.0
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], 0.25
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                out[row, h % self.dim] += weight if h & 0x80000000 else -weight
+        return _normalize_rows(out)
+
+
+class OpenAIEmbedder:
+    """Embeddings from an OpenAI-compatible API (reads OPENAI_API_KEY)."""
+
+    semantic = True
+
+    def __init__(self, model: str = LOCAL_EMBEDDING_MODEL):
+        from langchain_openai import OpenAIEmbeddings
+
+        self._client = OpenAIEmbeddings(model=model)
+        self.name = f"openai-{model}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = self._client.embed_documents(list(texts))
+        return _normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+
+def get_embedder(kind: str = LOCAL_EMBEDDER):
+    """Build the embedder selected by LOCAL_EMBEDDER."""
+    if kind == "openai":
+        return OpenAIEmbedder()
+    return HashingEmbedder()
+
+
+class LocalBackend(VectorBackend):
+    """In-process vector index: brute-force top-k over a memory-mapped matrix.
+
+    Normalized embeddings live in a float32 file that is memory-mapped for
+    reads, next to a JSON side table with ids, metadata and embedded text.
+    Writes are staged in memory and published atomically by `flush()`;
+    queries always see the last flushed state, including flushes made by
+    other processes. Each namespace lives in its own subdirectory of `path`;
+    the default namespace "" uses `path` itself.
+    """
+
+    name = "local"
+
+    def __init__(self, path: str = LOCAL_INDEX_DIR, embedder=None, namespace: str = ""):
+        self.root = path
+        self.namespace = namespace
+        self.path = os.path.join(path, namespace) if namespace else path
+        self.embedder = embedder or get_embedder()
+        self._meta_path = os.path.join(self.path, "meta.json")
+        self._lock = threading.Lock()
+        self._pending: dict = {}
+        self._deleted: set = set()
+        self._meta_mtime = None
+        self._state = (np.zeros((0, 0), dtype=np.float32), [], [], [])
+        self._load()
+
+    def _load(self):
+        try:
+            mtime = os.stat(self._meta_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        with open(self._meta_path, "r", encoding="utf-8") as fh:
+            meta = json.load(fh)
+        if meta["embedder"] != self.embedder.name:
+            raise ValueError(
+                f"Local index at {self.path} was built with {meta['embedder']}, "
+                f"not {self.embedder.name}; rebuild it or change LOCAL_EMBEDDER")
+        count, dim = len(meta["ids"]), meta["dim"]
+        if count:
+            matrix = np.memmap(os.path.join(self.path, meta["vectors"]),
+                               dtype=np.float32, mode="r", shape=(count, dim))
+        else:
+            matrix = np.zeros((0, dim), dtype=np.float32)
+        self._state = (matrix, meta["ids"], meta["metadata"], meta["data"])
+        self._meta_mtime = mtime
+
+    def _current(self):
+        """Return the published state, reloading it if another process flushed."""
+        try:
+            mtime = os.stat(self._meta_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._meta_mtime:
+            with self._lock:
+                if mtime != self._meta_mtime:
+                    self._load()
+        return self._state
+
+    def __len__(self) -> int:
+        return len(self._current()[1])
+
+    def upsert(self, vectors):
+        # Embedding is the slow part and runs outside the lock
+        embeddings = self.embedder.embed([v.get("data") or "" for v in vectors])
+        with self._lock:
+            for vector, embedding in zip(vectors, embeddings):
+                self._pending[vector["id"]] = (
+                    embedding, vector.get("metadata") or {}, vector.get("data"))
+                self._deleted.discard(vector["id"])
+
+    def delete(self, ids):
+        with self._lock:
+            for tool_id in ids:
+                self._pending.pop(tool_id, None)
+                self._deleted.add(tool_id)
+
+    def flush(self):
+        with self._lock:
+            if not self._pending and not self._deleted:
+                return
+            matrix, ids, metadata, data = self._state
+            replaced = self._deleted | set(self._pending)
+            keep = [i for i, tool_id in enumerate(ids) if tool_id not in replaced]
+
+            new_ids = [ids[i] for i in keep] + list(self._pending)
+            new_metadata = [metadata[i] for i in keep] + \
+                [p[1] for p in self._pending.values()]
+            new_data = [data[i] for i in keep] + \
+                [p[2] for p in self._pending.values()]
+            rows = [np.asarray(matrix[keep])] if keep else []
+            if self._pending:
+                rows.append(np.stack([p[0] for p in self._pending.values()]))
+            new_matrix = np.vstack(rows).astype(np.float32) if rows else \
+                np.zeros((0, matrix.shape[1]), dtype=np.float32)
+
+            os.makedirs(self.path, exist_ok=True)
+            vectors_name = f"vectors-{uuid.uuid4().hex}.f32"
+            new_matrix.tofile(os.path.join(self.path, vectors_name))
+            meta = {
+                "embedder": self.embedder.name,
+                "dim": int(new_matrix.shape[1]),
+                "vectors": vectors_name,
+                "ids": new_ids,
+                "metadata": new_metadata,
+                "data": new_data,
+            }
+            tmp_path = f"{self._meta_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump(meta, fh)
+            # Swapping meta.json is the commit point for readers
+            os.replace(tmp_path, self._meta_path)
+
+            self._pending.clear()
+            self._deleted.clear()
+            self._load()
+            for name in os.listdir(self.path):
+                if name.startswith("vectors-") and name != vectors_name:
+                    try:
+                        os.remove(os.path.join(self.path, name))
+                    except OSError:
+                        pass
+
+    def with_namespace(self, namespace):
+        return LocalBackend(self.root, self.embedder, namespace=namespace)
+
+    def count(self):
+        return len(self)
+
+    def drop(self):
+        with self._lock:
+            self._pending.clear()
+            self._deleted.clear()
+            if self.namespace:
+                shutil.rmtree(self.path, ignore_errors=True)
+            else:
+                # Namespace subdirectories share the root; remove only its own files
+                for name in os.listdir(self.path) if os.path.isdir(self.path) else []:
+                    if name == "meta.json" or name.startswith("vectors-"):
+                        os.remove(os.path.join(self.path, name))
+            self._meta_mtime = None
+            self._state = (np.zeros((0, 0), dtype=np.float32), [], [], [])
+
+    def _top_k(self, scores: np.ndarray, top_k: int) -> np.ndarray:
+        if top_k < len(scores):
+            idx = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            idx = np.arange(len(scores))
+        return idx[np.argsort(-scores[idx], kind="stable")]
+
+    def query(self, data, top_k=5) -> List[VectorHit]:
+        matrix, ids, metadata, texts = self._current()
+        if not ids or top_k <= 0:
+            return []
+        query_vector = self.embedder.embed([data])[0]
+        scores = matrix @ query_vector
+        return [
+            VectorHit(id=ids[i], score=float(scores[i]),
+                      metadata=metadata[i], data=texts[i])
+            for i in self._top_k(scores, top_k)
+        ]
+
+    def query_many(self, queries, top_k=5) -> List[List[VectorHit]]:
+        matrix, ids, metadata, texts = self._current()
+        if not ids or top_k <= 0:
+            return [[] for _ in queries]
+        # One matrix-matrix product scores every query against every tool
+        scores = self.embedder.embed(list(queries)) @ matrix.T
+        return [
+            [VectorHit(id=ids[i], score=float(row[i]),
+                       metadata=metadata[i], data=texts[i])
+             for i in self._top_k(row, top_k)]
+            for row in scores
+        ]
@@ -1,7 +1,39 @@
 from src.config.env import UPSTASH_TOKEN, UPSTASH_URL
-from upstash_vector import Index
 
-index = Index(
-    url=UPSTASH_URL,
-    token=UPSTASH_TOKEN
-)
+_index = None
+_async_index = None
+
+
+def get_index():
+    """Return the shared Upstash Index, created on first use."""
+    global _index
+    if _index is None:
+        from upstash_vector import Index
+
+        _index = Index(
+            url=UPSTASH_URL,
+            token=UPSTASH_TOKEN
+        )
+    return _index
+
+
+def get_async_index():
+    """Return the shared Upstash AsyncIndex, created on first use."""
+    global _async_index
+    if _async_index is None:
+        from upstash_vector import AsyncIndex
+
+        _async_index = AsyncIndex(
+            url=UPSTASH_URL,
+            token=UPSTASH_TOKEN
+        )
+    return _async_index
+
+
+def __getattr__(name):
+    # Keeps `from src.lib.upstash import index` working without connecting at import
+    if name == "index":
+        return get_index()
+    if name == "async_index":
+        return get_async_index()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
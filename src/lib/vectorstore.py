@@ -0,0 +1,181 @@
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+from src.config.env import LOCAL_INDEX_DIR, VECTOR_BACKEND
+
+
+@dataclass
+class VectorHit:
+    """One query match; mirrors the attributes of an Upstash QueryResult."""
+
+    id: str
+    score: float
+    metadata: dict = field(default_factory=dict)
+    data: Optional[str] = None
+
+
+class VectorBackend:
+    """Interface shared by the vector stores behind query_tools and ingest.
+
+    Vectors are dicts with `id`, `data` (text to embed) and `metadata`.
+    Query results expose `id`, `score`, `metadata` and `data` attributes.
+    A backend is bound to one namespace ("" is the default one); blue-green
+    reindexing builds a new namespace while queries read the live one.
+    """
+
+    name = "base"
+    namespace = ""
+
+    def upsert(self, vectors: List[dict]):
+        raise NotImplementedError
+
+    def query(self, data: str, top_k: int = 5) -> List[Any]:
+        raise NotImplementedError
+
+    async def aquery(self, data: str, top_k: int = 5) -> List[Any]:
+        """Async query; by default runs `query` in a worker thread."""
+        return await asyncio.to_thread(self.query, data, top_k)
+
+    def query_many(self, queries: List[str], top_k: int = 5) -> Optional[List[List[Any]]]:
+        """Answer several queries in one call, in order; None if the backend can't."""
+        return None
+
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    def flush(self):
+        """Persist pending writes. Remote backends write through and need nothing."""
+
+    def with_namespace(self, namespace: str) -> "VectorBackend":
+        """The same store, bound to another namespace."""
+        raise NotImplementedError
+
+    def count(self) -> Optional[int]:
+        """Number of vectors in this namespace, or None if unknown."""
+        return None
+
+    def drop(self):
+        """Delete every vector of this namespace."""
+        raise NotImplementedError
+
+
+class UpstashBackend(VectorBackend):
+    """Upstash Vector; embedding happens server-side."""
+
+    name = "upstash"
+
+    def __init__(self, index=None, async_index=None, namespace: str = ""):
+        self._index = index
+        self._async_index = async_index
+        self.namespace = namespace
+
+    @property
+    def index(self):
+        if self._index is None:
+            from src.lib.upstash import get_index
+
+            self._index = get_index()
+        return self._index
+
+    @property
+    def async_index(self):
+        if self._async_index is None:
+            from src.lib.upstash import get_async_index
+
+            self._async_index = get_async_index()
+        return self._async_index
+
+    def upsert(self, vectors):
+        self.index.upsert(vectors, namespace=self.namespace)
+
+    def query(self, data, top_k=5):
+        return self.index.query(
+            data=data,
+            top_k=top_k,
+            include_metadata=True,
+            include_data=True,
+            namespace=self.namespace,
+        )
+
+    async def aquery(self, data, top_k=5):
+        return await self.async_index.query(
+            data=data,
+            top_k=top_k,
+            include_metadata=True,
+            include_data=True,
+            namespace=self.namespace,
+        )
+
+    def query_many(self, queries, top_k=5):
+        if not hasattr(self.index, "query_many"):
+            return None
+        return self.index.query_many(queries=[
+            {"data": q, "top_k": top_k,
+                "include_metadata": True, "include_data": True}
+            for q in queries
+        ], namespace=self.namespace)
+
+    def delete(self, ids):
+        self.index.delete(ids=ids, namespace=self.namespace)
+
+    def with_namespace(self, namespace):
+        return UpstashBackend(self._index, self._async_index, namespace=namespace)
+
+    def count(self):
+        namespaces = getattr(self.index.info(), "namespaces", None) or {}
+        info = namespaces.get(self.namespace)
+        return getattr(info, "vector_count", 0) if info is not None else 0
+
+    def drop(self):
+        if self.namespace:
+            self.index.delete_namespace(self.namespace)
+        else:
+            # The default namespace can't be deleted, only emptied
+            self.index.reset(namespace="")
+
+
+_backends: dict = {}
+_override: Optional[VectorBackend] = None
+_backend_lock = threading.Lock()
+
+
+def _create_backend() -> VectorBackend:
+    if VECTOR_BACKEND == "local":
+        from src.lib.local_index import LocalBackend
+
+        return LocalBackend(LOCAL_INDEX_DIR)
+    return UpstashBackend()
+
+
+def get_backend(namespace: Optional[str] = None) -> VectorBackend:
+    """Return the process-wide vector backend selected by VECTOR_BACKEND.
+
+    It is bound to `namespace`, by default the live one recorded in the
+    index state, so a cutover by another process takes effect here too.
+    A backend installed with set_backend serves every namespace.
+    """
+    if _override is not None:
+        return _override
+    if namespace is None:
+        from src.rag.index_state import get_active_namespace
+
+        namespace = get_active_namespace()
+    with _backend_lock:
+        backend = _backends.get(namespace)
+        if backend is None:
+            if "" not in _backends:
+                _backends[""] = _create_backend()
+            backend = _backends[""] if not namespace else \
+                _backends[""].with_namespace(namespace)
+            _backends[namespace] = backend
+        return backend
+
+
+def set_backend(backend: Optional[VectorBackend]):
+    """Install a specific backend (e.g. a LocalBackend for offline runs); None resets."""
+    global _override
+    with _backend_lock:
+        _override = backend
+        _backends.clear()
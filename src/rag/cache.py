@@ -0,0 +1,223 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, List, Optional
+
+from src.config.env import (
+    QUERY_CACHE,
+    QUERY_CACHE_MAX_ENTRIES,
+    QUERY_CACHE_TTL_SECONDS,
+)
+from src.lib.vectorstore import VectorHit
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold and drop punctuation/extra whitespace so trivial variants share a key."""
+    return " ".join(re.findall(r"\w+", (query or "").lower()))
+
+
+def cache_key(query: str, top_k: int) -> str:
+    return f"{top_k}:{normalize_query(query)}"
+
+
+def _to_plain(obj: Any) -> Any:
+    """Convert metadata objects (pydantic/attrs/plain) to plain data."""
+    if obj is None or isinstance(obj, (dict, list, str, int, float, bool)):
+        return obj
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if hasattr(obj, "dict"):
+        return obj.dict()
+    return obj
+
+
+def hit_to_dict(hit: Any) -> dict:
+    """Serialize a query hit so it can be stored outside the process."""
+    return {
+        "id": getattr(hit, "id", None),
+        "score": getattr(hit, "score", None),
+        "metadata": _to_plain(getattr(hit, "metadata", None)),
+        "data": getattr(hit, "data", None),
+    }
+
+
+def hit_from_dict(doc: dict) -> VectorHit:
+    """Rebuild a hit exposing the same attributes as an Upstash query result."""
+    return VectorHit(
+        id=doc.get("id"),
+        score=doc.get("score"),
+        metadata=doc.get("metadata") or {},
+        data=doc.get("data"),
+    )
+
+
+class QueryCache:
+    """Base class for query result caches; subclasses implement _get/_set/_clear.
+
+    Entries are scoped to an index generation: when the generation changes
+    all earlier entries are treated as stale.
+    """
+
+    # True when get/set do network I/O and should leave the event loop
+    blocking = False
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, query: str, top_k: int, generation: int) -> Optional[List[Any]]:
+        try:
+            value = self._get(cache_key(query, top_k), generation)
+        except Exception as e:
+            # A broken cache must never break search; count it as a miss
+            print(f"Query cache lookup failed: {e}")
+            value = None
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, query: str, top_k: int, generation: int, results: List[Any]):
+        try:
+            self._set(cache_key(query, top_k), generation, list(results))
+        except Exception as e:
+            print(f"Query cache store failed: {e}")
+
+    def clear(self):
+        self._clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def _get(self, key: str, generation: int):
+        raise NotImplementedError
+
+    def _set(self, key: str, generation: int, results: List[Any]):
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+
+class LocalQueryCache(QueryCache):
+    """In-process LRU cache with a TTL."""
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = QUERY_CACHE_TTL_SECONDS):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def _get(self, key, generation):
+        with self._lock:
+            if generation != self._generation:
+                # The index changed; everything cached so far is stale
+                self._entries.clear()
+                self._generation = generation
+                return None
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, results = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return results
+
+    def _set(self, key, generation, results):
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update({"size": len(self._entries),
+                     "evictions": self.evictions, "backend": "local"})
+        return stats
+
+
+class MongoQueryCache(QueryCache):
+    """Cache shared by every worker, stored in the `query_cache` collection.
+
+    Expiry is handled by a MongoDB TTL index; the generation is part of the
+    key, so entries from an older index are never returned. Because
+    expiry is TTL-only, entries are not evicted in LRU order.
+    """
+
+    blocking = True
+
+    def __init__(self, ttl_seconds: float = QUERY_CACHE_TTL_SECONDS):
+        super().__init__()
+        from src.lib.db import get_collection
+
+        self.ttl_seconds = ttl_seconds
+        self.collection = get_collection("query_cache")
+        self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def _get(self, key, generation):
+        doc = self.collection.find_one(
+            {"_id": f"{generation}:{key}",
+             "expires_at": {"$gt": datetime.now(timezone.utc)}},
+            {"results": 1},
+        )
+        if doc is None:
+            return None
+        return [hit_from_dict(r) for r in doc["results"]]
+
+    def _set(self, key, generation, results):
+        expires_at = datetime.now(timezone.utc) + \
+            timedelta(seconds=self.ttl_seconds)
+        self.collection.replace_one(
+            {"_id": f"{generation}:{key}"},
+            {"results": [hit_to_dict(r) for r in results],
+             "expires_at": expires_at},
+            upsert=True,
+        )
+
+    def _clear(self):
+        self.collection.delete_many({})
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["backend"] = "mongo"
+        return stats
+
+
+_cache: Optional[QueryCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> Optional[QueryCache]:
+    """Return the process-wide query cache selected by QUERY_CACHE (None when off)."""
+    global _cache
+    if QUERY_CACHE == "off":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = MongoQueryCache() if QUERY_CACHE == "mongo" else LocalQueryCache()
+        return _cache
@@ -0,0 +1,302 @@
+"""Retrieval quality vs. latency for the tool index.
+
+Runs a labelled query set through the search path for every combination
+of retrieval mode, `top_k` and (optionally) embedding text, and reports
+recall@k, MRR and nDCG@k next to latency percentiles and payload sizes:
+
+    python -m src.rag.evaluate --queries queries.jsonl --top-k 3 5 10
+    python -m src.rag.evaluate --from-snapshot --generate 200 --texts full basic
+
+Query files are JSON lines: {"query": "...", "relevant": ["owner/repo/tool", ...]}.
+Relevant ids may include the Tool Shed host and version; any version of
+a relevant tool counts as a hit.
+
+Without --from-snapshot the configured index (VECTOR_BACKEND, and the BM25
+index written by ingest) is evaluated as is. With it, a temporary local
+index is built from the snapshot for each embedding text, so the whole
+run works offline.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from rich.console import Console
+from rich.table import Table
+
+from src.config.env import INGEST_BATCH_SIZE, SNAPSHOT_PATH
+from src.rag.ingest import build_text, build_vector
+from src.rag.lexical import DOC_FIELDS, BM25Index, set_lexical_index
+from src.rag.query import (
+    hybrid_query_tools,
+    hybrid_query_tools_batch,
+    query_tools,
+    query_tools_batch,
+)
+from src.tools.toolSearch import build_payload, encode_payload, short_id
+
+MODES: Dict[str, tuple] = {
+    "vector": (query_tools, query_tools_batch),
+    "hybrid": (hybrid_query_tools, hybrid_query_tools_batch),
+}
+
+
+def _basic_text(tool: dict) -> str:
+    return f"{tool.get('name')}. {tool.get('description') or ''}".strip()
+
+
+def _text_without_help(tool: dict) -> str:
+    return build_text({k: v for k, v in tool.items() if k != "help"})
+
+
+# Embedding texts to compare; "full" is what ingest uses
+TEXT_BUILDERS: Dict[str, Callable[[dict], str]] = {
+    "full": build_text,
+    "no_help": _text_without_help,
+    "basic": _basic_text,
+}
+
+
+def _key(tool_id: Optional[str]) -> str:
+    return (short_id(tool_id) or "").lower()
+
+
+def load_queries(path: str) -> List[dict]:
+    """Read a JSON-lines query set; every line needs `query` and a non-empty `relevant`."""
+    queries = []
+    with open(path, "r", encoding="utf-8") as fh:
+        for line_no, line in enumerate(fh, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not item.get("query") or not item.get("relevant"):
+                raise ValueError(f"{path}:{line_no}: needs 'query' and 'relevant'")
+            queries.append(item)
+    return queries
+
+
+def generate_queries(tools: Sequence[dict], n: int, seed: int = 0) -> List[dict]:
+    """A known-item query set: each sampled tool's description should find that tool."""
+    candidates = [t for t in tools if t.get("id") and len((t.get("description") or "").split()) >= 3]
+    rng = random.Random(seed)
+    sample = rng.sample(candidates, min(n, len(candidates)))
+    return [{"query": t["description"], "relevant": [t["id"]]} for t in sample]
+
+
+def score_ranking(hit_ids: Sequence[str], relevant: Iterable[str], k: int) -> dict:
+    """recall@k, reciprocal rank and nDCG@k (binary gains) of one ranked result list.
+
+    Versions of the same tool are one item: only its first hit counts.
+    """
+    wanted = {_key(r) for r in relevant}
+    found_ranks = []
+    seen = set()
+    for rank, hit_id in enumerate(hit_ids[:k], start=1):
+        key = _key(hit_id)
+        if key in wanted and key not in seen:
+            seen.add(key)
+            found_ranks.append(rank)
+    dcg = sum(1.0 / math.log2(rank + 1) for rank in found_ranks)
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(len(wanted), k) + 1))
+    return {
+        "recall": len(found_ranks) / len(wanted) if wanted else 0.0,
+        "rr": 1.0 / found_ranks[0] if found_ranks else 0.0,
+        "ndcg": dcg / ideal if ideal else 0.0,
+    }
+
+
+def _percentile(ordered: Sequence[float], q: float) -> float:
+    pos = (len(ordered) - 1) * q
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def evaluate_config(queries: Sequence[dict], mode: str, top_k: int) -> dict:
+    """Quality, latency and payload size of one retrieval configuration.
+
+    Every query is timed on its own (caches bypassed) for the percentiles;
+    the whole set then runs once more through the batch API.
+    """
+    if not queries:
+        raise ValueError("no queries to evaluate")
+    search, search_batch = MODES[mode]
+    from src.utils.context import count_tokens
+
+    scores = []
+    latencies = []
+    payload_bytes = []
+    payload_tokens = []
+    for item in queries:
+        started = time.perf_counter()
+        hits = search(item["query"], top_k=top_k, use_cache=False)
+        latencies.append(time.perf_counter() - started)
+        scores.append(score_ranking([getattr(h, "id", None) for h in hits],
+                                    item["relevant"], top_k))
+        payload = encode_payload(build_payload(hits))
+        payload_bytes.append(len(payload.encode("utf-8")))
+        payload_tokens.append(count_tokens(payload))
+
+    started = time.perf_counter()
+    search_batch([item["query"] for item in queries], top_k=top_k, use_cache=False)
+    batch_seconds = time.perf_counter() - started
+
+    n = len(queries)
+    ordered = sorted(latencies)
+    return {
+        "mode": mode,
+        "top_k": top_k,
+        "queries": n,
+        "recall": round(sum(s["recall"] for s in scores) / n, 4),
+        "mrr": round(sum(s["rr"] for s in scores) / n, 4),
+        "ndcg": round(sum(s["ndcg"] for s in scores) / n, 4),
+        "p50_ms": round(_percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(ordered, 0.95) * 1000, 3),
+        "batch_queries_per_second": round(n / batch_seconds, 2) if batch_seconds > 0 else 0.0,
+        "payload_bytes": round(sum(payload_bytes) / n, 1),
+        "payload_tokens": round(sum(payload_tokens) / n, 1),
+    }
+
+
+def build_local_index(tools: Sequence[dict], text: str, path: str):
+    """Index `tools` into a fresh LocalBackend at `path`, embedding TEXT_BUILDERS[text].
+
+    Returns (backend, BM25 index); neither is installed.
+    """
+    from src.lib.local_index import LocalBackend
+
+    backend = LocalBackend(path)
+    builder = TEXT_BUILDERS[text]
+    vectors = [{**build_vector(t), "data": builder(t)} for t in tools if t.get("id")]
+    for start in range(0, len(vectors), INGEST_BATCH_SIZE):
+        backend.upsert(vectors[start:start + INGEST_BATCH_SIZE])
+    backend.flush()
+    lexical = BM25Index.build([{field: t.get(field) for field in DOC_FIELDS} for t in tools])
+    return backend, lexical
+
+
+def evaluate(queries: Sequence[dict], modes: Sequence[str], top_ks: Sequence[int],
+             text: str = "current") -> List[dict]:
+    """evaluate_config for every mode and top_k against the installed index."""
+    return [{"text": text, **evaluate_config(queries, mode, top_k)}
+            for mode in modes for top_k in sorted(top_ks)]
+
+
+def evaluate_snapshot(tools: Sequence[dict], queries: Sequence[dict], modes: Sequence[str],
+                      top_ks: Sequence[int], texts: Sequence[str]) -> List[dict]:
+    """evaluate() against a temporary local index per embedding text."""
+    from src.lib.vectorstore import set_backend
+
+    results = []
+    for text in texts:
+        with tempfile.TemporaryDirectory(prefix=f"evaluate-{text}-") as path:
+            print(f"Indexing {len(tools)} tools with the '{text}' embedding text...")
+            backend, lexical = build_local_index(tools, text, path)
+            set_backend(backend)
+            set_lexical_index(lexical)
+            try:
+                results += evaluate(queries, modes, top_ks, text=text)
+            finally:
+                set_backend(None)
+                set_lexical_index(None)
+    return results
+
+
+def recommend(results: Sequence[dict], min_recall: float) -> Optional[dict]:
+    """The cheapest configuration meeting `min_recall`: smallest top_k, then lowest p50."""
+    passing = [r for r in results if r["recall"] >= min_recall]
+    if not passing:
+        return None
+    return min(passing, key=lambda r: (r["top_k"], r["p50_ms"], r["payload_bytes"]))
+
+
+def print_results(results: Sequence[dict], best: Optional[dict], min_recall: float):
+    table = Table(title="Retrieval evaluation", title_justify="left")
+    for column in ("text", "mode", "top_k", "recall", "MRR", "nDCG", "p50 ms", "p95 ms",
+                   "batch q/s", "payload B", "payload tok"):
+        table.add_column(column, justify="left" if column in ("text", "mode") else "right")
+    for r in results:
+        style = "bold green" if r is best else None
+        table.add_row(r["text"], r["mode"], str(r["top_k"]), f"{r['recall']:.3f}",
+                      f"{r['mrr']:.3f}", f"{r['ndcg']:.3f}", f"{r['p50_ms']:.2f}",
+                      f"{r['p95_ms']:.2f}", f"{r['batch_queries_per_second']:.1f}",
+                      f"{r['payload_bytes']:.0f}", f"{r['payload_tokens']:.0f}", style=style)
+    console = Console()
+    console.print(table)
+    if best is None:
+        console.print(f"No configuration reaches recall {min_recall}.")
+    else:
+        console.print(f"Cheapest configuration with recall >= {min_recall}: "
+                      f"text={best['text']} mode={best['mode']} top_k={best['top_k']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure retrieval quality and latency of the tool index")
+    parser.add_argument("--queries", metavar="PATH",
+                        help="Labelled query set (JSON lines)")
+    parser.add_argument("--from-snapshot", metavar="PATH", nargs="?", const=SNAPSHOT_PATH,
+                        help="Build temporary local indexes from a catalog snapshot")
+    parser.add_argument("--generate", type=int, metavar="N",
+                        help="Sample N known-item queries from the snapshot")
+    parser.add_argument("--write-queries", metavar="PATH",
+                        help="Save the generated query set for later runs")
+    parser.add_argument("--modes", nargs="+", default=["vector", "hybrid"], choices=sorted(MODES))
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument("--texts", nargs="+", default=["full"], choices=sorted(TEXT_BUILDERS),
+                        help="Embedding texts to compare (needs --from-snapshot)")
+    parser.add_argument("--min-recall", type=float, default=0.9,
+                        help="Quality bar for the recommended configuration")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", metavar="PATH", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    tools: List[dict] = []
+    if args.from_snapshot:
+        from src.lib.galaxy import iter_snapshot
+
+        tools = list(iter_snapshot(args.from_snapshot))
+    if args.queries:
+        queries = load_queries(args.queries)
+    elif args.generate and tools:
+        queries = generate_queries(tools, args.generate, seed=args.seed)
+    else:
+        parser.error("pass --queries, or --from-snapshot with --generate N")
+    if not queries:
+        parser.error("no queries to evaluate")
+    if args.write_queries:
+        with open(args.write_queries, "w", encoding="utf-8") as fh:
+            fh.writelines(json.dumps(q) + "\n" for q in queries)
+
+    if tools:
+        results = evaluate_snapshot(tools, queries, args.modes, args.top_k, args.texts)
+    else:
+        results = evaluate(queries, args.modes, args.top_k)
+    best = recommend(results, args.min_recall)
+    print_results(results, best, args.min_recall)
+
+    if args.output:
+        report = {
+            "metadata": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "queries": args.queries or f"generated:{len(queries)}",
+                "snapshot": args.from_snapshot,
+                "vector_backend": os.getenv("VECTOR_BACKEND", "upstash"),
+                "min_recall": args.min_recall,
+            },
+            "results": results,
+            "recommended": best,
+        }
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
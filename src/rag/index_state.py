@@ -0,0 +1,149 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from src.config.env import INDEX_STATE_BACKEND, INDEX_STATE_PATH
+
+# How often the Mongo-backed state is re-read; the file backend uses mtime
+MONGO_REFRESH_SECONDS = 5.0
+
+_lock = threading.Lock()
+_cached_state: dict = {}
+_cached_marker = None
+
+
+def _state_collection():
+    from src.lib.db import get_collection
+
+    return get_collection("index_state")
+
+
+def _read_file_state(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_file_state(state: dict, path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(state, fh)
+    os.replace(tmp_path, path)
+
+
+def read_index_state() -> dict:
+    """Return the shared index state, re-reading it only when it may have changed."""
+    global _cached_state, _cached_marker
+    with _lock:
+        if INDEX_STATE_BACKEND == "mongo":
+            marker = int(time.monotonic() // MONGO_REFRESH_SECONDS)
+            if marker != _cached_marker:
+                doc = _state_collection().find_one({"_id": "tools"}) or {}
+                doc.pop("_id", None)
+                _cached_state, _cached_marker = doc, marker
+        else:
+            try:
+                marker = os.stat(INDEX_STATE_PATH).st_mtime_ns
+            except FileNotFoundError:
+                marker = None
+            if marker != _cached_marker or not _cached_state:
+                _cached_state = _read_file_state(INDEX_STATE_PATH)
+                _cached_marker = marker
+        return dict(_cached_state)
+
+
+def get_generation() -> int:
+    """Current index generation; bumped by ingest whenever the index changes."""
+    return int(read_index_state().get("generation", 0))
+
+
+def get_active_namespace() -> str:
+    """Namespace queries are served from; "" is the default (pre blue-green) one."""
+    return read_index_state().get("active") or ""
+
+
+def namespaced_path(path: str, namespace: str) -> str:
+    """Per-namespace variant of a file path: `dir/name.ext` -> `dir/name.<namespace>.ext`."""
+    if not namespace:
+        return path
+    directory, filename = os.path.split(path)
+    stem, dot, ext = filename.partition(".")
+    return os.path.join(directory, f"{stem}.{namespace}{dot}{ext}")
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Exclusive lock shared by every process updating the state file."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(f"{path}.lock", "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _matches(state: dict, expected: dict) -> bool:
+    # A missing field equals None and "" (the default namespace)
+    return all((state.get(k) or None) == (v or None) for k, v in expected.items())
+
+
+def update_index_state(changes: dict, expected: Optional[dict] = None,
+                       bump: bool = False) -> Optional[dict]:
+    """Atomically apply `changes` if the state still has the `expected` values.
+
+    With `bump` the generation is advanced in the same write, so caches
+    keyed on it are invalidated. Returns the new state, or None if another
+    process changed an expected field first.
+    """
+    global _cached_marker
+    expected = expected or {}
+    now = datetime.now(timezone.utc)
+    with _lock:
+        if INDEX_STATE_BACKEND == "mongo":
+            from pymongo import ReturnDocument
+            from pymongo.errors import DuplicateKeyError
+
+            query: dict = {"_id": "tools"}
+            for key, value in expected.items():
+                query[key] = {"$in": [None, ""]} if value in (None, "") else value
+            update: dict = {"$set": {**changes, "updated_at": now}}
+            if bump:
+                update["$inc"] = {"generation": 1}
+            try:
+                doc = _state_collection().find_one_and_update(
+                    query, update, upsert=True, return_document=ReturnDocument.AFTER)
+            except DuplicateKeyError:
+                # The state exists but did not match `expected`
+                return None
+            doc.pop("_id", None)
+            state = doc
+        else:
+            with _file_lock(INDEX_STATE_PATH):
+                state = _read_file_state(INDEX_STATE_PATH)
+                if not _matches(state, expected):
+                    return None
+                state.update(changes)
+                state["updated_at"] = now.isoformat()
+                if bump:
+                    state["generation"] = int(state.get("generation", 0)) + 1
+                _write_file_state(state, INDEX_STATE_PATH)
+        _cached_marker = None
+    return state
+
+
+def bump_generation() -> int:
+    """Advance the index generation so caches keyed on it are invalidated."""
+    return int(update_index_state({}, bump=True)["generation"])
@@ -1,45 +1,403 @@
-from rich.progress import track
-from src.lib.galaxy import fetch_galaxy_tools
-from src.lib.upstash import index
+import argparse
+import contextvars
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, List, Optional
 
+from rich.progress import Progress
+from src.config.env import (
+    INGEST_BACKOFF_SECONDS,
+    INGEST_BATCH_SIZE,
+    INGEST_MANIFEST_PATH,
+    INGEST_MAX_DELETE_RATIO,
+    INGEST_MAX_RETRIES,
+    INGEST_MAX_WORKERS,
+    LEXICAL_INDEX_PATH,
+    SNAPSHOT_PATH,
+)
+from src.lib.galaxy import enrich_tools, iter_galaxy_tools, iter_snapshot, tee_snapshot
+from src.lib.vectorstore import VectorBackend, get_backend
+from src.rag.index_state import bump_generation, get_active_namespace, namespaced_path
+from src.rag.lexical import DOC_FIELDS, BM25Index
+from src.utils.tracing import span, trace
 
-def upsert_tools(tools):
-    """Embed and upsert tools into Upstash Vector"""
-    total = len(list(tools))
 
-    for tool in track(tools, total=total, description="Indexing tools...", transient=True):
-        tool_id = tool.get("id")
-        tool_name = tool.get("name")
-        tool_description = tool.get("description") or ""
-        text_to_embed = f"{tool_name}. {tool_description}"
+def build_text(tool: dict) -> str:
+    """Build the text to embed, including enrichment fields when present."""
+    parts = [f"{tool.get('name')}. {tool.get('description') or ''}".strip()]
+    edam = (tool.get("edam_operations") or []) + (tool.get("edam_topics") or [])
+    if edam:
+        parts.append(f"EDAM: {', '.join(edam)}.")
+    if tool.get("input_formats"):
+        parts.append(f"Inputs: {', '.join(tool['input_formats'])}.")
+    if tool.get("output_formats"):
+        parts.append(f"Outputs: {', '.join(tool['output_formats'])}.")
+    if tool.get("help"):
+        parts.append(tool["help"])
+    return " ".join(parts)
 
-        print("tool_id", tool_id)
 
-        metadata = {
-            "id": tool_id,
-            "name": tool_name,
-            "description": tool_description,
-            "version": tool.get("version"),
-            "owner": tool.get("owner"),
-        }
+def build_vector(tool: dict) -> dict:
+    """Build the vector payload (id, text to embed, metadata) for a tool."""
+    tool_id = tool.get("id")
+    tool_name = tool.get("name")
+    tool_description = tool.get("description") or ""
+    text_to_embed = build_text(tool)
 
+    metadata = {
+        "id": tool_id,
+        "name": tool_name,
+        "description": tool_description,
+        "version": tool.get("version"),
+        "owner": tool.get("owner"),
+    }
+    for key in ("edam_topics", "edam_operations", "input_formats", "output_formats"):
+        if tool.get(key):
+            metadata[key] = tool[key]
+
+    return {
+        "id": tool_id,     # Unique ID
+        "data": text_to_embed,  # Text to embed
+        "metadata": metadata
+    }
+
+
+def _chunked(items: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    """Group an iterable into lists of at most `size` items without materializing it."""
+    batch: List[dict] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _upsert_batch(batch: List[dict], max_retries: int, backoff_seconds: float,
+                  backend: VectorBackend):
+    """Upsert one batch, retrying with exponential backoff on failure."""
+    with span("ingest.batch", tools=len(batch),
+              text_chars=sum(len(v["data"]) for v in batch)) as s:
+        for attempt in range(max_retries + 1):
+            try:
+                backend.upsert(batch)
+                return
+            except Exception:
+                s.set(retries=attempt + 1)
+                if attempt >= max_retries:
+                    raise
+                time.sleep(backoff_seconds * (2 ** attempt))
+
+
+def upsert_tools(
+    tools: Iterable[dict],
+    batch_size: int = INGEST_BATCH_SIZE,
+    max_workers: int = INGEST_MAX_WORKERS,
+    max_retries: int = INGEST_MAX_RETRIES,
+    backoff_seconds: float = INGEST_BACKOFF_SECONDS,
+    backend: Optional[VectorBackend] = None,
+) -> dict:
+    """Embed and upsert tools into the vector backend in concurrent batches.
+
+    `tools` may be any iterable, including a generator; it is consumed lazily
+    and at most `2 * max_workers` batches are in flight at any time. Returns a
+    report with per-tool failures and throughput. `backend` defaults to the
+    live namespace.
+    """
+    if backend is None:
+        backend = get_backend()
+    total = len(tools) if hasattr(tools, "__len__") else None
+    failures: List[dict] = []
+    upserted = 0
+    started = time.perf_counter()
+
+    def _vectors():
+        for tool in tools:
+            if not tool.get("id"):
+                failures.append({"id": None, "name": tool.get("name"),
+                                 "error": "missing tool id"})
+                continue
+            yield build_vector(tool)
+
+    def _collect(done):
+        nonlocal upserted
+        for future in done:
+            batch = pending.pop(future)
+            try:
+                future.result()
+                upserted += len(batch)
+            except Exception as e:
+                failures.extend(
+                    {"id": v["id"], "name": v["metadata"].get("name"),
+                     "error": str(e)}
+                    for v in batch
+                )
+            progress.advance(task, len(batch))
+
+    with Progress(transient=True) as progress, \
+            ThreadPoolExecutor(max_workers=max_workers) as pool, \
+            span("ingest.upsert") as upsert_span:
+        task = progress.add_task("Indexing tools...", total=total)
+        pending = {}
+
+        for batch in _chunked(_vectors(), batch_size):
+            if len(pending) >= 2 * max_workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done)
+            # Batch spans in the workers belong to the caller's trace
+            future = pool.submit(contextvars.copy_context().run, _upsert_batch,
+                                 batch, max_retries, backoff_seconds, backend)
+            pending[future] = batch
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            _collect(done)
+        upsert_span.set(upserted=upserted, failed=len(failures))
+
+    elapsed = time.perf_counter() - started
+    report = {
+        "upserted": upserted,
+        "failed": len(failures),
+        "failures": failures,
+        "seconds": round(elapsed, 3),
+        "tools_per_second": round(upserted / elapsed, 2) if elapsed > 0 else 0.0,
+        "batch_size": batch_size,
+        "max_workers": max_workers,
+    }
+    print_report(report)
+    return report
+
+
+def print_report(report: dict):
+    """Print a short ingest summary, including every failed tool."""
+    print(
+        f"Upserted {report['upserted']} tools in {report['seconds']}s "
+        f"({report['tools_per_second']} tools/s, batch_size={report['batch_size']}, "
+        f"workers={report['max_workers']})"
+    )
+    if report["failures"]:
+        print(f"Failed to upsert {report['failed']} tools:")
+        for failure in report["failures"]:
+            print(f"  - {failure['id'] or failure['name']}: {failure['error']}")
+
+
+def tool_hash(tool: dict) -> str:
+    """Hash the embedded text plus metadata so any visible change re-indexes a tool."""
+    vector = build_vector(tool)
+    payload = json.dumps(
+        {"data": vector["data"], "metadata": vector["metadata"]},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_manifest(path: str = INGEST_MANIFEST_PATH) -> dict:
+    """Load the tool id -> content hash manifest from the last successful sync."""
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(manifest: dict, path: str = INGEST_MANIFEST_PATH):
+    """Write the manifest atomically so a crash never leaves a torn file."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def delete_tools(tool_ids: List[str], batch_size: int = INGEST_BATCH_SIZE,
+                 backend: Optional[VectorBackend] = None) -> List[str]:
+    """Delete vectors by id in batches. Returns the ids that could not be deleted."""
+    if backend is None:
+        backend = get_backend()
+    failed: List[str] = []
+    for batch in _chunked(tool_ids, batch_size):
         try:
-            index.upsert([
-                {
-                    "id": tool_id,     # Unique ID
-                    "data": text_to_embed,  # Text to embed
-                    "metadata": metadata
-                }
-            ])
+            backend.delete(batch)
         except Exception as e:
-            print(f"Failed to upsert tool {tool_name}: {e}")
+            print(f"Failed to delete {len(batch)} tools: {e}")
+            failed.extend(batch)
+    return failed
+
+
+def sync_tools(
+    tools: Iterable[dict],
+    manifest_path: str = INGEST_MANIFEST_PATH,
+    force: bool = False,
+    lexical_path: Optional[str] = LEXICAL_INDEX_PATH,
+    namespace: Optional[str] = None,
+    force_delete: bool = False,
+    **upsert_kwargs,
+) -> dict:
+    """Incrementally sync the index with `tools` using the content-hash manifest.
+
+    Only new or changed tools are upserted (all of them when `force` is set),
+    and vectors of tools that disappeared from Galaxy are deleted. Tools that
+    fail to upsert keep their previous hash so the next run retries them.
+    The BM25 lexical index at `lexical_path` is rebuilt from the full
+    catalog whenever it changed.
+
+    Deletes only happen once `tools` has been read to the end, and never
+    for more than INGEST_MAX_DELETE_RATIO of the indexed tools unless
+    `force_delete` is set: a partial catalog must not empty the index.
+
+    `namespace` defaults to the live one. The manifest and lexical index
+    are kept per namespace (see src/rag/reindex.py for blue-green builds).
+    """
+    if namespace is None:
+        namespace = get_active_namespace()
+    backend = get_backend(namespace)
+    manifest_path = namespaced_path(manifest_path, namespace)
+    if lexical_path:
+        lexical_path = namespaced_path(lexical_path, namespace)
+    manifest = load_manifest(manifest_path)
+    seen: dict = {}
+    lexical_docs: List[dict] = []
+    complete = False
+
+    def _changed():
+        nonlocal complete
+        for tool in tools:
+            tool_id = tool.get("id")
+            if not tool_id:
+                yield tool  # reported as a failure by upsert_tools
+                continue
+            if tool_id in seen:
+                continue
+            digest = tool_hash(tool)
+            seen[tool_id] = digest
+            lexical_docs.append({field: tool.get(field) for field in DOC_FIELDS})
+            if force or manifest.get(tool_id) != digest:
+                yield tool
+        complete = True
 
+    report = upsert_tools(_changed(), backend=backend, **upsert_kwargs)
 
-def main(period_seconds: int = 3600):
+    removed = [tool_id for tool_id in manifest if tool_id not in seen]
+    if removed and not complete:
+        print(f"The catalog was not read to the end; keeping {len(removed)} indexed tools")
+        failed_deletes = set(removed)
+    elif removed and not seen:
+        # An empty catalog almost always means Galaxy failed, not that every tool is gone
+        print(f"Galaxy returned no tools; keeping {len(removed)} indexed tools")
+        failed_deletes = set(removed)
+    elif not force_delete and len(removed) > INGEST_MAX_DELETE_RATIO * len(manifest):
+        print(f"{len(removed)} of {len(manifest)} indexed tools are missing from the catalog, "
+              f"more than INGEST_MAX_DELETE_RATIO ({INGEST_MAX_DELETE_RATIO}); keeping them. "
+              "Pass --force-delete if they really were removed")
+        failed_deletes = set(removed)
+    else:
+        with span("ingest.delete", tools=len(removed)):
+            failed_deletes = set(delete_tools(
+                removed, upsert_kwargs.get("batch_size", INGEST_BATCH_SIZE), backend))
+
+    failed_ids = {f["id"] for f in report["failures"] if f["id"]}
+    new_manifest = {}
+    for tool_id, digest in seen.items():
+        if tool_id not in failed_ids:
+            new_manifest[tool_id] = digest
+        elif tool_id in manifest:
+            new_manifest[tool_id] = manifest[tool_id]
+    for tool_id in failed_deletes:
+        new_manifest[tool_id] = manifest[tool_id]
+    # Publish staged writes (local backend) before recording them as indexed
+    with span("ingest.flush"):
+        backend.flush()
+    save_manifest(new_manifest, manifest_path)
+
+    changed = report["upserted"] or len(removed) > len(failed_deletes)
+    if lexical_path and seen and (changed or not os.path.exists(lexical_path)):
+        with span("ingest.lexical", tools=len(lexical_docs)):
+            BM25Index.build(lexical_docs).save(lexical_path)
+
+    if changed and namespace == get_active_namespace():
+        # Let query caches know their entries may now be stale
+        report["generation"] = bump_generation()
+
+    report.update({
+        "namespace": namespace,
+        "seen": len(seen),
+        "unchanged": len(seen) - report["upserted"] - len(failed_ids),
+        "deleted": len(removed) - len(failed_deletes),
+    })
+    print(
+        f"Sync: {report['seen']} tools seen, {report['upserted']} upserted, "
+        f"{report['unchanged']} unchanged, {report['deleted']} deleted"
+    )
+    return report
+
+
+def main(
+    period_seconds: int = 3600,
+    once: bool = False,
+    force: bool = False,
+    enrich: bool = True,
+    from_snapshot: Optional[str] = None,
+    write_snapshot: Optional[str] = None,
+    force_delete: bool = False,
+):
     """Main loop to periodically fetch and index Galaxy tools"""
-    tools = fetch_galaxy_tools()
-    upsert_tools(tools)
+    while True:
+        started = time.monotonic()
+        try:
+            # Streamed, so fetching, enrichment, text building and upserts overlap
+            if from_snapshot:
+                tools = iter_snapshot(from_snapshot)
+            else:
+                tools = iter_galaxy_tools()
+                if enrich:
+                    tools = enrich_tools(tools)
+            if write_snapshot:
+                tools = tee_snapshot(tools, write_snapshot)
+            with trace("ingest", force=force):
+                sync_tools(tools, force=force, force_delete=force_delete)
+        except Exception as e:
+            if once:
+                raise
+            print(f"Sync failed: {e}")
+        if once:
+            return
+        # Only the first iteration of a forced run re-embeds everything
+        force = force_delete = False
+        sleep_for = max(0.0, period_seconds - (time.monotonic() - started))
+        print(f"Next sync in {int(sleep_for)}s")
+        time.sleep(sleep_for)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(
+        description="Index Galaxy tools into the vector store")
+    parser.add_argument("--period", type=int, default=3600,
+                        help="Seconds between syncs in daemon mode")
+    parser.add_argument("--once", action="store_true",
+                        help="Run a single sync and exit")
+    parser.add_argument("--full", action="store_true",
+                        help="Re-embed every tool, ignoring the manifest")
+    parser.add_argument("--force-delete", action="store_true",
+                        help="Delete tools missing from the catalog even beyond "
+                             "INGEST_MAX_DELETE_RATIO")
+    parser.add_argument("--no-enrich", action="store_true",
+                        help="Skip fetching help text, EDAM terms and formats")
+    parser.add_argument("--from-snapshot", metavar="PATH", nargs="?", const=SNAPSHOT_PATH,
+                        help="Index tools from a local catalog snapshot instead of Galaxy")
+    parser.add_argument("--write-snapshot", metavar="PATH", nargs="?", const=SNAPSHOT_PATH,
+                        help="Record the fetched catalog into a snapshot while indexing")
+    args = parser.parse_args()
+
+    try:
+        main(period_seconds=args.period, once=args.once, force=args.full,
+             enrich=not args.no_enrich, from_snapshot=args.from_snapshot,
+             write_snapshot=args.write_snapshot, force_delete=args.force_delete)
+    except KeyboardInterrupt:
+        print("Stopped.")
@@ -0,0 +1,172 @@
+import gzip
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Iterable, List, Optional
+
+from src.config.env import LEXICAL_INDEX_PATH
+from src.rag.index_state import get_active_namespace, namespaced_path
+from src.lib.vectorstore import VectorHit
+
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+DOC_FIELDS = ("id", "name", "description", "version", "owner")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercase word tokens, plus camelCase parts (featureCounts -> feature, counts)."""
+    tokens: List[str] = []
+    for word in _WORD_RE.findall(text or ""):
+        lowered = word.lower()
+        tokens.append(lowered)
+        parts = _CAMEL_RE.findall(word)
+        if len(parts) > 1:
+            tokens.extend(p.lower() for p in parts
+                          if len(p) > 1 and not p.isdigit())
+    return tokens
+
+
+def short_tool_id(tool_id: Optional[str]) -> str:
+    """`toolshed.../repos/devteam/bowtie2/bowtie2/2.5.0` -> `bowtie2`; plain ids unchanged."""
+    parts = (tool_id or "").strip("/").split("/")
+    if len(parts) >= 2 and "repos" in parts:
+        return parts[-2].lower()
+    return parts[-1].lower()
+
+
+def _exact_key(text: Optional[str]) -> str:
+    return " ".join(_WORD_RE.findall((text or "").lower()))
+
+
+class BM25Index:
+    """Okapi BM25 over each tool's id, name, description and owner.
+
+    Names and short ids are counted twice so exact tool names outrank
+    passing mentions in other tools' descriptions.
+    """
+
+    def __init__(self, docs: List[dict], postings: dict, doc_lengths: List[int],
+                 k1: float = 1.2, b: float = 0.75):
+        self.docs = docs
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avgdl = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+        self.exact: dict = defaultdict(list)
+        for i, doc in enumerate(docs):
+            for key in {_exact_key(doc.get("name")), short_tool_id(doc.get("id")),
+                        _exact_key(doc.get("id"))}:
+                if key:
+                    self.exact[key].append(i)
+
+    @classmethod
+    def build(cls, tools: Iterable[dict]) -> "BM25Index":
+        docs: List[dict] = []
+        doc_lengths: List[int] = []
+        postings: dict = defaultdict(list)
+        for tool in tools:
+            doc = {field: tool.get(field) for field in DOC_FIELDS}
+            tokens = (
+                tokenize(doc["name"]) * 2
+                + [short_tool_id(doc["id"])] * 2
+                + tokenize(doc["id"])
+                + tokenize(doc["description"])
+                + tokenize(doc["owner"])
+            )
+            doc_index = len(docs)
+            for term, tf in Counter(tokens).items():
+                postings[term].append([doc_index, tf])
+            docs.append(doc)
+            doc_lengths.append(len(tokens))
+        return cls(docs, dict(postings), doc_lengths)
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def _hit(self, doc_index: int, score: float) -> VectorHit:
+        doc = self.docs[doc_index]
+        return VectorHit(
+            id=doc["id"],
+            score=score,
+            metadata=doc,
+            data=f"{doc.get('name')}. {doc.get('description') or ''}".strip(),
+        )
+
+    def search(self, query: str, top_k: int = 5) -> List[VectorHit]:
+        n = len(self.docs)
+        scores: dict = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_index, tf in postings:
+                norm = 1 - self.b + self.b * \
+                    self.doc_lengths[doc_index] / self.avgdl
+                scores[doc_index] += idf * tf * \
+                    (self.k1 + 1) / (tf + self.k1 * norm)
+        best = heapq.nlargest(top_k, scores.items(), key=lambda kv: kv[1])
+        return [self._hit(i, score) for i, score in best]
+
+    def exact_match(self, query: str) -> List[VectorHit]:
+        """Tools whose name or id is exactly the query (ignoring case/punctuation)."""
+        return [self._hit(i, 1.0) for i in self.exact.get(_exact_key(query), [])]
+
+    def save(self, path: str = LEXICAL_INDEX_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as fh:
+            json.dump({"docs": self.docs, "postings": self.postings,
+                       "doc_lengths": self.doc_lengths,
+                       "k1": self.k1, "b": self.b}, fh)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = LEXICAL_INDEX_PATH) -> "BM25Index":
+        with gzip.open(path, "rt", encoding="utf-8") as fh:
+            raw = json.load(fh)
+        return cls(raw["docs"], raw["postings"], raw["doc_lengths"],
+                   k1=raw["k1"], b=raw["b"])
+
+
+_index: Optional[BM25Index] = None
+_index_marker = None
+_index_lock = threading.Lock()
+# Installed with set_lexical_index (e.g. for offline evaluation)
+_override: Optional[BM25Index] = None
+
+
+def get_lexical_index(path: Optional[str] = None) -> Optional[BM25Index]:
+    """Return the BM25 index written by ingest, reloading it after each rebuild.
+
+    By default this is the index of the live namespace (see index_state).
+    """
+    global _index, _index_marker
+    if _override is not None:
+        return _override
+    if path is None:
+        path = namespaced_path(LEXICAL_INDEX_PATH, get_active_namespace())
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    marker = (path, mtime)
+    if marker != _index_marker:
+        with _index_lock:
+            if marker != _index_marker:
+                _index, _index_marker = BM25Index.load(path), marker
+    return _index
+
+
+def set_lexical_index(index: Optional[BM25Index]):
+    """Serve `index` instead of the one on disk; None resets."""
+    global _override
+    _override = index
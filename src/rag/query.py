@@ -1,23 +1,209 @@
+import asyncio
 import json
-from src.lib.upstash import index
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Sequence
 
+from src.config.env import QUERY_BATCH_MAX_WORKERS
+from src.lib.vectorstore import VectorHit, get_backend
+from src.rag.cache import cache_key, get_query_cache
+from src.rag.index_state import get_generation
+from src.rag.lexical import get_lexical_index
 
-def query_tools(query: str, top_k: int = 5):
+RRF_K = 60
+
+
+def query_tools(query: str, top_k: int = 5, use_cache: bool = True):
     """
-    Query the Upstash vector index.
+    Query the vector index (Upstash or local, see VECTOR_BACKEND).
     Returns the closest matching tools.
+
+    Results are served from the query cache when possible; entries are
+    keyed on the normalized query and `top_k` and scoped to the current
+    index generation.
     """
+    cache = get_query_cache() if use_cache else None
+    if cache is not None:
+        generation = get_generation()
+        cached = cache.get(query, top_k, generation)
+        if cached is not None:
+            return cached
+
+    result = get_backend().query(query, top_k=top_k)
+
+    if cache is not None:
+        cache.set(query, top_k, generation, result)
+    return result
+
+
+async def aquery_tools(query: str, top_k: int = 5, use_cache: bool = True):
+    """Async version of query_tools, using the backend's async client."""
+    cache = get_query_cache() if use_cache else None
+    if cache is not None:
+        generation = get_generation()
+        if cache.blocking:
+            cached = await asyncio.to_thread(cache.get, query, top_k, generation)
+        else:
+            cached = cache.get(query, top_k, generation)
+        if cached is not None:
+            return cached
 
-    result = index.query(
-        data=query,
-        top_k=top_k,
-        include_metadata=True,
-        include_data=True,
-    )
+    result = await get_backend().aquery(query, top_k=top_k)
 
+    if cache is not None:
+        if cache.blocking:
+            await asyncio.to_thread(cache.set, query, top_k, generation, result)
+        else:
+            cache.set(query, top_k, generation, result)
     return result
 
 
+def query_tools_batch(
+    queries: Sequence[str],
+    top_k: int = 5,
+    max_workers: int = QUERY_BATCH_MAX_WORKERS,
+    use_cache: bool = True,
+) -> List[Any]:
+    """
+    Run many queries at once; results come back in input order.
+
+    Cached and duplicate queries are answered once. The remaining ones use
+    the backend's multi-query call when it has one, and otherwise fan out
+    over at most `max_workers` threads.
+    """
+    cache = get_query_cache() if use_cache else None
+    generation = get_generation() if cache is not None else None
+    results: dict = {}
+    misses: dict = {}
+    for query in queries:
+        key = cache_key(query, top_k)
+        if key in results or key in misses:
+            continue
+        cached = cache.get(query, top_k, generation) if cache is not None else None
+        if cached is not None:
+            results[key] = cached
+        else:
+            misses[key] = query
+
+    if misses:
+        pending = list(misses.values())
+        answers = get_backend().query_many(pending, top_k=top_k)
+        if answers is None:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as pool:
+                answers = list(pool.map(
+                    lambda q: get_backend().query(q, top_k=top_k), pending))
+        for key, query, answer in zip(misses, pending, answers):
+            results[key] = answer
+            if cache is not None:
+                cache.set(query, top_k, generation, answer)
+
+    return [results[cache_key(query, top_k)] for query in queries]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Any]], k: int = RRF_K) -> List[VectorHit]:
+    """Fuse several ranked hit lists; a hit scores sum(1 / (k + rank)) over lists."""
+    scores: dict = {}
+    hits: dict = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            hit_id = getattr(hit, "id", None)
+            scores[hit_id] = scores.get(hit_id, 0.0) + 1.0 / (k + rank)
+            # Prefer the first list's copy (the vector hit carries the full text)
+            hits.setdefault(hit_id, hit)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [
+        VectorHit(
+            id=hit_id,
+            score=scores[hit_id],
+            metadata=getattr(hits[hit_id], "metadata", None) or {},
+            data=getattr(hits[hit_id], "data", None),
+        )
+        for hit_id in ordered
+    ]
+
+
+def _hybrid_candidates(top_k: int) -> int:
+    return max(top_k * 2, 10)
+
+
+def _exact_results(lexical, query: str, top_k: int) -> List[VectorHit]:
+    exact = lexical.exact_match(query)
+    if not exact:
+        return []
+    exact_ids = {hit.id for hit in exact}
+    rest = [hit for hit in lexical.search(query, top_k=top_k + len(exact))
+            if hit.id not in exact_ids]
+    return (exact + rest)[:top_k]
+
+
+def hybrid_query_tools(query: str, top_k: int = 5, use_cache: bool = True):
+    """
+    Combine BM25 and vector search with reciprocal rank fusion.
+
+    A query that exactly names a tool (by name or id) is answered from the
+    lexical index alone, skipping the vector query. Falls back to plain
+    vector search until ingest has written a lexical index.
+    """
+    lexical = get_lexical_index()
+    if lexical is None:
+        return query_tools(query, top_k=top_k, use_cache=use_cache)
+
+    exact = _exact_results(lexical, query, top_k)
+    if exact:
+        return exact
+
+    candidates = _hybrid_candidates(top_k)
+    vector_hits = query_tools(query, top_k=candidates, use_cache=use_cache)
+    lexical_hits = lexical.search(query, top_k=candidates)
+    return reciprocal_rank_fusion([vector_hits, lexical_hits])[:top_k]
+
+
+async def ahybrid_query_tools(query: str, top_k: int = 5, use_cache: bool = True):
+    """Async version of hybrid_query_tools; only the vector query is awaited."""
+    lexical = get_lexical_index()
+    if lexical is None:
+        return await aquery_tools(query, top_k=top_k, use_cache=use_cache)
+
+    exact = _exact_results(lexical, query, top_k)
+    if exact:
+        return exact
+
+    candidates = _hybrid_candidates(top_k)
+    vector_hits = await aquery_tools(query, top_k=candidates, use_cache=use_cache)
+    lexical_hits = lexical.search(query, top_k=candidates)
+    return reciprocal_rank_fusion([vector_hits, lexical_hits])[:top_k]
+
+
+def hybrid_query_tools_batch(
+    queries: Sequence[str],
+    top_k: int = 5,
+    max_workers: int = QUERY_BATCH_MAX_WORKERS,
+    use_cache: bool = True,
+) -> List[Any]:
+    """Batch version of hybrid_query_tools; results come back in input order."""
+    lexical = get_lexical_index()
+    if lexical is None:
+        return query_tools_batch(queries, top_k=top_k, max_workers=max_workers,
+                                 use_cache=use_cache)
+
+    results: List[Any] = [_exact_results(lexical, q, top_k) for q in queries]
+    fuzzy = [i for i, hits in enumerate(results) if not hits]
+    candidates = _hybrid_candidates(top_k)
+    vector_results = query_tools_batch(
+        [queries[i] for i in fuzzy], top_k=candidates,
+        max_workers=max_workers, use_cache=use_cache)
+    for i, vector_hits in zip(fuzzy, vector_results):
+        lexical_hits = lexical.search(queries[i], top_k=candidates)
+        results[i] = reciprocal_rank_fusion(
+            [vector_hits, lexical_hits])[:top_k]
+    return results
+
+
+def query_cache_stats() -> dict:
+    """Hit/miss counters of the query cache (empty when caching is off)."""
+    cache = get_query_cache()
+    return cache.stats() if cache is not None else {}
+
+
 if __name__ == "__main__":
     # Test run
     results = query_tools("align sequencing data", top_k=3)
@@ -0,0 +1,303 @@
+"""Blue-green reindexing: build a new namespace, validate it, then switch.
+
+Queries always read the live namespace recorded in the index state (see
+index_state.get_active_namespace). A rebuild writes every tool into a
+fresh namespace (`v1`, `v2`, ...; an Upstash namespace, or a subdirectory
+of LOCAL_INDEX_DIR) with its own manifest and BM25 index, so readers
+never see a half-built index. Once the new namespace passes validation,
+one compare-and-set on the index state makes it live and bumps the
+generation, which invalidates the query and response caches. The
+namespace it replaced is kept for rollback; older ones are garbage
+collected.
+
+    python -m src.rag.reindex build --from-snapshot
+    python -m src.rag.reindex status
+    python -m src.rag.reindex rollback
+    python -m src.rag.reindex gc
+"""
+
+import argparse
+import os
+import random
+import time
+from typing import Iterable, Iterator, List, Optional
+
+from src.config.env import (
+    INGEST_MANIFEST_PATH,
+    LEXICAL_INDEX_PATH,
+    REINDEX_MAX_RECALL_DROP,
+    REINDEX_MAX_WORKERS,
+    REINDEX_MIN_COVERAGE,
+    REINDEX_SETTLE_SECONDS,
+    REINDEX_VALIDATE_SAMPLE,
+    REINDEX_VALIDATE_TOP_K,
+    SNAPSHOT_PATH,
+)
+from src.lib.vectorstore import VectorBackend, get_backend
+from src.rag.index_state import namespaced_path, read_index_state, update_index_state
+from src.rag.ingest import sync_tools
+from src.utils.tracing import span, trace
+
+
+class ReindexError(RuntimeError):
+    """A rebuild could not start, failed validation or lost a race with another process."""
+
+
+def _known_namespaces(state: dict) -> List[str]:
+    # Before the first blue-green build only the default namespace exists
+    return list(state.get("namespaces") or [state.get("active") or ""])
+
+
+def start_build() -> str:
+    """Reserve a new namespace and record it as being built."""
+    state = read_index_state()
+    if state.get("building"):
+        raise ReindexError(
+            f"namespace {state['building']!r} is already being built; "
+            "run `abort` if that build is dead")
+    seq = int(state.get("namespace_seq", 0)) + 1
+    namespace = f"v{seq}"
+    updated = update_index_state(
+        {"building": namespace, "namespace_seq": seq,
+         "namespaces": _known_namespaces(state) + [namespace]},
+        expected={"building": None, "namespace_seq": state.get("namespace_seq")},
+    )
+    if updated is None:
+        raise ReindexError("another process started a build at the same time")
+    return namespace
+
+
+def _sampled(tools: Iterable[dict], size: int, sample: List[dict], seed: int = 0) -> Iterator[dict]:
+    """Pass `tools` through, keeping a uniform sample of `size` in `sample` (reservoir)."""
+    rng = random.Random(seed)
+    for i, tool in enumerate(tools):
+        if len(sample) < size:
+            sample.append(tool)
+        else:
+            j = rng.randint(0, i)
+            if j < size:
+                sample[j] = tool
+        yield tool
+
+
+def _wait_for_count(backend: VectorBackend, expected: int, timeout: float) -> Optional[int]:
+    # Remote indexes count vectors asynchronously after the upsert returns
+    deadline = time.monotonic() + timeout
+    count = backend.count()
+    while count is not None and count < expected and time.monotonic() < deadline:
+        time.sleep(1.0)
+        count = backend.count()
+    return count
+
+
+def probe_recall(backend: VectorBackend, probes: List[dict], top_k: int) -> Optional[float]:
+    """Known-item recall@k of the sample probes on `backend`; None without probes."""
+    from src.rag.evaluate import generate_queries, score_ranking
+
+    queries = generate_queries(probes, len(probes))
+    if not queries:
+        return None
+    found = 0.0
+    for item in queries:
+        hits = backend.query(item["query"], top_k=top_k)
+        found += score_ranking([getattr(h, "id", None) for h in hits],
+                               item["relevant"], top_k)["recall"]
+    return found / len(queries)
+
+
+def validate(namespace: str, expected: int, probes: List[dict],
+             min_coverage: float = REINDEX_MIN_COVERAGE,
+             max_recall_drop: float = REINDEX_MAX_RECALL_DROP,
+             top_k: int = REINDEX_VALIDATE_TOP_K) -> dict:
+    """Check a built namespace before it goes live.
+
+    It must hold at least `min_coverage` of the `expected` tools, and its
+    recall on the probe tools may be at most `max_recall_drop` below the
+    live namespace's (when that has any vectors).
+    """
+    live = get_backend()
+    candidate = get_backend(namespace)
+    with span("reindex.validate", namespace=namespace, probes=len(probes)):
+        count = _wait_for_count(candidate, expected, REINDEX_SETTLE_SECONDS)
+        recall = probe_recall(candidate, probes, top_k)
+        live_recall = probe_recall(live, probes, top_k) if live.count() else None
+
+    problems = []
+    if count is not None and expected and count < expected * min_coverage:
+        problems.append(f"holds {count} of {expected} tools")
+    if recall is not None and live_recall is not None and recall < live_recall - max_recall_drop:
+        problems.append(f"probe recall {recall:.3f} vs {live_recall:.3f} live")
+    return {"namespace": namespace, "count": count, "expected": expected,
+            "recall": recall, "live_recall": live_recall, "ok": not problems,
+            "problems": problems}
+
+
+def cutover(namespace: str) -> dict:
+    """Make a built namespace live; the current one becomes the rollback target."""
+    state = read_index_state()
+    if state.get("building") != namespace:
+        raise ReindexError(f"{namespace!r} is not the namespace being built")
+    active = state.get("active") or ""
+    updated = update_index_state(
+        {"active": namespace, "previous": active, "building": None},
+        expected={"active": active, "building": namespace},
+        bump=True,
+    )
+    if updated is None:
+        raise ReindexError("the index state changed during cutover; nothing was switched")
+    print(f"Cutover: {active or '(default)'} -> {namespace} "
+          f"(generation {updated['generation']})")
+    return updated
+
+
+def rollback() -> dict:
+    """Swap the live namespace with the previous one."""
+    state = read_index_state()
+    active = state.get("active") or ""
+    previous = state.get("previous")
+    if previous is None or previous == active:
+        raise ReindexError("there is no previous namespace to roll back to")
+    if previous not in _known_namespaces(state):
+        raise ReindexError(f"previous namespace {previous!r} was garbage collected")
+    updated = update_index_state(
+        {"active": previous, "previous": active},
+        expected={"active": active, "previous": previous},
+        bump=True,
+    )
+    if updated is None:
+        raise ReindexError("the index state changed during rollback; nothing was switched")
+    print(f"Rollback: {active or '(default)'} -> {previous or '(default)'} "
+          f"(generation {updated['generation']})")
+    return updated
+
+
+def _drop_namespace(namespace: str):
+    get_backend(namespace).drop()
+    for path in (namespaced_path(INGEST_MANIFEST_PATH, namespace),
+                 namespaced_path(LEXICAL_INDEX_PATH, namespace)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def abort_build() -> Optional[str]:
+    """Forget the namespace being built and delete what was written to it."""
+    state = read_index_state()
+    namespace = state.get("building")
+    if not namespace:
+        return None
+    _drop_namespace(namespace)
+    update_index_state(
+        {"building": None,
+         "namespaces": [n for n in _known_namespaces(state) if n != namespace]},
+        expected={"building": namespace},
+    )
+    print(f"Aborted build of {namespace}")
+    return namespace
+
+
+def gc() -> List[str]:
+    """Delete every namespace except the live, previous and building ones."""
+    state = read_index_state()
+    keep = {state.get("active") or "", state.get("previous"), state.get("building")}
+    dropped = [n for n in _known_namespaces(state) if n not in keep]
+    for namespace in dropped:
+        _drop_namespace(namespace)
+    if dropped:
+        update_index_state(
+            {"namespaces": [n for n in _known_namespaces(state) if n not in dropped]},
+            expected={"active": state.get("active"), "building": state.get("building")},
+        )
+        print(f"Garbage collected: {', '.join(n or '(default)' for n in dropped)}")
+    return dropped
+
+
+def reindex(tools: Iterable[dict], collect_garbage: bool = True,
+            skip_validation: bool = False, max_workers: int = REINDEX_MAX_WORKERS,
+            **upsert_kwargs) -> dict:
+    """Rebuild the whole index into a new namespace and switch to it once validated.
+
+    Uses fewer upsert workers than a plain ingest so live queries keep
+    their latency during the rebuild. On any failure the new namespace is
+    dropped and the live one is untouched.
+    """
+    namespace = start_build()
+    probes: List[dict] = []
+    try:
+        with trace("reindex", namespace=namespace):
+            report = sync_tools(_sampled(tools, REINDEX_VALIDATE_SAMPLE, probes),
+                                namespace=namespace, force=True,
+                                max_workers=max_workers, **upsert_kwargs)
+            expected = report["seen"]
+            if not expected:
+                raise ReindexError("the catalog is empty; keeping the live index")
+            if not skip_validation:
+                report["validation"] = validate(namespace, expected, probes)
+                print(f"Validation of {namespace}: {report['validation']}")
+                if not report["validation"]["ok"]:
+                    raise ReindexError(
+                        f"{namespace} failed validation: "
+                        + "; ".join(report["validation"]["problems"]))
+            report["generation"] = cutover(namespace)["generation"]
+    except BaseException:
+        abort_build()
+        raise
+    if collect_garbage:
+        report["dropped"] = gc()
+    return report
+
+
+def print_status():
+    state = read_index_state()
+    print(f"Live:      {state.get('active') or '(default)'}")
+    previous = state.get("previous")
+    print(f"Previous:  {'-' if previous is None else previous or '(default)'}")
+    print(f"Building:  {state.get('building') or '-'}")
+    print(f"Known:     {', '.join(n or '(default)' for n in _known_namespaces(state))}")
+    print(f"Generation {state.get('generation', 0)}, updated {state.get('updated_at', '-')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild the tool index without disturbing live queries")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build a new namespace and switch to it")
+    build.add_argument("--from-snapshot", metavar="PATH", nargs="?", const=SNAPSHOT_PATH,
+                       help="Index tools from a local catalog snapshot instead of Galaxy")
+    build.add_argument("--no-enrich", action="store_true",
+                       help="Skip fetching help text, EDAM terms and formats")
+    build.add_argument("--skip-validation", action="store_true")
+    build.add_argument("--no-gc", action="store_true",
+                       help="Keep namespaces older than the previous one")
+    commands.add_parser("status", help="Show the live, previous and building namespaces")
+    commands.add_parser("rollback", help="Switch back to the previous namespace")
+    commands.add_parser("gc", help="Delete namespaces that are neither live nor previous")
+    commands.add_parser("abort", help="Drop a build that did not finish")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "build":
+            from src.lib.galaxy import enrich_tools, iter_galaxy_tools, iter_snapshot
+
+            if args.from_snapshot:
+                tools = iter_snapshot(args.from_snapshot)
+            else:
+                tools = iter_galaxy_tools()
+                if not args.no_enrich:
+                    tools = enrich_tools(tools)
+            reindex(tools, collect_garbage=not args.no_gc,
+                    skip_validation=args.skip_validation)
+        elif args.command == "rollback":
+            rollback()
+        elif args.command == "gc":
+            gc()
+        elif args.command == "abort":
+            abort_build()
+        print_status()
+    except ReindexError as e:
+        raise SystemExit(f"Reindex failed: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from src.config.env import (
+    RESPONSE_CACHE,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_MIN_SIMILARITY,
+    RESPONSE_CACHE_MIN_WORDS,
+    RESPONSE_CACHE_TTL_SECONDS,
+)
+from src.rag.cache import normalize_query
+
+
+class ResponseCache:
+    """In-process semantic cache of chat answers, keyed by message embedding.
+
+    Entries expire after `ttl_seconds`, are evicted LRU beyond `max_entries`
+    and are dropped when the tool index generation changes.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+                 min_similarity: float = RESPONSE_CACHE_MIN_SIMILARITY,
+                 min_words: int = RESPONSE_CACHE_MIN_WORDS,
+                 embedder=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.min_similarity = min_similarity
+        self.min_words = min_words
+        self._embedder = embedder
+        self._entries: OrderedDict = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            from src.lib.local_index import get_embedder
+
+            self._embedder = get_embedder()
+        return self._embedder
+
+    def cacheable(self, message: str) -> bool:
+        return len(normalize_query(message).split()) >= self.min_words
+
+    def embed(self, message: str) -> np.ndarray:
+        return self.embedder.embed([normalize_query(message)])[0]
+
+    def _check_generation(self, generation: int):
+        if generation != self._generation:
+            # The tool index changed; cached answers may cite stale tools
+            self._entries.clear()
+            self._generation = generation
+
+    def lookup(self, vector: np.ndarray, model: str, generation: int) -> Optional[dict]:
+        """Return the closest cached entry for this model above the threshold."""
+        with self._lock:
+            self._check_generation(generation)
+            now = time.monotonic()
+            for key in [k for k, e in self._entries.items() if e["expires_at"] < now]:
+                del self._entries[key]
+            keys = [k for k, e in self._entries.items() if e["model"] == model]
+            best = None
+            if keys:
+                scores = np.stack([self._entries[k]["vector"] for k in keys]) @ vector
+                i = int(np.argmax(scores))
+                if scores[i] >= self.min_similarity:
+                    best = keys[i]
+                    self._entries.move_to_end(best)
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry = self._entries[best]
+            return {"answer": entry["answer"], "tool_results": list(entry["tool_results"]),
+                    "similarity": float(scores[i])}
+
+    def store(self, message: str, vector: np.ndarray, model: str, generation: int,
+              answer: str, tool_results: List[dict]):
+        with self._lock:
+            self._check_generation(generation)
+            key = (model, normalize_query(message))
+            self._entries[key] = {
+                "vector": vector,
+                "model": model,
+                "answer": answer,
+                "tool_results": list(tool_results),
+                "expires_at": time.monotonic() + self.ttl_seconds,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self._entries),
+            "evictions": self.evictions,
+        }
+
+
+_cache: Optional[ResponseCache] = None
+_cache_refused = False
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Return the process-wide response cache, or None when it is off.
+
+    It is also off with the hashing embedder, which ignores word order.
+    """
+    global _cache, _cache_refused
+    if RESPONSE_CACHE == "off" or _cache_refused:
+        return None
+    with _cache_lock:
+        if _cache is None and not _cache_refused:
+            from src.lib.local_index import get_embedder
+
+            embedder = get_embedder()
+            if not getattr(embedder, "semantic", False):
+                print(f"Response cache disabled: {embedder.name} embeddings are not "
+                      "semantic; set LOCAL_EMBEDDER=openai to use it")
+                _cache_refused = True
+                return None
+            _cache = ResponseCache(embedder=embedder)
+        return _cache
+
+
+def response_cache_stats() -> dict:
+    cache = get_response_cache()
+    return cache.stats() if cache is not None else {}
@@ -0,0 +1,300 @@
+"""HTTP service for the Galaxy tool recommender.
+
+Serves many chat sessions from one asyncio event loop per worker:
+
+    POST /chat    {"message": ..., "session_id": ..., "stream": true}
+    GET  /search  ?q=...&top_k=5&mode=hybrid
+    GET  /health
+    GET  /metrics  stage timings in the Prometheus text format
+
+Streamed chat responses are newline-delimited JSON: one line per
+`on_event` event (token, tool_call, tool_result), then a `done` line with
+the full reply.
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import multiprocessing
+import uuid
+import weakref
+from typing import Optional
+
+from aiohttp import web
+
+from src.config.env import (
+    SEARCH_MODE,
+    SERVER_CHAT_TIMEOUT_SECONDS,
+    SERVER_HOST,
+    SERVER_MAX_CONCURRENT_CHATS,
+    SERVER_PORT,
+    SERVER_QUEUE_TIMEOUT_SECONDS,
+    SERVER_SEARCH_TIMEOUT_SECONDS,
+)
+
+MAX_TOP_K = 50
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, default=str)
+
+
+def _json_response(obj, status: int = 200, **kwargs) -> web.Response:
+    return web.json_response(obj, status=status, dumps=_dumps, **kwargs)
+
+
+class ChatService:
+    """Admission control and per-session ordering around `arun_chat`.
+
+    At most `max_concurrent` turns run at once; a request waits up to
+    `queue_timeout` seconds for a slot and is then rejected with 503.
+    Turns of the same session run one after another, so each one sees
+    the history written by the previous one.
+    """
+
+    def __init__(self, max_concurrent: int = SERVER_MAX_CONCURRENT_CHATS,
+                 queue_timeout: float = SERVER_QUEUE_TIMEOUT_SECONDS,
+                 chat_timeout: float = SERVER_CHAT_TIMEOUT_SECONDS):
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.chat_timeout = chat_timeout
+        self.active = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._slots = asyncio.Semaphore(max_concurrent)
+        # Locks disappear with the last request that holds them
+        self._session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = \
+            weakref.WeakValueDictionary()
+
+    def session_lock(self, session_id: str) -> asyncio.Lock:
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._session_locks[session_id] = lock
+        return lock
+
+    async def admit(self) -> bool:
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        self._slots.release()
+
+    async def run(self, session_id: str, on_event=None, **chat_kwargs) -> str:
+        """Run one turn; the caller must hold an admission slot."""
+        from src.chatbot import arun_chat
+
+        async with self.session_lock(session_id):
+            try:
+                return await asyncio.wait_for(
+                    arun_chat(on_event=on_event, session_id=session_id, **chat_kwargs),
+                    timeout=self.chat_timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "capacity": self.max_concurrent,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "sessions": len(self._session_locks),
+        }
+
+
+def _chat_kwargs(body: dict) -> dict:
+    return {
+        "user_input": body["message"],
+        "model": body.get("model"),
+        "stream": bool(body.get("stream", True)),
+        "use_cache": bool(body.get("use_cache", True)),
+    }
+
+
+async def _read_chat_request(request: web.Request) -> Optional[dict]:
+    try:
+        body = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    if not isinstance(body, dict) or not str(body.get("message") or "").strip():
+        return None
+    return body
+
+
+async def handle_chat(request: web.Request) -> web.StreamResponse:
+    service: ChatService = request.app["chat_service"]
+    body = await _read_chat_request(request)
+    if body is None:
+        return _json_response({"error": "expected a JSON body with a non-empty 'message'"},
+                              status=400)
+    session_id = str(body.get("session_id") or uuid.uuid4().hex)
+    kwargs = _chat_kwargs(body)
+
+    if not await service.admit():
+        return _json_response({"error": "server busy, retry later"}, status=503,
+                              headers={"Retry-After": "1"})
+    try:
+        if not kwargs["stream"]:
+            try:
+                reply = await service.run(session_id, **kwargs)
+            except asyncio.TimeoutError:
+                return _json_response({"error": "chat timed out", "session_id": session_id},
+                                      status=504)
+            return _json_response({"session_id": session_id, "reply": reply})
+        return await _stream_chat(request, service, session_id, kwargs)
+    finally:
+        service.release()
+
+
+async def _stream_chat(request: web.Request, service: ChatService,
+                       session_id: str, kwargs: dict) -> web.StreamResponse:
+    response = web.StreamResponse(
+        headers={"Content-Type": "application/x-ndjson", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+
+    events: asyncio.Queue = asyncio.Queue()
+
+    def on_event(event: dict):
+        # Stage timings are internal; they are served by /metrics only
+        if event.get("type") != "span":
+            events.put_nowait(event)
+
+    task = asyncio.create_task(service.run(session_id, on_event=on_event, **kwargs))
+    # A None marks the end of the turn, whatever its outcome
+    task.add_done_callback(lambda _: events.put_nowait(None))
+
+    async def write(obj: dict):
+        await response.write((_dumps(obj) + "\n").encode("utf-8"))
+
+    try:
+        await write({"type": "session", "session_id": session_id})
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            await write(event)
+        try:
+            await write({"type": "done", "reply": task.result()})
+        except asyncio.TimeoutError:
+            await write({"type": "error", "error": "chat timed out"})
+        except Exception as exc:
+            await write({"type": "error", "error": str(exc)})
+        await response.write_eof()
+    except (ConnectionResetError, asyncio.CancelledError):
+        # The client went away; stop spending tokens on its turn
+        task.cancel()
+        raise
+    return response
+
+
+async def handle_search(request: web.Request) -> web.Response:
+    from src.tools.toolSearch import atool_search_payload
+
+    query = request.query.get("q", "").strip()
+    if not query:
+        return _json_response({"error": "missing query parameter 'q'"}, status=400)
+    try:
+        top_k = max(1, min(int(request.query.get("top_k", "5")), MAX_TOP_K))
+    except ValueError:
+        return _json_response({"error": "top_k must be an integer"}, status=400)
+    mode = request.query.get("mode", SEARCH_MODE)
+    try:
+        payload = await asyncio.wait_for(
+            atool_search_payload(query, top_k=top_k, mode=mode),
+            timeout=SERVER_SEARCH_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        return _json_response({"error": "search timed out"}, status=504)
+    return _json_response({"query": query, **payload})
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    return _json_response({"status": "ok", **request.app["chat_service"].stats()})
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    from src.utils.tracing import prometheus_text
+
+    service: ChatService = request.app["chat_service"]
+    lines = [
+        "# TYPE toolrec_chats_active gauge",
+        f"toolrec_chats_active {service.active}",
+        "# TYPE toolrec_chats_rejected_total counter",
+        f"toolrec_chats_rejected_total {service.rejected}",
+        "# TYPE toolrec_chats_timeouts_total counter",
+        f"toolrec_chats_timeouts_total {service.timeouts}",
+    ]
+    body = prometheus_text() + "\n".join(lines) + "\n"
+    return web.Response(body=body.encode("utf-8"),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def _on_startup(app: web.Application):
+    # Pay for the LangChain/OpenAI import before the first request, not during it
+    importlib.import_module("src.chatbot")
+
+
+async def _on_cleanup(app: web.Application):
+    from src.utils.memory import flush_messages
+
+    await asyncio.to_thread(flush_messages)
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app["chat_service"] = ChatService()
+    app.router.add_post("/chat", handle_chat)
+    app.router.add_get("/search", handle_search)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    app.on_startup.append(_on_startup)
+    app.on_cleanup.append(_on_cleanup)
+    return app
+
+
+def serve(host: str = SERVER_HOST, port: int = SERVER_PORT, reuse_port: bool = False):
+    web.run_app(create_app(), host=host, port=port, reuse_port=reuse_port,
+                print=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve the Galaxy tool recommender over HTTP")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Worker processes sharing the port (SO_REUSEPORT)")
+    args = parser.parse_args()
+
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} worker(s)")
+    if args.workers <= 1:
+        serve(args.host, args.port)
+        return
+
+    # Each worker has its own event loop and clients; the kernel spreads
+    # incoming connections across them
+    workers = [
+        multiprocessing.Process(target=serve, args=(args.host, args.port, True),
+                                name=f"server-worker-{i}")
+        for i in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+
+
+if __name__ == "__main__":
+    main()
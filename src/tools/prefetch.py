@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, List, Optional
+
+from src.config.env import (
+    PREFETCH_MAX_WORKERS,
+    PREFETCH_MIN_SIMILARITY,
+    PREFETCH_TOP_K,
+    SEARCH_MODE,
+)
+from src.rag.cache import normalize_query
+from src.tools.toolSearch import search_hits
+
+# Words that say "find me a tool" rather than what the tool should do
+STOPWORDS = frozenset("""
+a an and any are can could do does for from galaxy have hello hi how i in is it
+looking me my need of on or please recommend search should some suggest that the
+there this to tool tools use want what which with would you
+""".split())
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"started": 0, "hits": 0, "misses": 0, "unused": 0, "seconds_saved": 0.0}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=PREFETCH_MAX_WORKERS, thread_name_prefix="prefetch")
+        return _executor
+
+
+def _record(**deltas):
+    with _stats_lock:
+        for key, value in deltas.items():
+            _stats[key] += value
+
+
+def content_words(text: str) -> frozenset:
+    return frozenset(w for w in normalize_query(text).split() if w not in STOPWORDS)
+
+
+def similarity(a: str, b: str) -> float:
+    """Jaccard similarity of the content words of two queries."""
+    words_a, words_b = content_words(a), content_words(b)
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+
+class Prefetch:
+    """A speculative tool search on the user's message, started before the LLM call.
+
+    `take` hands the result to a tool call whose query is similar enough,
+    waiting for the search if it is still running. `close` ends the turn
+    and counts a prefetch nobody used.
+    """
+
+    def __init__(self, query: str, top_k: int = PREFETCH_TOP_K, mode: str = SEARCH_MODE,
+                 min_similarity: float = PREFETCH_MIN_SIMILARITY):
+        self.query = query
+        self.top_k = top_k
+        self.min_similarity = min_similarity
+        self.used = False
+        self.search_seconds: Optional[float] = None
+        self.future: Future = _get_executor().submit(self._search, mode)
+        _record(started=1)
+
+    def _search(self, mode: str) -> List[Any]:
+        started = time.perf_counter()
+        try:
+            return search_hits(self.query, top_k=self.top_k, mode=mode)
+        finally:
+            self.search_seconds = time.perf_counter() - started
+
+    def matches(self, query: str, top_k: int) -> bool:
+        return top_k <= self.top_k and similarity(query, self.query) >= self.min_similarity
+
+    def _hit(self, results: List[Any], waited: float, top_k: int) -> List[Any]:
+        self.used = True
+        # The search ran while the model was thinking; only the wait was paid
+        _record(hits=1, seconds_saved=max(0.0, (self.search_seconds or 0.0) - waited))
+        return list(results)[:top_k]
+
+    def take(self, query: str, top_k: int) -> Optional[List[Any]]:
+        """Prefetched hits for `query`, or None if it is not similar enough or failed."""
+        if not self.matches(query, top_k):
+            _record(misses=1)
+            return None
+        started = time.perf_counter()
+        try:
+            results = self.future.result()
+        except Exception:
+            _record(misses=1)
+            return None
+        return self._hit(results, time.perf_counter() - started, top_k)
+
+    async def atake(self, query: str, top_k: int) -> Optional[List[Any]]:
+        """Async version of take."""
+        if not self.matches(query, top_k):
+            _record(misses=1)
+            return None
+        started = time.perf_counter()
+        try:
+            results = await asyncio.wrap_future(self.future)
+        except Exception:
+            _record(misses=1)
+            return None
+        return self._hit(results, time.perf_counter() - started, top_k)
+
+    def close(self):
+        if not self.used:
+            self.future.cancel()
+            _record(unused=1)
+
+
+def prefetch_stats() -> dict:
+    """Prefetch counters: started, hits, misses, unused, hit rate and seconds saved."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["hit_rate"] = round(stats["hits"] / stats["started"], 4) if stats["started"] else 0.0
+    stats["seconds_saved"] = round(stats["seconds_saved"], 4)
+    return stats
@@ -1,7 +1,19 @@
 import json
-from typing import Any
+from typing import Any, List, Optional, Sequence
 
-from src.rag.query import query_tools
+from src.config.env import (
+    SEARCH_MODE,
+    TOOL_RESULT_DESCRIPTION_CHARS,
+    TOOL_RESULT_FIELDS,
+)
+from src.rag.query import (
+    ahybrid_query_tools,
+    aquery_tools,
+    hybrid_query_tools,
+    hybrid_query_tools_batch,
+    query_tools,
+    query_tools_batch,
+)
 
 
 def _to_dict(obj: Any) -> dict:
@@ -23,26 +35,119 @@ def _to_dict(obj: Any) -> dict:
     return {}
 
 
-def tool_search(query: str, top_k: int = 5) -> str:
-    """Search Galaxy tools via vector embeddings and return JSON text."""
-    results: Any = query_tools(query=query, top_k=top_k)
+def short_id(tool_id: Optional[str]) -> Optional[str]:
+    """Tool Shed id without host and version: `owner/repo/tool`; plain ids unchanged."""
+    parts = (tool_id or "").strip("/").split("/")
+    if "repos" in parts and len(parts) >= parts.index("repos") + 4:
+        return "/".join(parts[parts.index("repos") + 1:-1])
+    return tool_id
 
-    formatted = []
+
+def _truncate(text: Optional[str], limit: int) -> Optional[str]:
+    text = " ".join((text or "").split())
+    if not limit or len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + "…"
+
+
+def _field_value(field: str, meta: dict, result: Any, max_description: int) -> Any:
+    if field == "id":
+        return short_id(meta.get("id") or getattr(result, "id", None))
+    if field == "description":
+        return _truncate(meta.get("description") or getattr(result, "data", None),
+                         max_description)
+    if field == "score":
+        score = getattr(result, "score", None)
+        return round(score, 4) if isinstance(score, (int, float)) else None
+    return meta.get(field)
+
+
+def build_payload(results: Any, fields: Sequence[str] = TOOL_RESULT_FIELDS,
+                  max_description: int = TOOL_RESULT_DESCRIPTION_CHARS) -> dict:
+    """Tabular view of search hits: {"fields": [...], "rows": [[...], ...]}.
+
+    Only `fields` are kept and descriptions are cut to `max_description`
+    characters. Versions of the same tool collapse into the best-ranked
+    row, whose `version` cell then lists every version found.
+    """
+    fields = list(fields)
+    rows: List[list] = []
+    seen: dict = {}
     for result in results:
         meta = _to_dict(getattr(result, "metadata", None))
-        data_text = getattr(result, "data", None)
+        tool_id = meta.get("id") or getattr(result, "id", None)
+        key = short_id(tool_id) if tool_id else (meta.get("owner"), meta.get("name"))
+        version = meta.get("version")
+        if key in seen:
+            versions = seen[key]
+            if version and version not in versions:
+                versions.append(version)
+            continue
+        seen[key] = [version] if version else []
+        rows.append([_field_value(f, meta, result, max_description) for f in fields])
+
+    if "version" in fields:
+        column = fields.index("version")
+        for row, versions in zip(rows, seen.values()):
+            if len(versions) > 1:
+                row[column] = versions
+    return {"fields": fields, "rows": rows}
+
+
+def encode_payload(payload: dict) -> str:
+    """Compact JSON text of a payload, as the model receives it."""
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+def format_results(results: Any) -> str:
+    """Render search hits as the text returned to the model."""
+    return encode_payload(build_payload(results))
+
+
+def search_hits(query: str, top_k: int = 5, mode: str = SEARCH_MODE) -> List[Any]:
+    """Search Galaxy tools and return the raw hits (see tool_search)."""
+    if mode == "hybrid":
+        return hybrid_query_tools(query=query, top_k=top_k)
+    return query_tools(query=query, top_k=top_k)
+
+
+def tool_search_payload(query: str, top_k: int = 5, mode: str = SEARCH_MODE) -> dict:
+    """Search Galaxy tools and return the structured payload (see build_payload)."""
+    return build_payload(search_hits(query, top_k=top_k, mode=mode))
+
+
+def tool_search(query: str, top_k: int = 5, mode: str = SEARCH_MODE) -> str:
+    """Search Galaxy tools and return compact JSON text.
+
+    `mode` is "hybrid" (BM25 + vector, fused) or "vector" (embeddings only).
+    """
+    return encode_payload(tool_search_payload(query, top_k=top_k, mode=mode))
+
+
+async def atool_search_payload(query: str, top_k: int = 5, mode: str = SEARCH_MODE) -> dict:
+    """Async version of tool_search_payload."""
+    if mode == "hybrid":
+        results: Any = await ahybrid_query_tools(query=query, top_k=top_k)
+    else:
+        results = await aquery_tools(query=query, top_k=top_k)
+
+    return build_payload(results)
+
+
+async def atool_search(query: str, top_k: int = 5, mode: str = SEARCH_MODE) -> str:
+    """Async version of tool_search."""
+    return encode_payload(await atool_search_payload(query, top_k=top_k, mode=mode))
 
-        formatted.append(
-            {
-                "name": meta.get("name"),
-                "description": data_text,
-                "version": meta.get("version"),
-                "owner": meta.get("owner"),
-            }
-        )
 
-    # Return as plain string representation (not JSON) per request
-    return str(formatted)
+def tool_search_batch(queries: List[str], top_k: int = 5, mode: str = SEARCH_MODE) -> List[str]:
+    """Run several tool searches at once; results are in the order of `queries`."""
+    if mode == "hybrid":
+        batches = hybrid_query_tools_batch(queries, top_k=top_k)
+    else:
+        batches = query_tools_batch(queries, top_k=top_k)
+    return [format_results(results) for results in batches]
 
 
-__all__ = ["tool_search"]
+__all__ = ["tool_search", "atool_search", "tool_search_batch",
+           "tool_search_payload", "atool_search_payload", "search_hits",
+           "build_payload", "encode_payload", "format_results"]
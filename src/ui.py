@@ -8,20 +8,22 @@ when the agent calls tools.
 from __future__ import annotations
 
 import argparse
-import ast
-import json
-from typing import Optional
+import importlib
+import subprocess
+from typing import Callable, Optional
 import sys
+import time
 
 from prompt_toolkit import PromptSession
 from prompt_toolkit.completion import WordCompleter
 from prompt_toolkit.history import InMemoryHistory
 from rich.console import Console
+from rich.table import Table
 from rich.theme import Theme
-from rich.syntax import Syntax
-
-from src.chatbot import run_chat
 
+# LangChain/OpenAI (src.chatbot) is imported on the first chat turn, and
+# MongoDB, Galaxy and Upstash clients are created on first use
+from src.utils.memory import DEFAULT_CONVERSATION_ID
 
 THEME = Theme({
     "you": "bold bright_cyan",
@@ -64,33 +66,118 @@ def _erase_last_line():
         pass
 
 
-def _format_tool_data(raw: str) -> str:
-    """Pretty-print tool data. Accepts JSON or Python-literal strings."""
-    text = raw or ""
-    # Try JSON first
-    try:
-        obj = json.loads(text)
-        return json.dumps(obj, indent=2)
-    except Exception:
-        pass
-    # Try Python literal (e.g., list/dict repr)
-    try:
-        obj = ast.literal_eval(text)
-        return json.dumps(obj, indent=2)
-    except Exception:
-        pass
-    # Fallback to raw
-    return text
+def _print_token(text: str):
+    """Append streamed reply text to the current line, without markup parsing."""
+    CONSOLE.print(text, end="", markup=False, highlight=False, soft_wrap=True)
+
+
+def _tool_data_table(data: Optional[dict]):
+    """Render a structured tool payload ({"fields", "rows"}) as a table, or None."""
+    if not isinstance(data, dict) or "fields" not in data:
+        return None
+    table = Table(show_header=True, header_style="data", expand=False)
+    for field in data["fields"]:
+        table.add_column(str(field), overflow="fold")
+    for row in data.get("rows") or []:
+        table.add_row(*(", ".join(map(str, cell)) if isinstance(cell, list)
+                        else "" if cell is None else str(cell) for cell in row))
+    return table
+
+
+def _run_chat(*args, **kwargs) -> str:
+    """Import the chat engine on first use and run one turn."""
+    from src.chatbot import run_chat
 
+    return run_chat(*args, **kwargs)
 
-def chat_loop(model: Optional[str] = None):
+
+def profile_startup():
+    """Time each import and connection the chatbot needs and print a report."""
+    steps: list[tuple[str, float, str]] = []
+
+    def step(label: str, fn: Callable[[], object]):
+        started = time.perf_counter()
+        try:
+            fn()
+            status = "ok"
+        except subprocess.CalledProcessError as exc:
+            status = f"failed: exit code {exc.returncode}"
+        except Exception as exc:
+            status = f"failed: {exc}"
+        steps.append((label, time.perf_counter() - started, status))
+
+    # This process has already imported src.ui, so time a cold start in a fresh one
+    step("start Python and import src.ui (prompt_toolkit, rich)",
+         lambda: subprocess.run([sys.executable, "-c", "import src.ui"], check=True))
+    step("import src.chatbot (LangChain, OpenAI)",
+         lambda: importlib.import_module("src.chatbot"))
+    step("build LLM client", lambda: importlib.import_module(
+        "src.chatbot").build_llm())
+
+    def _mongo():
+        from src.lib.db import get_client
+
+        get_client().admin.command("ping")
+
+    def _backend():
+        from src.lib.vectorstore import get_backend
+
+        backend = get_backend()
+        # Upstash clients are created on first access
+        getattr(backend, "index", None)
+
+    def _galaxy():
+        from src.lib.galaxy import get_gi
+
+        get_gi()
+
+    step("connect MongoDB (ping)", _mongo)
+    step("create vector backend", _backend)
+    step("create Galaxy client", _galaxy)
+
+    table = Table(title="Startup profile")
+    table.add_column("Step")
+    table.add_column("Seconds", justify="right")
+    table.add_column("Status")
+    for label, seconds, status in steps:
+        table.add_row(label, f"{seconds:.3f}", status)
+    table.add_row("total", f"{sum(s[1] for s in steps):.3f}", "")
+    CONSOLE.print(table)
+
+
+def print_stats():
+    """Rolling p50/p95 per stage of the turns run so far (see src/utils/tracing.py)."""
+    from src.utils.tracing import stage_stats
+
+    stats = stage_stats()
+    if not stats:
+        CONSOLE.print("No timings yet.", style="accent")
+        return
+    table = Table(title="Stage timings (recent spans)", title_justify="left")
+    table.add_column("stage")
+    table.add_column("count", justify="right")
+    table.add_column("p50 ms", justify="right")
+    table.add_column("p95 ms", justify="right")
+    table.add_column("mean ms", justify="right")
+    table.add_column("totals", style="accent")
+    for stage, row in stats.items():
+        totals = ", ".join(f"{k}={v}" for k, v in row["totals"].items())
+        table.add_row(stage, str(row["count"]), f"{row['p50_ms']:.1f}",
+                      f"{row['p95_ms']:.1f}", f"{row['mean_ms']:.1f}", totals)
+    CONSOLE.print(table)
+
+
+def chat_loop(model: Optional[str] = None, session_id: str = DEFAULT_CONVERSATION_ID,
+              stream: bool = True):
     commands = WordCompleter(
-        ["/exit", "/quit", "/help", "/clear", "/cls", "/color", "/mono"], ignore_case=True)
+        ["/exit", "/quit", "/help", "/clear", "/cls", "/color", "/mono", "/stats"],
+        ignore_case=True)
     session = PromptSession(history=InMemoryHistory())
 
     CONSOLE.rule("Galaxy Tool Recommender", style="accent")
     CONSOLE.print(
         "Type your question. Use /exit or Ctrl+D to quit. Use /clear to clear screen.")
+    CONSOLE.print(f"Session: {session_id}", style="accent")
 
     while True:
         try:
@@ -123,38 +210,66 @@ def chat_loop(model: Optional[str] = None):
             continue
         if lowered == "/help":
             CONSOLE.print(
-                "Enter a message for the agent. /exit quits. /clear clears the screen.")
+                "Enter a message for the agent. /exit quits. /clear clears the screen. "
+                "/stats shows stage timings.")
+            continue
+        if lowered == "/stats":
+            print_stats()
             continue
 
         # Remove the raw input line so only the colored output remains
         _erase_last_line()
         _print_line("You:", user_text, style="you", icon=YOU_ICON)
 
+        # True while a streamed "Agent:" line is open on screen
+        streaming = {"open": False}
+
+        def end_stream():
+            if streaming["open"]:
+                CONSOLE.print()
+                streaming["open"] = False
+
         try:
             def on_event(ev: dict):
+                if ev.get("type") == "span":
+                    return  # collected for /stats
+                if ev.get("type") == "token":
+                    if not streaming["open"]:
+                        CONSOLE.print(f"[agent]Agent:[/] {AGENT_ICON} ", end="")
+                        streaming["open"] = True
+                    _print_token(ev.get("text", ""))
+                    return
+                end_stream()
                 if ev.get("type") == "tool_call":
                     name = ev.get("name")
                     _print_line("Calling tool:",
                                 f"{name}...", style="tool", icon=TOOL_ICON)
                 elif ev.get("type") == "tool_result":
                     name = ev.get("name")
-                    data = _format_tool_data(str(ev.get("result", "")))
+                    if ev.get("cached"):
+                        name = f"{name} (cached)"
                     # Show data BEFORE agent's final response
                     _print_line(
                         "Tool data:", f"{name} →", style="data", icon=DATA_ICON)
-                    # Syntax-highlight JSON if possible
-                    try:
-                        syn = Syntax(
-                            data, "json", theme="ansi_dark", line_numbers=False)
-                        CONSOLE.print(syn)
-                    except Exception:
-                        CONSOLE.print(data)
-
-            reply = run_chat(user_text, model=model, on_event=on_event)
+                    # Structured results come straight from the event
+                    table = _tool_data_table(ev.get("data"))
+                    if table is not None:
+                        CONSOLE.print(table)
+                    else:
+                        CONSOLE.print(str(ev.get("result", "")),
+                                      markup=False, highlight=False)
+
+            reply = _run_chat(user_text, model=model, on_event=on_event,
+                             session_id=session_id, stream=stream)
         except Exception as exc:  # pragma: no cover
+            end_stream()
             _print_line("Error", str(exc))
             continue
 
+        if streaming["open"]:
+            # The reply has already been printed token by token
+            end_stream()
+            continue
         _print_line("Agent:", reply.strip(
         ) if reply else "(no response)", style="agent", icon=AGENT_ICON)
 
@@ -164,9 +279,23 @@ def main():
         description="Chat with the Galaxy tool recommender")
     parser.add_argument(
         "--model", help="Override the model name for the session")
+    parser.add_argument(
+        "--session", default=DEFAULT_CONVERSATION_ID,
+        help="Conversation id; reuse it to resume a conversation")
+    parser.add_argument(
+        "--no-stream", action="store_true",
+        help="Print the agent reply only once it is complete")
+    parser.add_argument(
+        "--profile-startup", action="store_true",
+        help="Report import and connection times, then exit")
     args = parser.parse_args()
 
-    chat_loop(model=args.model)
+    if args.profile_startup:
+        profile_startup()
+        return
+
+    chat_loop(model=args.model, session_id=args.session,
+              stream=not args.no_stream)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,190 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, List, Optional, Sequence, Tuple
+
+from src.config.env import (
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_SUMMARY_MAX_WORDS,
+    CONTEXT_SUMMARY_MODEL,
+    CONTEXT_TRIM_RATIO,
+    HISTORY_MAX_MESSAGES,
+)
+from src.utils.memory import (
+    DEFAULT_CONVERSATION_ID,
+    aget_messages,
+    aget_summary,
+    asave_summary,
+    estimate_tokens,
+    get_messages,
+    get_summary,
+    save_summary,
+)
+from src.utils.tracing import span
+
+# Cap on each message's share of the summarization prompt
+SUMMARY_INPUT_CHARS = 2000
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an "
+    "assistant that recommends Galaxy bioinformatics tools. Update the summary "
+    "with the new messages. Keep the user's goals, data types, constraints and "
+    "the tool names/ids already recommended or rejected. Reply with the updated "
+    "summary only, in at most {max_words} words."
+)
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """The tiktoken encoding, or None; loaded on first use, since a cold cache downloads it."""
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:  # not installed, or the encoding can't be loaded offline
+        return None
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: Optional[str]) -> int:
+    """Tokens in a message: tiktoken when available, else a character estimate."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    # +4 covers the role and separators the chat format adds per message
+    return len(encoding.encode(text or "", disallowed_special=())) + 4
+
+
+def _utc(value: Any) -> Optional[datetime]:
+    """MongoDB returns naive UTC datetimes, buffered messages carry aware ones."""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _unsummarized(docs: List[dict], summary_doc: Optional[dict]) -> List[dict]:
+    """Messages newer than the last one folded into the summary."""
+    if not summary_doc:
+        return docs
+    covered_id = summary_doc.get("covered_id")
+    for i, doc in enumerate(docs):
+        if doc.get("id") == covered_id:
+            return docs[i + 1:]
+    covered_at = _utc(summary_doc.get("covered_at"))
+    return [d for d in docs
+            if covered_at is None or (_utc(d.get("created_at")) or covered_at) > covered_at]
+
+
+def split_history(docs: List[dict], max_tokens: int = CONTEXT_MAX_TOKENS,
+                  max_messages: int = HISTORY_MAX_MESSAGES,
+                  trim_ratio: float = CONTEXT_TRIM_RATIO) -> Tuple[List[dict], List[dict]]:
+    """Split unsummarized messages (oldest first) into (to_summarize, to_keep).
+
+    Nothing is folded while the history fits the budget. Once it overflows,
+    only the newest messages within `trim_ratio` of the budget are kept, so
+    the next summarization happens only after the history has grown back
+    to the full budget.
+    """
+    tokens = sum(count_tokens(d.get("content")) for d in docs)
+    over_messages = bool(max_messages) and len(docs) >= max_messages
+    if tokens <= max_tokens and not over_messages:
+        return [], docs
+
+    keep_tokens = max_tokens * trim_ratio
+    keep_messages = int(max_messages * trim_ratio) if max_messages else 0
+    kept = 0
+    used = 0
+    for doc in reversed(docs):
+        used += count_tokens(doc.get("content"))
+        if kept and (used > keep_tokens or (keep_messages and kept >= keep_messages)):
+            break
+        kept += 1
+    # Always keep the newest message (the user's current question)
+    kept = max(kept, 1)
+    return docs[:-kept], docs[-kept:]
+
+
+def _summary_messages(summary: Optional[str], docs: Sequence[dict]) -> list:
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    lines = [f"{d.get('role')}: {(d.get('content') or '')[:SUMMARY_INPUT_CHARS]}"
+             for d in docs]
+    return [
+        SystemMessage(content=SUMMARY_PROMPT.format(
+            max_words=CONTEXT_SUMMARY_MAX_WORDS)),
+        HumanMessage(content=(
+            f"Current summary:\n{summary or '(none)'}\n\n"
+            "New messages:\n" + "\n".join(lines))),
+    ]
+
+
+def _summary_llm(llm: Any = None):
+    if llm is not None:
+        return llm
+    from src.lib.llm import get_llm
+
+    return get_llm(CONTEXT_SUMMARY_MODEL, 0)
+
+
+def summarize(summary: Optional[str], docs: Sequence[dict], llm: Any = None) -> str:
+    """Fold `docs` into `summary` with one LLM call."""
+    with span("summary", messages=len(docs)):
+        reply = _summary_llm(llm).invoke(_summary_messages(summary, docs))
+    return (reply.content or "").strip()
+
+
+async def asummarize(summary: Optional[str], docs: Sequence[dict], llm: Any = None) -> str:
+    """Async version of summarize."""
+    with span("summary", messages=len(docs)):
+        reply = await _summary_llm(llm).ainvoke(_summary_messages(summary, docs))
+    return (reply.content or "").strip()
+
+
+def build_context(conversation_id: str = DEFAULT_CONVERSATION_ID,
+                  max_tokens: int = CONTEXT_MAX_TOKENS,
+                  llm: Any = None) -> Tuple[Optional[str], List[dict]]:
+    """Return (summary, recent messages) to send to the model for a conversation.
+
+    The summary is stored with the conversation and only extended when the
+    unsummarized history exceeds `max_tokens`, so most turns cost one extra
+    read and no LLM call. With `max_tokens=0` the plain history window is
+    returned.
+    """
+    with span("history"):
+        if not max_tokens:
+            return None, get_messages(conversation_id)
+        docs = get_messages(conversation_id, max_tokens=0)
+        summary_doc = get_summary(conversation_id)
+    summary = (summary_doc or {}).get("summary")
+    folded, kept = split_history(_unsummarized(docs, summary_doc), max_tokens)
+    if folded:
+        try:
+            summary = summarize(summary, folded, llm=llm)
+            save_summary(conversation_id, summary,
+                         folded[-1].get("id"), folded[-1].get("created_at"))
+        except Exception as e:
+            # Without a fresh summary the turn still fits the budget; retry next turn
+            print(f"Conversation summary update failed: {e}")
+    return summary, kept
+
+
+async def abuild_context(conversation_id: str = DEFAULT_CONVERSATION_ID,
+                         max_tokens: int = CONTEXT_MAX_TOKENS,
+                         llm: Any = None) -> Tuple[Optional[str], List[dict]]:
+    """Async version of build_context."""
+    with span("history"):
+        if not max_tokens:
+            return None, await aget_messages(conversation_id)
+        docs = await aget_messages(conversation_id, max_tokens=0)
+        summary_doc = await aget_summary(conversation_id)
+    summary = (summary_doc or {}).get("summary")
+    folded, kept = split_history(_unsummarized(docs, summary_doc), max_tokens)
+    if folded:
+        try:
+            summary = await asummarize(summary, folded, llm=llm)
+            await asave_summary(conversation_id, summary,
+                                folded[-1].get("id"), folded[-1].get("created_at"))
+        except Exception as e:
+            print(f"Conversation summary update failed: {e}")
+    return summary, kept
@@ -1,27 +1,88 @@
+import asyncio
+import atexit
+import itertools
+import json
+import os
+import threading
+import time
+import zlib
 from datetime import datetime, timezone
+from typing import Optional, Sequence
 from uuid import uuid4
 
-from bson.objectid import ObjectId
-from src.lib.db import db
+from src.config.env import (
+    HISTORY_BUCKET_SIZE,
+    HISTORY_MAX_MESSAGES,
+    HISTORY_MAX_TOKENS,
+    MEMORY_DEAD_LETTER_PATH,
+    MEMORY_FLUSH_INTERVAL,
+    MEMORY_FLUSH_SIZE,
+    MEMORY_MAX_ATTEMPTS,
+    MEMORY_MAX_BACKOFF,
+    MEMORY_MAX_BUFFERED,
+    MEMORY_WRITE_BEHIND,
+    TOOL_PAYLOAD_TTL_SECONDS,
+)
+from src.lib.db import get_async_db, get_collection
 
-messages_collection = db["messages"]
+# Legacy layout: one document per message (see migrate_flat_messages)
+MESSAGES = "messages"
+# Current layout: each document holds up to HISTORY_BUCKET_SIZE messages
+CONVERSATIONS = "conversations"
+# Compressed tool results, referenced from the buckets and expired by TTL
+TOOL_PAYLOADS = "tool_payloads"
+# One rolling summary per conversation, keyed by conversation id
+SUMMARIES = "conversation_summaries"
+
+_COLLECTION_ATTRS = {
+    "messages_collection": MESSAGES,
+    "conversations_collection": CONVERSATIONS,
+    "tool_payloads_collection": TOOL_PAYLOADS,
+    "summaries_collection": SUMMARIES,
+}
+
+
+def __getattr__(name):
+    # The *_collection handles resolve lazily, so importing this module
+    # (e.g. for DEFAULT_CONVERSATION_ID) never connects to MongoDB
+    if name in _COLLECTION_ATTRS:
+        return get_collection(_COLLECTION_ATTRS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+DEFAULT_CONVERSATION_ID = "default"
+
+# Only these fields are needed to rebuild the chat history
+HISTORY_PROJECTION = {"_id": 0, "messages.id": 1, "messages.role": 1,
+                      "messages.content": 1, "messages.created_at": 1}
+
+_indexes_ready = False
+
+
+def ensure_indexes():
+    """Create the bucket and payload indexes once per process."""
+    global _indexes_ready
+    if not _indexes_ready:
+        from pymongo import ASCENDING
+
+        get_collection(CONVERSATIONS).create_index(
+            [("conversation_id", ASCENDING), ("start", ASCENDING)])
+        if TOOL_PAYLOAD_TTL_SECONDS:
+            get_collection(TOOL_PAYLOADS).create_index(
+                "created_at", expireAfterSeconds=TOOL_PAYLOAD_TTL_SECONDS)
+        _indexes_ready = True
 
 
 # --- Helper functions ---
 def add_metadata(message: dict) -> dict:
-    """Add ids and timestamps to a message before saving."""
+    """Add an id and a timestamp to a message before saving."""
     msg = message.copy()
 
     # Stable unique id for clients and logs
     msg.setdefault("id", str(uuid4()))
 
-    # ISO timestamp for external consumers
-    now = datetime.now(timezone.utc)
-    msg.setdefault("createdAt", now.isoformat())
-
-    # Internal fields for Mongo sorting/debugging
-    msg.setdefault("_id", ObjectId())
-    msg.setdefault("created_at", now)
+    # Used for ordering and by the payload TTL index
+    msg.setdefault("created_at", datetime.now(timezone.utc))
 
     return msg
 
@@ -34,33 +95,536 @@ def remove_metadata(message: dict) -> dict:
     return msg
 
 
+def estimate_tokens(text: Optional[str]) -> int:
+    """Cheap token estimate (~4 characters per token plus per-message overhead)."""
+    return len(text or "") // 4 + 4
+
+
+def load_tool_payload(payload_id: str) -> Optional[str]:
+    """Return an archived tool result, or None once it has expired."""
+    doc = get_collection(TOOL_PAYLOADS).find_one({"_id": payload_id}, {"payload": 1})
+    if doc is None:
+        return None
+    return zlib.decompress(doc["payload"]).decode("utf-8")
+
+
+def _bucket_entry(doc: dict) -> dict:
+    """Compact form of a message inside a bucket: no per-message conversation id or empty fields."""
+    return {k: v for k, v in doc.items()
+            if k != "conversation_id" and v not in (None, [], "")}
+
+
+def _write_messages(docs: list[dict]):
+    """Append messages to their conversation buckets in one ordered bulk write.
+
+    Tool results are compressed into the payload archive first, and the
+    bucket keeps only a reference. Raises with `written` set to the number
+    of messages stored before the first failure, or to None when that is
+    unknown (e.g. the connection dropped mid-write), and `rejected_id` set
+    to the message MongoDB refused, if it refused one.
+    """
+    from pymongo import UpdateOne
+
+    ensure_indexes()
+    payload_ops = []
+    payload_ids = []
+    bucket_ops = []
+    for doc in docs:
+        if doc.get("role") == "tool":
+            payload_ids.append(doc["id"])
+            payload_ops.append(UpdateOne(
+                {"_id": doc["id"]},
+                {"$setOnInsert": {
+                    "conversation_id": doc.get("conversation_id"),
+                    "tool_call_id": doc.get("tool_call_id"),
+                    "created_at": doc["created_at"],
+                    "payload": zlib.compress((doc.get("content") or "").encode("utf-8")),
+                }},
+                upsert=True,
+            ))
+            doc = {**doc, "content": None, "payload_id": doc["id"]}
+        bucket_ops.append(UpdateOne(
+            {"conversation_id": doc.get("conversation_id"),
+             "count": {"$lt": HISTORY_BUCKET_SIZE}},
+            {"$push": {"messages": _bucket_entry(doc)},
+             "$inc": {"count": 1},
+             "$max": {"end": doc["created_at"]},
+             "$setOnInsert": {"start": doc["created_at"]}},
+            upsert=True,
+        ))
+
+    if payload_ops:
+        try:
+            # Idempotent upserts, so a retried batch never duplicates payloads
+            get_collection(TOOL_PAYLOADS).bulk_write(payload_ops, ordered=False)
+        except Exception as e:
+            write_errors = _write_errors(e)
+            e.written = 0  # no bucket was touched yet
+            e.rejected_id = payload_ids[write_errors[0]["index"]] if write_errors else None
+            raise
+    try:
+        get_collection(CONVERSATIONS).bulk_write(bucket_ops, ordered=True)
+    except Exception as e:
+        write_errors = _write_errors(e)
+        e.written = write_errors[0]["index"] if write_errors else None
+        e.rejected_id = docs[e.written]["id"] if write_errors else None
+        raise
+
+
+def _write_errors(error: Exception) -> list:
+    """Per-operation errors of a BulkWriteError; empty for transport failures."""
+    return (getattr(error, "details", None) or {}).get("writeErrors") or []
+
+
+def _stored_message_ids(docs: list[dict]) -> set:
+    """Ids of `docs` that are already in their conversation's buckets."""
+    wanted = {d["id"] for d in docs}
+    stored = set()
+    for conversation_id in {d.get("conversation_id") for d in docs}:
+        oldest = min(d["created_at"] for d in docs if d.get("conversation_id") == conversation_id)
+        # A message lands in a bucket whose `end` is at least its created_at
+        cursor = get_collection(CONVERSATIONS).find(
+            {"conversation_id": conversation_id, "end": {"$gte": oldest}},
+            {"_id": 0, "messages.id": 1})
+        for bucket in cursor:
+            stored.update(m.get("id") for m in bucket.get("messages") or []
+                          if m.get("id") in wanted)
+    return stored
+
+
+def _dead_letter(docs: list[dict]):
+    """Append messages MongoDB keeps rejecting to MEMORY_DEAD_LETTER_PATH."""
+    print(f"MongoDB rejected {len(docs)} messages {MEMORY_MAX_ATTEMPTS} times; "
+          f"saved to {MEMORY_DEAD_LETTER_PATH}")
+    try:
+        os.makedirs(os.path.dirname(MEMORY_DEAD_LETTER_PATH) or ".", exist_ok=True)
+        with open(MEMORY_DEAD_LETTER_PATH, "a", encoding="utf-8") as fh:
+            fh.writelines(json.dumps(d, default=str) + "\n" for d in docs)
+    except OSError as e:
+        print(f"Dead-letter write failed, {len(docs)} messages lost: {e}")
+
+
+class MessageBuffer:
+    """Write-behind buffer for chat messages.
+
+    Messages are queued in memory and written with one ordered bulk write
+    when `max_batch` messages are waiting, every `interval` seconds, when
+    `request_flush()` is called (end of a turn) and at interpreter exit.
+    A single writer thread keeps insertion order, so order within a
+    conversation is preserved. Messages not yet written are still visible
+    to `get_messages` through `pending()`.
+
+    A failed flush requeues what was not stored. When the failure leaves
+    unclear how much was stored, the retry first drops messages already in
+    MongoDB, so none is pushed twice. While MongoDB is unreachable, retries
+    back off exponentially up to `max_backoff` seconds and at most
+    `max_buffered` messages are held; `add` raises beyond that. A message
+    MongoDB itself rejects MEMORY_MAX_ATTEMPTS times goes to the
+    dead-letter file instead of blocking every later flush.
+    """
+
+    def __init__(self, max_batch: int = MEMORY_FLUSH_SIZE,
+                 interval: float = MEMORY_FLUSH_INTERVAL,
+                 max_backoff: float = MEMORY_MAX_BACKOFF,
+                 max_buffered: int = MEMORY_MAX_BUFFERED):
+        self.max_batch = max_batch
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.max_buffered = max_buffered
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self._queue: list[dict] = []
+        self._inflight: list[dict] = []
+        # Failed flushes per message id, and ids that may have been stored anyway
+        self._attempts: dict = {}
+        self._unconfirmed: set = set()
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._flush_requested = False
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        atexit.register(self.close)
+
+    def add(self, docs: list[dict]):
+        with self._cond:
+            if len(self._queue) + len(docs) > self.max_buffered:
+                raise RuntimeError(
+                    f"{len(self._queue)} chat messages are waiting for MongoDB; "
+                    "refusing to buffer more until it is reachable again")
+            self._queue.extend(docs)
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(
+                    target=self._run, name="message-writer", daemon=True)
+                self._thread.start()
+            if len(self._queue) >= self.max_batch:
+                self._cond.notify()
+
+    def pending(self, conversation_id: str) -> list[dict]:
+        """Messages of a conversation that are not in MongoDB yet, oldest first."""
+        with self._cond:
+            return [d for d in self._inflight + self._queue
+                    if d.get("conversation_id") == conversation_id]
+
+    def request_flush(self):
+        """Ask the writer thread to flush now without waiting for it."""
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify()
+
+    def flush(self):
+        """Write everything queued so far, blocking until it is stored."""
+        with self._write_lock:
+            with self._cond:
+                batch, self._queue = self._queue, []
+                self._inflight = batch
+            if not batch:
+                return
+            try:
+                unconfirmed = [d for d in batch if d["id"] in self._unconfirmed]
+                if unconfirmed:
+                    stored = _stored_message_ids(unconfirmed)
+                    self._forget(stored)
+                    batch = [d for d in batch if d["id"] not in stored]
+                _write_messages(batch)
+            except Exception as e:
+                self._requeue(batch, e)
+                raise
+            else:
+                self._forget(d["id"] for d in batch)
+                self._backoff = 0.0
+            finally:
+                with self._cond:
+                    self._inflight = []
+
+    def _forget(self, ids):
+        for message_id in ids:
+            self._attempts.pop(message_id, None)
+            self._unconfirmed.discard(message_id)
+
+    def _requeue(self, batch: list[dict], error: Exception):
+        """Put the messages of a failed flush back at the head of the queue, in order."""
+        written = getattr(error, "written", None)
+        rejected_id = getattr(error, "rejected_id", None)
+        if written is None:
+            # Any prefix of the ordered write may have been applied
+            self._unconfirmed.update(d["id"] for d in batch)
+            written = 0
+        self._forget(d["id"] for d in batch[:written])
+        failed = batch[written:]
+        if rejected_id is None:
+            # MongoDB could not be reached; no message is at fault, so wait and retry all
+            self._backoff = min(max(self._backoff * 2, self.interval), self.max_backoff)
+            self._retry_at = time.monotonic() + self._backoff
+            print(f"Failed to persist {len(failed)} messages, retrying in "
+                  f"{self._backoff:.1f}s: {error}")
+        else:
+            self._backoff = 0.0
+            self._attempts[rejected_id] = self._attempts.get(rejected_id, 0) + 1
+            print(f"Failed to persist {len(failed)} messages: {error}")
+            if self._attempts[rejected_id] >= MEMORY_MAX_ATTEMPTS:
+                _dead_letter([d for d in failed if d["id"] == rejected_id])
+                self._forget([rejected_id])
+                failed = [d for d in failed if d["id"] != rejected_id]
+        with self._cond:
+            self._queue = failed + self._queue
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    delay = self._retry_at - time.monotonic()
+                    if self._backoff and delay > 0:
+                        # Backing off after a failed flush, even if a flush was requested
+                        self._cond.wait(timeout=delay)
+                        continue
+                    if not (self._flush_requested or len(self._queue) >= self.max_batch):
+                        self._cond.wait(timeout=self.interval)
+                    break
+                self._flush_requested = False
+                closed = self._closed
+            try:
+                self.flush()
+            except Exception:
+                pass  # already logged; retried on the next tick
+            if closed:
+                return
+
+    def close(self):
+        """Stop the writer thread and flush synchronously (called at exit)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+        try:
+            self.flush()
+        except Exception:
+            pass  # already logged; nothing left to retry with
+
+
+message_buffer = MessageBuffer() if MEMORY_WRITE_BEHIND else None
+
+
 # --- Memory functions ---
-def add_messages(messages: list[dict]):
-    """Add messages to MongoDB collection."""
-    docs = [add_metadata(m) for m in messages]
-    if docs:
-        messages_collection.insert_many(docs)
+def add_messages(messages: list[dict], conversation_id: str = DEFAULT_CONVERSATION_ID):
+    """Add messages of one conversation to MongoDB collection.
 
+    With MEMORY_WRITE_BEHIND enabled the write is buffered and returns
+    immediately; see MessageBuffer.
+    """
+    docs = [add_metadata({**m, "conversation_id": conversation_id})
+            for m in messages]
+    if not docs:
+        return
+    if message_buffer is not None:
+        message_buffer.add(docs)
+    else:
+        _write_messages(docs)
 
-def get_messages() -> list[dict]:
-    """Return all messages without _id."""
-    docs = list(messages_collection.find({}).sort("created_at", 1))
-    return [remove_metadata(d) for d in docs]
 
+def request_flush():
+    """Signal the end of a turn so buffered messages are written promptly."""
+    if message_buffer is not None:
+        message_buffer.request_flush()
 
-def save_tool_response(tool_call_id: str, tool_response: str):
-    """Add a tool message to the DB with tool_call_id."""
-    msg = {
+
+def flush_messages():
+    """Write all buffered messages now (e.g. before shutdown)."""
+    if message_buffer is not None:
+        message_buffer.flush()
+
+
+def _buffered_history(conversation_id: str, roles: Sequence[str]) -> list[dict]:
+    """Buffered (not yet stored) messages of a conversation, newest first."""
+    buffered = message_buffer.pending(
+        conversation_id) if message_buffer is not None else []
+    return [{"id": d.get("id"), "role": d.get("role"), "content": d.get("content"),
+             "created_at": d.get("created_at")}
+            for d in reversed(buffered) if not roles or d.get("role") in roles]
+
+
+def _history_window(buffered: list[dict], buckets, roles: Sequence[str],
+                    limit: int, max_tokens: int) -> list[dict]:
+    """Merge buffered and stored messages (both newest first) into the history window."""
+    buffered_ids = {d["id"] for d in buffered}
+
+    def _stored():
+        for bucket in buckets:
+            for msg in reversed(bucket.get("messages") or []):
+                if msg.get("id") in buffered_ids:
+                    continue
+                if roles and msg.get("role") not in roles:
+                    continue
+                yield msg
+
+    docs: list[dict] = []
+    budget = max_tokens
+    for doc in itertools.chain(buffered, _stored()):
+        if limit and len(docs) >= limit:
+            break
+        if max_tokens:
+            budget -= estimate_tokens(doc.get("content"))
+            if budget < 0 and docs:
+                break
+        docs.append(doc)
+    docs.reverse()
+    return docs
+
+
+def _bucket_cursor(collection, conversation_id: str, limit: int):
+    """Buckets of a conversation, newest first.
+
+    Not limited: buckets may be partly filled, so callers read until they
+    have `limit` messages. The first batch covers `limit` when buckets are
+    full, so one round trip is usually enough.
+    """
+    from pymongo import DESCENDING
+
+    cursor = collection.find(
+        {"conversation_id": conversation_id}, HISTORY_PROJECTION
+    ).sort("start", DESCENDING)
+    if limit:
+        # The newest bucket may be nearly empty, hence the extra one
+        cursor = cursor.batch_size(limit // HISTORY_BUCKET_SIZE + 2)
+    return cursor
+
+
+def get_messages(
+    conversation_id: str = DEFAULT_CONVERSATION_ID,
+    limit: int = HISTORY_MAX_MESSAGES,
+    max_tokens: int = HISTORY_MAX_TOKENS,
+    roles: Sequence[str] = ("user", "assistant"),
+) -> list[dict]:
+    """Return the most recent messages of a conversation, oldest first.
+
+    Only the newest buckets needed to cover `limit` messages are read, and
+    when `max_tokens` is set, older messages beyond that budget are dropped.
+    Only `id`, `role`, `content` and `created_at` are fetched. Messages still in the
+    write-behind buffer are included.
+    """
+    ensure_indexes()
+    # Buffered messages are newer than anything already stored. They are read
+    # first; a message flushed meanwhile is then skipped by id.
+    buffered = _buffered_history(conversation_id, roles)
+    cursor = _bucket_cursor(get_collection(CONVERSATIONS), conversation_id, limit)
+    return _history_window(buffered, cursor, roles, limit, max_tokens)
+
+
+async def aget_messages(
+    conversation_id: str = DEFAULT_CONVERSATION_ID,
+    limit: int = HISTORY_MAX_MESSAGES,
+    max_tokens: int = HISTORY_MAX_TOKENS,
+    roles: Sequence[str] = ("user", "assistant"),
+) -> list[dict]:
+    """Async version of get_messages, reading through the async Mongo client."""
+    if not _indexes_ready:
+        await asyncio.to_thread(ensure_indexes)
+    buffered = _buffered_history(conversation_id, roles)
+    buffered_ids = {d["id"] for d in buffered}
+    buckets = []
+    found = len(buffered)
+    async for bucket in _bucket_cursor(get_async_db()[CONVERSATIONS], conversation_id, limit):
+        buckets.append(bucket)
+        found += sum(1 for msg in bucket.get("messages") or []
+                     if msg.get("id") not in buffered_ids
+                     and (not roles or msg.get("role") in roles))
+        if limit and found >= limit:
+            break
+    return _history_window(buffered, buckets, roles, limit, max_tokens)
+
+
+def has_history(conversation_id: str = DEFAULT_CONVERSATION_ID) -> bool:
+    """Whether the conversation already holds a user or assistant message."""
+    return bool(get_messages(conversation_id, limit=1, max_tokens=0))
+
+
+async def ahas_history(conversation_id: str = DEFAULT_CONVERSATION_ID) -> bool:
+    """Async version of has_history."""
+    return bool(await aget_messages(conversation_id, limit=1, max_tokens=0))
+
+
+async def aadd_messages(messages: list[dict], conversation_id: str = DEFAULT_CONVERSATION_ID):
+    """Async add_messages; only leaves the event loop when writes are synchronous."""
+    if message_buffer is not None:
+        add_messages(messages, conversation_id=conversation_id)
+    else:
+        await asyncio.to_thread(add_messages, messages, conversation_id)
+
+
+def _tool_message(tool_call_id: str, tool_response: str) -> dict:
+    return {
         "role": "tool",
         "content": tool_response,
         "tool_call_id": tool_call_id,
     }
-    add_messages([msg])
+
+
+def save_tool_response(tool_call_id: str, tool_response: str,
+                       conversation_id: str = DEFAULT_CONVERSATION_ID):
+    """Add a tool message to the DB with tool_call_id."""
+    add_messages([_tool_message(tool_call_id, tool_response)],
+                 conversation_id=conversation_id)
+
+
+async def asave_tool_response(tool_call_id: str, tool_response: str,
+                              conversation_id: str = DEFAULT_CONVERSATION_ID):
+    """Async version of save_tool_response."""
+    await aadd_messages([_tool_message(tool_call_id, tool_response)],
+                        conversation_id=conversation_id)
+
+
+def get_summary(conversation_id: str = DEFAULT_CONVERSATION_ID) -> Optional[dict]:
+    """Return the rolling summary of a conversation, or None if there is none yet.
+
+    The document holds `summary`, plus `covered_id` and `covered_at` of the
+    newest message folded into it.
+    """
+    return get_collection(SUMMARIES).find_one({"_id": conversation_id})
+
+
+async def aget_summary(conversation_id: str = DEFAULT_CONVERSATION_ID) -> Optional[dict]:
+    """Async version of get_summary."""
+    return await get_async_db()[SUMMARIES].find_one({"_id": conversation_id})
+
+
+def _summary_update(conversation_id: str, summary: str, covered_id: str, covered_at):
+    # Only move forward: a slower concurrent turn must not replace a newer summary
+    query = {"_id": conversation_id,
+             "$or": [{"covered_at": {"$lt": covered_at}},
+                     {"covered_at": {"$exists": False}}]}
+    update = {"$set": {"summary": summary, "covered_id": covered_id,
+                       "covered_at": covered_at,
+                       "updated_at": datetime.now(timezone.utc)}}
+    return query, update
+
+
+def save_summary(conversation_id: str, summary: str, covered_id: str, covered_at):
+    """Store a conversation's rolling summary, unless a newer one is already stored."""
+    from pymongo.errors import DuplicateKeyError
+
+    try:
+        get_collection(SUMMARIES).update_one(
+            *_summary_update(conversation_id, summary, covered_id, covered_at), upsert=True)
+    except DuplicateKeyError:
+        pass  # the stored summary already covers more messages
+
+
+async def asave_summary(conversation_id: str, summary: str, covered_id: str, covered_at):
+    """Async version of save_summary."""
+    from pymongo.errors import DuplicateKeyError
+
+    try:
+        await get_async_db()[SUMMARIES].update_one(
+            *_summary_update(conversation_id, summary, covered_id, covered_at), upsert=True)
+    except DuplicateKeyError:
+        pass
+
+
+def migrate_flat_messages(batch_size: int = 500) -> int:
+    """Move messages from the flat `messages` collection into conversation buckets.
+
+    Messages without a conversation id go to the default conversation. The
+    flat collection is renamed to `messages_flat_backup` afterwards, so the
+    migration cannot run twice.
+    """
+    from pymongo import ASCENDING
+
+    flush_messages()
+    messages_collection = get_collection(MESSAGES)
+    migrated = 0
+    batch: list[dict] = []
+    cursor = messages_collection.find({}).sort(
+        [("conversation_id", ASCENDING), ("created_at", ASCENDING)])
+    for doc in cursor:
+        created_at = doc.get("created_at") or datetime.now(timezone.utc)
+        batch.append({
+            "id": doc.get("id") or str(uuid4()),
+            "conversation_id": doc.get("conversation_id") or DEFAULT_CONVERSATION_ID,
+            "role": doc.get("role"),
+            "content": doc.get("content"),
+            "created_at": created_at,
+            **{k: doc.get(k) for k in ("tool_calls", "tool_call_id", "refusal", "reasoning")},
+        })
+        if len(batch) >= batch_size:
+            _write_messages(batch)
+            migrated += len(batch)
+            batch = []
+    if batch:
+        _write_messages(batch)
+        migrated += len(batch)
+    if migrated:
+        messages_collection.rename("messages_flat_backup")
+    return migrated
 
 
 # --- Optional testing ---
 if __name__ == "__main__":
-    add_messages([{"role": "user", "content": "Hello"}])
-    save_tool_response("12345", "Tool response example")
-    all_msgs = get_messages()
-    print(all_msgs)
+    import sys
+
+    if "--migrate" in sys.argv:
+        print(f"Migrated {migrate_flat_messages()} messages into conversation buckets")
+    else:
+        add_messages([{"role": "user", "content": "Hello"}])
+        save_tool_response("12345", "Tool response example")
+        all_msgs = get_messages(roles=())
+        print(all_msgs)
@@ -0,0 +1,242 @@
+"""Per-stage timing spans for chat turns and ingest.
+
+    with trace("turn", on_event=on_event):
+        with span("llm", step=0) as s:
+            ...
+            s.set(output_tokens=42)
+
+Every finished span is
+- added to in-process metrics: a rolling window per stage for p50/p95
+  (`stage_stats`) and cumulative Prometheus histograms (`prometheus_text`);
+- sent to the trace's `on_event` as a `span` event (TRACE_EVENTS=1);
+- appended to TRACE_PATH as one JSON line, when set.
+
+The active trace and parent span live in context variables, so spans
+opened in asyncio tasks spawned by the turn belong to it. Worker threads
+need the caller's context copied (as ingest does for its batches);
+otherwise their spans are recorded without a trace.
+"""
+
+import atexit
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Callable, Iterator, Optional
+
+from src.config.env import TRACE_EVENTS, TRACE_PATH, TRACE_WINDOW
+
+# Upper bounds (seconds) of the Prometheus latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = "toolrec"
+# Numeric attributes that label a span rather than count something
+LABEL_ATTRS = frozenset({"step"})
+
+
+class Span:
+    """A timed stage; `attrs` holds counts and sizes set while it runs."""
+
+    def __init__(self, name: str, trace_id: Optional[str], parent: Optional[str], attrs: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.parent = parent
+        self.attrs = attrs
+        self.error: Optional[str] = None
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self.seconds = 0.0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> dict:
+        record = {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "parent": self.parent,
+            "start": self.started_at.isoformat(),
+            "ms": round(self.seconds * 1000, 3),
+            "attrs": self.attrs,
+        }
+        if self.error:
+            record["error"] = self.error
+        return record
+
+
+class _Trace:
+    def __init__(self, on_event: Optional[Callable[[dict], None]]):
+        self.trace_id = uuid.uuid4().hex
+        self.on_event = on_event
+
+
+_current_trace: ContextVar[Optional[_Trace]] = ContextVar("trace", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("span", default=None)
+
+
+class _StageMetrics:
+    def __init__(self, window: int):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.recent: deque = deque(maxlen=window)
+        # Cumulative numeric span attributes (tokens, hits, bytes...)
+        self.attr_totals: dict = {}
+
+
+_metrics: dict = {}
+_metrics_lock = threading.Lock()
+_trace_file = None
+_trace_file_lock = threading.Lock()
+
+
+def _record(span: Span):
+    with _metrics_lock:
+        stage = _metrics.get(span.name)
+        if stage is None:
+            stage = _metrics[span.name] = _StageMetrics(TRACE_WINDOW)
+        stage.count += 1
+        stage.total += span.seconds
+        stage.errors += span.error is not None
+        stage.recent.append(span.seconds)
+        for i, bound in enumerate(BUCKETS):
+            if span.seconds <= bound:
+                stage.buckets[i] += 1
+        for key, value in span.attrs.items():
+            if key not in LABEL_ATTRS and isinstance(value, (int, float)) \
+                    and not isinstance(value, bool):
+                stage.attr_totals[key] = stage.attr_totals.get(key, 0) + value
+
+
+def _write(record: dict):
+    global _trace_file
+    with _trace_file_lock:
+        if _trace_file is None:
+            _trace_file = open(TRACE_PATH, "a", encoding="utf-8")
+        _trace_file.write(json.dumps(record, default=str) + "\n")
+
+
+def _close_trace_file():
+    global _trace_file
+    with _trace_file_lock:
+        if _trace_file is not None:
+            _trace_file.close()
+            _trace_file = None
+
+
+atexit.register(_close_trace_file)
+
+
+def _finish(span: Span, trace: Optional[_Trace]):
+    _record(span)
+    if TRACE_PATH:
+        try:
+            _write(span.to_dict())
+        except OSError as e:
+            print(f"Trace write failed: {e}")
+    if TRACE_EVENTS and trace is not None and trace.on_event is not None:
+        try:
+            trace.on_event({"type": "span", **span.to_dict()})
+        except Exception:
+            pass  # a failing callback must never break the turn
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Span]:
+    """Time the enclosed block as stage `name`; exceptions are recorded and re-raised."""
+    trace = _current_trace.get()
+    current = Span(name, trace.trace_id if trace else None, _current_span.get(), attrs)
+    token = _current_span.set(name)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.seconds = time.perf_counter() - current._started
+        _current_span.reset(token)
+        _finish(current, trace)
+
+
+@contextmanager
+def trace(name: str, on_event: Optional[Callable[[dict], None]] = None,
+          **attrs) -> Iterator[Span]:
+    """Start a trace whose root span is `name`; spans opened inside belong to it."""
+    token = _current_trace.set(_Trace(on_event))
+    try:
+        with span(name, **attrs) as root:
+            yield root
+    finally:
+        _current_trace.reset(token)
+
+
+def _percentile(ordered: list, q: float) -> float:
+    pos = (len(ordered) - 1) * q
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def stage_stats() -> dict:
+    """Per stage: count, errors and p50/p95/mean (ms) over the last TRACE_WINDOW spans."""
+    with _metrics_lock:
+        snapshot = {name: (m.count, m.errors, sorted(m.recent), dict(m.attr_totals))
+                    for name, m in _metrics.items()}
+    stats = {}
+    for name, (count, errors, recent, attr_totals) in sorted(snapshot.items()):
+        if not recent:
+            continue
+        stats[name] = {
+            "count": count,
+            "errors": errors,
+            "p50_ms": round(_percentile(recent, 0.50) * 1000, 3),
+            "p95_ms": round(_percentile(recent, 0.95) * 1000, 3),
+            "mean_ms": round(sum(recent) / len(recent) * 1000, 3),
+            "totals": attr_totals,
+        }
+    return stats
+
+
+def _metric_name(attr: str) -> str:
+    safe = "".join(c if c.isalnum() else "_" for c in attr.lower())
+    return f"{METRIC_PREFIX}_stage_{safe}_total"
+
+
+def prometheus_text() -> str:
+    """All stage metrics in the Prometheus text exposition format."""
+    seconds = f"{METRIC_PREFIX}_stage_seconds"
+    errors = f"{METRIC_PREFIX}_stage_errors_total"
+    lines = [
+        f"# HELP {seconds} Duration of chat and ingest stages.",
+        f"# TYPE {seconds} histogram",
+    ]
+    with _metrics_lock:
+        stages = [(name, m.count, m.errors, m.total, list(m.buckets), dict(m.attr_totals))
+                  for name, m in sorted(_metrics.items())]
+    attr_lines: dict = {}
+    for name, count, _, total, buckets, attr_totals in stages:
+        for bound, bucket_count in zip(BUCKETS, buckets):
+            lines.append(f'{seconds}_bucket{{stage="{name}",le="{bound}"}} {bucket_count}')
+        lines.append(f'{seconds}_bucket{{stage="{name}",le="+Inf"}} {count}')
+        lines.append(f'{seconds}_sum{{stage="{name}"}} {total:.6f}')
+        lines.append(f'{seconds}_count{{stage="{name}"}} {count}')
+        for attr, value in attr_totals.items():
+            attr_lines.setdefault(_metric_name(attr), []).append(
+                f'{_metric_name(attr)}{{stage="{name}"}} {value}')
+    lines += [f"# HELP {errors} Stages that raised an exception.",
+              f"# TYPE {errors} counter"]
+    lines += [f'{errors}{{stage="{name}"}} {stage_errors}'
+              for name, _, stage_errors, _, _, _ in stages]
+    for metric, metric_lines in sorted(attr_lines.items()):
+        lines += [f"# TYPE {metric} counter", *metric_lines]
+    return "\n".join(lines) + "\n"
+
+
+def reset_metrics():
+    """Forget all recorded stage metrics."""
+    with _metrics_lock:
+        _metrics.clear()
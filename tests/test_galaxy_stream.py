@@ -0,0 +1,30 @@
+import pytest
+
+from src.lib.galaxy import _iter_json_array
+
+
+def _split(text: str, size: int) -> list:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 64])
+def test_yields_every_element_however_the_text_is_split(size):
+    text = '[{"a": "x]\\"{"}, [1, [2]], "s,]", 3.5, true, null]'
+    assert list(_iter_json_array(_split(text, size))) == [
+        {"a": 'x]"{'}, [1, [2]], "s,]", 3.5, True, None]
+
+
+@pytest.mark.parametrize("text", [
+    '[{"a": 1}',        # cut after an element
+    '[{"a": 1}, ',      # cut after a comma
+    '[{"a": 1}, {"b"',  # cut inside an element
+    '',
+])
+def test_truncated_stream_raises(text):
+    with pytest.raises(ValueError, match="Truncated"):
+        list(_iter_json_array(_split(text, 4)))
+
+
+def test_rejects_non_array():
+    with pytest.raises(ValueError, match="Expected a JSON array"):
+        list(_iter_json_array(['{"a": 1}']))